@@ -0,0 +1,27 @@
+import time
+from django.core.management.base import BaseCommand
+
+from cloud_providers.services.costs import COST_PROVIDERS, ingest_costs
+
+
+class Command(BaseCommand):
+    help = "Load the daily costs the providers have not finalised yet into the Cost table"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--provider', action='append', choices=list(COST_PROVIDERS),
+                            help="Provider to ingest, can be repeated (default: all)")
+        parser.add_argument('--interval', type=int, default=0,
+                            help="Keep running and ingest again every INTERVAL seconds")
+
+    def handle(self, *args, **options):
+        providers = options['provider'] or list(COST_PROVIDERS)
+        while True:
+            started = time.monotonic()
+            for provider, entry in ingest_costs(providers).items():
+                if 'error' in entry:
+                    self.stdout.write(f"{provider}: failed ({entry['error']})")
+                else:
+                    self.stdout.write(f"{provider}: {entry['lines']} lines from {entry['from']} to {entry['to']}")
+            if not options['interval']:
+                return
+            time.sleep(max(options['interval'] - (time.monotonic() - started), 0))
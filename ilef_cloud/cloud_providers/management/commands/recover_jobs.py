@@ -0,0 +1,17 @@
+from concurrent.futures import wait
+from django.core.management.base import BaseCommand
+
+from cloud_providers.services.jobs import recover_jobs
+
+
+class Command(BaseCommand):
+    help = "Fail the deployment jobs a restart left queued or running, run on startup before serving requests"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requeue', action='store_true',
+                            help="Run the queued jobs again (and wait for them) instead of failing them")
+
+    def handle(self, *args, **options):
+        recovered = recover_jobs(requeue=options['requeue'])
+        self.stdout.write(f"{recovered['failed']} jobs failed, {len(recovered['requeued'])} requeued")
+        wait(recovered['requeued'])
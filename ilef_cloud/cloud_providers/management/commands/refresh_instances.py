@@ -0,0 +1,27 @@
+import time
+from django.core.management.base import BaseCommand
+
+from cloud_providers.services.instance_inventory import refresh_instances
+from cloud_providers.services.manager_registry import MANAGER_CLASSES
+
+
+class Command(BaseCommand):
+    help = "Refresh the instance inventory from the cloud providers"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--provider', action='append', choices=list(MANAGER_CLASSES),
+                            help="Provider to refresh, can be repeated (default: all)")
+        parser.add_argument('--interval', type=int, default=0,
+                            help="Keep running and refresh again every INTERVAL seconds")
+
+    def handle(self, *args, **options):
+        providers = options['provider'] or list(MANAGER_CLASSES)
+        while True:
+            started = time.monotonic()
+            results, report = refresh_instances(providers)
+            for provider, entry in report.items():
+                count = len(results.get(provider, []))
+                self.stdout.write(f"{provider}: {entry['status']} ({count} instances, {entry['latency_ms']}ms)")
+            if not options['interval']:
+                return
+            time.sleep(max(options['interval'] - (time.monotonic() - started), 0))
@@ -0,0 +1,25 @@
+import time
+from django.core.management.base import BaseCommand
+
+from cloud_providers.services.object_inventory import sync_objects
+from cloud_providers.services.object_listing import STORAGE_PROVIDERS
+
+
+class Command(BaseCommand):
+    help = "Refresh the local object inventory from the cloud providers"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--provider', action='append', choices=STORAGE_PROVIDERS,
+                            help="Provider to sync, can be repeated (default: all)")
+        parser.add_argument('--interval', type=int, default=0,
+                            help="Keep running and sync again every INTERVAL seconds")
+
+    def handle(self, *args, **options):
+        while True:
+            started = time.monotonic()
+            report = sync_objects(options['provider'])
+            for bucket, stats in report.items():
+                self.stdout.write(f"{bucket}: {stats}")
+            if not options['interval']:
+                return
+            time.sleep(max(options['interval'] - (time.monotonic() - started), 0))
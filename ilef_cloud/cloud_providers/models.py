@@ -12,11 +12,26 @@ class CloudProvider(models.Model):
     api_key = models.CharField(max_length=255)
     api_secret = models.CharField(max_length=255)
     region = models.CharField(max_length=100)
+    instances_synced_at = models.DateTimeField(null=True, blank=True)  # last successful instance inventory refresh
+    costs_ingested_at = models.DateTimeField(null=True, blank=True)  # last successful cost ingestion
+    costs_ingested_from = models.DateField(null=True, blank=True)  # first day of the stored costs
+    objects_synced_at = models.DateTimeField(null=True, blank=True)  # last sync of every bucket without an error
 
     def __str__(self):
         return self.get_name_display()
 
 
+class CostQuerySet(models.QuerySet):
+    def with_total_cost(self, start_date=None, end_date=None):
+        # Sums the costs of every row in the listing query itself, read back by total_cost()
+        dates = models.Q()
+        if start_date:
+            dates &= models.Q(cost__date__gte=start_date)
+        if end_date:
+            dates &= models.Q(cost__date__lte=end_date)
+        return self.annotate(cost_total=models.Sum('cost__amount', filter=dates or None))
+
+
 class Instance(models.Model):
     STATUS_CHOICES = [
         ('running', 'Running'),
@@ -26,48 +41,146 @@ class Instance(models.Model):
     ]
 
     provider = models.ForeignKey(CloudProvider, on_delete=models.CASCADE)
-    instance_id = models.CharField(max_length=100, unique=True)
+    instance_id = models.CharField(max_length=255, unique=True)
+    name = models.CharField(max_length=255, blank=True)
     instance_type = models.CharField(max_length=100)
     status = models.CharField(max_length=50, choices=STATUS_CHOICES)
+    zone = models.CharField(max_length=255, blank=True)
     created_at = models.DateTimeField()
     updated_at = models.DateTimeField()
-    key_name = models.CharField(max_length=100)
+    key_name = models.CharField(max_length=100, blank=True)
     private_ip = models.GenericIPAddressField(null=True, blank=True)
     public_ip = models.GenericIPAddressField(null=True, blank=True)
+    synced_at = models.DateTimeField(null=True, blank=True)
+
+    objects = CostQuerySet.as_manager()
 
     def __str__(self):
         return f"{self.instance_id} ({self.get_provider_display()})"
 
     def total_cost(self):
+        if hasattr(self, 'cost_total'):
+            return self.cost_total
         return self.cost_set.aggregate(models.Sum('amount'))['amount__sum']
 
 
 class Cost(models.Model):
     provider = models.ForeignKey(CloudProvider, on_delete=models.CASCADE)
-    instance = models.ForeignKey(Instance, on_delete=models.CASCADE, null=True, blank=True)
+    instance = models.ForeignKey(Instance, on_delete=models.SET_NULL, null=True, blank=True)  # costs outlive terminated instances
+    storage = models.ForeignKey('Storage', on_delete=models.SET_NULL, null=True, blank=True)
     resource_type = models.CharField(max_length=100)  # e.g., 'instance', 'storage'
-    amount = models.DecimalField(max_digits=10, decimal_places=2)
+    service = models.CharField(max_length=255, blank=True)  # provider service name, e.g. 'Amazon Elastic Compute Cloud - Compute'
+    resource_id = models.CharField(max_length=1024, blank=True)  # provider resource id when the provider reports one
+    amount = models.DecimalField(max_digits=16, decimal_places=6)
     currency = models.CharField(max_length=10)
     date = models.DateField()
+    is_final = models.BooleanField(default=False)  # the provider will not revise this day any more
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['provider', 'date']),
+            models.Index(fields=['instance', 'date']),
+            models.Index(fields=['storage', 'date']),
+        ]
 
     def __str__(self):
         return f"{self.resource_type} cost on {self.date}"
 
 
+class CostDailyRollup(models.Model):
+    # Cost lines summed per day, maintained by the cost ingestion
+    provider = models.ForeignKey(CloudProvider, on_delete=models.CASCADE)
+    service = models.CharField(max_length=255, blank=True)
+    resource_type = models.CharField(max_length=100)
+    day = models.DateField()
+    amount = models.DecimalField(max_digits=16, decimal_places=6)
+    currency = models.CharField(max_length=10)
+    updated_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['provider', 'service', 'resource_type', 'day', 'currency'], name='unique_cost_daily_rollup')
+        ]
+        indexes = [models.Index(fields=['day'])]
+
+    def __str__(self):
+        return f"{self.provider_id} {self.service} on {self.day}: {self.amount} {self.currency}"
+
+
+class CostMonthlyRollup(models.Model):
+    # The daily rollup summed per month, `month` is the first day of the month
+    provider = models.ForeignKey(CloudProvider, on_delete=models.CASCADE)
+    service = models.CharField(max_length=255, blank=True)
+    resource_type = models.CharField(max_length=100)
+    month = models.DateField()
+    amount = models.DecimalField(max_digits=16, decimal_places=6)
+    currency = models.CharField(max_length=10)
+    updated_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['provider', 'service', 'resource_type', 'month', 'currency'], name='unique_cost_monthly_rollup')
+        ]
+        indexes = [models.Index(fields=['month'])]
+
+    def __str__(self):
+        return f"{self.provider_id} {self.service} in {self.month:%Y-%m}: {self.amount} {self.currency}"
+
+
 class Storage(models.Model):
     provider = models.ForeignKey(CloudProvider, on_delete=models.CASCADE)
-    storage_id = models.CharField(max_length=100, unique=True)
+    storage_id = models.CharField(max_length=100)
     storage_type = models.CharField(max_length=100)  # e.g., 'S3', 'Blob'
     created_at = models.DateTimeField()
     location = models.URLField()
+    synced_at = models.DateTimeField(null=True, blank=True)  # end of the last complete object sync
+    sync_started_at = models.DateTimeField(null=True, blank=True)
+    sync_cursor = models.CharField(max_length=1024, blank=True)  # last key stored by an unfinished sync
+
+    objects = CostQuerySet.as_manager()
+
+    class Meta:
+        # Bucket names are only unique within a provider
+        constraints = [models.UniqueConstraint(fields=['provider', 'storage_id'], name='unique_storage')]
 
     def __str__(self):
         return f"{self.storage_id} ({self.provider.name})"
 
     def total_cost(self):
+        if hasattr(self, 'cost_total'):
+            return self.cost_total
         return self.cost_set.aggregate(models.Sum('amount'))['amount__sum']
 
 
+class StorageObject(models.Model):
+    storage = models.ForeignKey(Storage, on_delete=models.CASCADE, related_name='storage_objects')
+    provider = models.CharField(max_length=50, choices=CloudProvider.PROVIDER_CHOICES)
+    bucket = models.CharField(max_length=255)
+    key = models.CharField(max_length=1024)  # "container/blob" on Azure
+    name = models.CharField(max_length=1024)  # object name, the key without the container on Azure
+    size = models.BigIntegerField(default=0)
+    etag = models.CharField(max_length=255, blank=True)
+    last_modified = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(null=True, blank=True)
+    seen_at = models.DateTimeField()  # last sync that found the object
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['provider', 'bucket', 'key'], name='unique_storage_object')
+        ]
+        indexes = [
+            models.Index(fields=['storage', 'seen_at']),
+            models.Index(fields=['last_modified']),
+            models.Index(fields=['size']),
+        ]
+
+    def __str__(self):
+        return f"{self.provider}://{self.bucket}/{self.key}"
+
+
 class KeyPair(models.Model):
     provider = models.ForeignKey(CloudProvider, on_delete=models.CASCADE)
     key_pair_id = models.CharField(max_length=100, unique=True)
@@ -78,3 +191,58 @@ class KeyPair(models.Model):
 
     def __str__(self):
         return f"{self.key_name} ({self.provider.name})"
+
+
+class DeploymentJob(models.Model):
+    STATE_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('succeeded', 'Succeeded'),
+        ('failed', 'Failed'),
+    ]
+
+    provider = models.CharField(max_length=50, choices=CloudProvider.PROVIDER_CHOICES)
+    server_name = models.CharField(max_length=100)
+    image = models.CharField(max_length=255)
+    batch_id = models.UUIDField(null=True, blank=True, db_index=True)  # set on the jobs of a multi-host deploy
+    parameters = models.JSONField(default=dict)
+    state = models.CharField(max_length=20, choices=STATE_CHOICES, default='queued')
+    step = models.CharField(max_length=100, blank=True)
+    timings = models.JSONField(default=dict)  # seconds spent in each step
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.server_name} ({self.provider}): {self.state}"
+
+
+class ImageInspection(models.Model):
+    image = models.CharField(max_length=255, unique=True)
+    digest = models.CharField(max_length=100, blank=True)
+    exposed_ports = models.JSONField(default=list)
+    inspected_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.image}@{self.digest}: {self.exposed_ports}"
+
+
+class ReadinessProbe(models.Model):
+    provider = models.CharField(max_length=50, choices=CloudProvider.PROVIDER_CHOICES, blank=True)
+    image = models.CharField(max_length=255, blank=True)  # OS image the server booted from
+    host = models.CharField(max_length=255)
+    ready = models.BooleanField(default=False)
+    tcp_attempts = models.PositiveIntegerField(default=0)
+    tcp_seconds = models.FloatField(null=True, blank=True)  # until the SSH port accepted a connection
+    ssh_attempts = models.PositiveIntegerField(default=0)
+    ssh_seconds = models.FloatField(null=True, blank=True)  # until the SSH login succeeded (or the wait gave up)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['provider', 'image'])]
+
+    def __str__(self):
+        return f"{self.host} ({self.provider}): {self.ssh_seconds}s"
@@ -1,5 +1,5 @@
 from rest_framework import serializers
-from .models import KeyPair, Storage
+from .models import DeploymentJob, KeyPair, Storage
 
 
 class KeyPairSerializer(serializers.ModelSerializer):
@@ -8,7 +8,25 @@ class KeyPairSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 
+class AnnotatedDecimalField(serializers.DecimalField):
+    # DRF leaves read-only fields out when their source is missing, a queryset without the annotation is a bug
+    def get_attribute(self, instance):
+        try:
+            return getattr(instance, self.source)
+        except AttributeError:
+            raise AttributeError(f"{type(instance).__name__} has no {self.source} annotation") from None
+
+
 class StorageSerializer(serializers.ModelSerializer):
+    # Needs Storage.objects.with_total_cost(), which sums the costs of the whole listing in one query
+    total_cost = AnnotatedDecimalField(source='cost_total', max_digits=16, decimal_places=6, read_only=True)
+
     class Meta:
         model = Storage
         fields = '__all__'
+
+
+class DeploymentJobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = DeploymentJob
+        fields = '__all__'
@@ -3,6 +3,9 @@ from django.conf import settings
 from django.utils.crypto import get_random_string
 from cloud_providers.services.shared import inspect_image
 from cloud_providers.services.base import BaseCloudManager, logger
+from cloud_providers.services.concurrency import map_bounded, read_parts
+from cloud_providers.services.operations import OperationFailed, operation_tracker
+import itertools
 import subprocess
 import os
 import yaml
@@ -18,7 +21,47 @@ AWS_STATUS_MAP = {
 }
 
 
+class EC2InstanceState:
+    # Polls instances until they reach `state` ('running' or 'status_ok'), every due instance in one describe call
+    max_batch = 100
+
+    def __init__(self, ec2, state):
+        self.ec2 = ec2
+        self.state = state
+        self.name = f"ec2 instance {state}"
+
+    def poll(self, instance_ids):
+        if self.state == 'running':
+            response = self.ec2.describe_instances(InstanceIds=instance_ids)
+            instances = {
+                instance['InstanceId']: instance
+                for reservation in response['Reservations'] for instance in reservation['Instances']
+            }
+            results = []
+            for instance_id in instance_ids:
+                instance = instances.get(instance_id)
+                state = instance['State']['Name'] if instance else None
+                if state == 'running':
+                    results.append((True, instance, None))
+                elif state in ('shutting-down', 'terminated', 'stopping', 'stopped'):
+                    results.append((True, None, OperationFailed(f"Instance {instance_id} is {state}")))
+                else:
+                    results.append((False, None, None))
+            return results
+
+        response = self.ec2.describe_instance_status(InstanceIds=instance_ids, IncludeAllInstances=True)
+        statuses = {status['InstanceId']: status for status in response['InstanceStatuses']}
+        results = []
+        for instance_id in instance_ids:
+            status = statuses.get(instance_id)
+            ok = bool(status) and status['InstanceStatus']['Status'] == 'ok' and status['SystemStatus']['Status'] == 'ok'
+            results.append((ok, status, None))
+        return results
+
+
 class AWSManager(BaseCloudManager):
+    provider = 'aws'
+
     def __init__(self):
         super().__init__(os_username='ubuntu')
         self.session = boto3.Session(
@@ -46,6 +89,8 @@ class AWSManager(BaseCloudManager):
                                                   aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
                                                   region_name=settings.AWS_REGION)
         self.eks_cluster_role_arn = settings.AWS_EKS_CLUSTER_ROLE_ARN
+        self.instance_running = EC2InstanceState(self.ec2, 'running')
+        self.instance_status_ok = EC2InstanceState(self.ec2, 'status_ok')
         self.eks_node_role_arn = settings.AWS_EKS_NODE_ROLE_ARN
 
     def get_kubeconfig(self, cluster_name):
@@ -193,8 +238,15 @@ class AWSManager(BaseCloudManager):
             nodeRole=self.eks_node_role_arn
         )
 
-        waiter = self.eks_client.get_waiter('nodegroup_active')
-        waiter.wait(clusterName=cluster_name, nodegroupName=nodegroup_name)
+        def nodegroup_active():
+            status = self.eks_client.describe_nodegroup(
+                clusterName=cluster_name, nodegroupName=nodegroup_name)['nodegroup']['status']
+            if status in ('CREATE_FAILED', 'DEGRADED'):
+                raise OperationFailed(f"Node group {nodegroup_name} is {status}")
+            return status == 'ACTIVE'
+
+        operation_tracker.wait_until(
+            nodegroup_active, description=f"node group {nodegroup_name}", max_interval=settings.CLUSTER_POLL_MAX_INTERVAL)
 
         return nodegroup
 
@@ -341,8 +393,65 @@ class AWSManager(BaseCloudManager):
             return {"message": "File downloaded successfully", "file_name": file_name}
         return method(Bucket=bucket_name, Key=object_name)
 
+    def upload_stream(self, file_obj, bucket_name, object_name):
+        part_size = settings.UPLOAD_PART_SIZE
+        parts = read_parts(file_obj, part_size)
+        first_part = next(parts, None)
+        if first_part is None or len(first_part[1]) < part_size:
+            # Fits in a single part: one PUT is cheaper than a multipart upload
+            self.s3.put_object(Bucket=bucket_name, Key=object_name, Body=first_part[1] if first_part else b'')
+            return {"bucket_name": bucket_name, "object_name": object_name}
+
+        upload_id = self.s3.create_multipart_upload(Bucket=bucket_name, Key=object_name)['UploadId']
+
+        def upload_part(part):
+            part_number, data = part
+            response = self.s3.upload_part(
+                Bucket=bucket_name, Key=object_name, UploadId=upload_id, PartNumber=part_number, Body=data)
+            return {'PartNumber': part_number, 'ETag': response['ETag']}
+
+        try:
+            uploaded_parts = map_bounded(upload_part, itertools.chain([first_part], parts))
+            self.s3.complete_multipart_upload(
+                Bucket=bucket_name, Key=object_name, UploadId=upload_id, MultipartUpload={'Parts': uploaded_parts})
+        except Exception:
+            # Don't leave orphan parts behind, S3 bills them until the upload is aborted
+            self.s3.abort_multipart_upload(Bucket=bucket_name, Key=object_name, UploadId=upload_id)
+            raise
+        return {"bucket_name": bucket_name, "object_name": object_name, "parts": len(uploaded_parts)}
+
+    def get_object_info(self, bucket_name, object_name):
+        response = self.s3.head_object(Bucket=bucket_name, Key=object_name)
+        return response['ContentLength'], response.get('ContentType')
+
+    def read_range(self, bucket_name, object_name, start, end):
+        response = self.s3.get_object(Bucket=bucket_name, Key=object_name, Range=f'bytes={start}-{end}')
+        return response['Body'].read()
+
     def list_objects(self, bucket_name):
-        return self._handle_response(self.s3.list_objects_v2(Bucket=bucket_name), 'Contents')
+        # list_objects_v2 returns at most 1000 keys per call
+        paginator = self.s3.get_paginator('list_objects_v2')
+        return [obj for page in paginator.paginate(Bucket=bucket_name) for obj in self._handle_response(page, 'Contents')]
+
+    def iter_objects(self, bucket_name, prefix=None, start_after=None):
+        # Yields (key, object) in key order, one page of keys in memory at a time
+        params = {'Bucket': bucket_name}
+        if prefix:
+            params['Prefix'] = prefix
+        if start_after:
+            params['StartAfter'] = start_after
+        for page in self.s3.get_paginator('list_objects_v2').paginate(**params):
+            for obj in self._handle_response(page, 'Contents'):
+                yield obj['Key'], {
+                    "id": obj['ETag'].strip('"'),
+                    "provider": "aws",
+                    "bucket": bucket_name,
+                    "name": obj['Key'],
+                    "size": obj['Size'],
+                    "etag": obj['ETag'].strip('"'),
+                    "last_modified": obj['LastModified'],
+                    "created_at": obj['LastModified']
+                }
 
     def generate_presigned_url(self, bucket_name, object_name, expiration=3600):
         return self.s3.generate_presigned_url(
@@ -374,33 +483,37 @@ class AWSManager(BaseCloudManager):
             IpPermissions=ip_permissions
         )
 
-    def create_docker_image_server(self, image_id, instance_name, instance_type, key_name, image, ssh_private_key, min_count=1, max_count=1):
+    def create_docker_image_server(self, image_id, instance_name, instance_type, key_name, image, ssh_private_key, min_count=1, max_count=1, ports=None, on_step=None):
         vpc_id = self.ec2.describe_vpcs()['Vpcs'][0]['VpcId']
         generated_code = get_random_string(3)
+        self.report_step(on_step, 'open_ports')
         security_group_id = self.create_security_group(
             f"{image}-{generated_code}-sg", f"Security group for {image} server #{generated_code}", vpc_id)
-        ports = inspect_image(image)
+        if ports is None:
+            ports = inspect_image(image)
         self.authorize_security_group_ingress(security_group_id, ports + [22, 80])
 
+        self.report_step(on_step, 'create_instance')
         response = self.create_instance(instance_name, instance_type, key_name, min_count, max_count, image_id, security_group_id)
         instance_id = response['Instances'][0]['InstanceId']
 
-        self.ec2.get_waiter('instance_running').wait(InstanceIds=[instance_id])
-        self.ec2.get_waiter('instance_status_ok').wait(InstanceIds=[instance_id])
+        instance = operation_tracker.wait(self.instance_running, instance_id, description=f"instance {instance_id} running")
+        operation_tracker.wait(self.instance_status_ok, instance_id, description=f"instance {instance_id} status checks")
+        ip_address = instance['PublicIpAddress']
 
-        instance_info = self.ec2.describe_instances(InstanceIds=[instance_id])
-        ip_address = instance_info['Reservations'][0]['Instances'][0]['PublicIpAddress']
-
-        self.wait_for_ssh(ip_address, ssh_private_key)
+        self.report_step(on_step, 'wait_for_ssh')
+        self.wait_for_ssh(ip_address, ssh_private_key, image=image_id or '')
+        self.report_step(on_step, 'install_docker')
         self.install_docker(ip_address, ssh_private_key)
 
+        self.report_step(on_step, 'run_container')
         container_name = f"{image}-container".replace('/', '-').replace(':', '-').replace(' ', '')
         port_mappings = ' '.join([f'-p 80:{port}' for port in ports])
         run_container_command = f'sudo docker run -d --name {container_name} {port_mappings} {image}'
         output, error = self.run_ssh_command(ip_address, run_container_command, ssh_private_key)
         if error:
             logger.error(f"Failed to start Docker container {container_name}: {error}")
-            list_containers_command = 'docker ps --format "{{.Names}}"'
+            list_containers_command = 'sudo docker ps --format "{{.Names}}"'
             output, error = self.run_ssh_command(ip_address, list_containers_command, ssh_private_key)
             if container_name in output:
                 logger.info(f"Docker container {container_name} is running despite the error.")
@@ -419,6 +532,31 @@ class AWSManager(BaseCloudManager):
         )
         return response['ResultsByTime']
 
+    def get_daily_costs(self, start_date, end_date):
+        # Daily unblended cost per service, `end_date` is exclusive like in Cost Explorer
+        kwargs = {
+            'TimePeriod': {'Start': start_date.isoformat(), 'End': end_date.isoformat()},
+            'Granularity': 'DAILY',
+            'Metrics': ['UnblendedCost'],
+            'GroupBy': [{'Type': 'DIMENSION', 'Key': 'SERVICE'}]
+        }
+        records = []
+        while True:
+            response = self.ce.get_cost_and_usage(**kwargs)
+            for result in response['ResultsByTime']:
+                for group in result['Groups']:
+                    metric = group['Metrics']['UnblendedCost']
+                    records.append({
+                        'date': result['TimePeriod']['Start'],
+                        'service': group['Keys'][0],
+                        'resource_id': '',
+                        'amount': metric['Amount'],
+                        'currency': metric['Unit']
+                    })
+            if not response.get('NextPageToken'):
+                return records
+            kwargs['NextPageToken'] = response['NextPageToken']
+
     def get_cost_by_service(self, start_date, end_date):
         response = self.ce.get_cost_and_usage(
             TimePeriod={'Start': start_date, 'End': end_date},
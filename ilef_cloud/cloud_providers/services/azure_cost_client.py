@@ -0,0 +1,80 @@
+import logging
+import random
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+MANAGEMENT_SCOPE = 'https://management.azure.com/.default'
+COST_QUERY_URL = ('https://management.azure.com/subscriptions/{subscription_id}'
+                  '/providers/Microsoft.CostManagement/query?api-version=2021-10-01')
+
+
+# Runs Cost Management queries over one pooled session with a bearer token that is reused until shortly before it
+# expires. Throttled (429) and failed (5xx) queries are retried after the delay Azure asks for, and the pages a
+# query is split into (properties.nextLink) are all read and merged.
+class AzureCostClient:
+    def __init__(self, credential, subscription_id, timeout=None, max_retries=None):
+        self.credential = credential
+        self.url = COST_QUERY_URL.format(subscription_id=subscription_id)
+        self.timeout = timeout or settings.AZURE_COST_API_TIMEOUT
+        self.max_retries = settings.AZURE_COST_API_MAX_RETRIES if max_retries is None else max_retries
+        self.session = requests.Session()
+        self.session.mount('https://', HTTPAdapter(pool_maxsize=settings.CLOUD_API_CONCURRENCY))
+        self._token = None
+        self._token_lock = threading.Lock()
+
+    def token(self):
+        with self._token_lock:
+            if self._token is None or self._token.expires_on - time.time() < settings.AZURE_TOKEN_REFRESH_MARGIN:
+                self._token = self.credential.get_token(MANAGEMENT_SCOPE)
+            return self._token.token
+
+    def _retry_delay(self, response, attempt):
+        # Cost Management sends x-ms-ratelimit-microsoft.costmanagement-{qpu,entity,tenant,client}-retry-after,
+        # other endpoints the standard Retry-After
+        delays = [
+            int(value) for name, value in response.headers.items()
+            if (name.lower() == 'retry-after' or (name.lower().startswith('x-ms-ratelimit') and name.lower().endswith('retry-after')))
+            and value.isdigit()
+        ]
+        if delays:
+            return min(max(delays) + random.uniform(0, 1), settings.AZURE_COST_API_MAX_BACKOFF)
+        backoff = settings.AZURE_COST_API_BACKOFF * 2 ** attempt
+        return min(backoff + random.uniform(0, backoff / 2), settings.AZURE_COST_API_MAX_BACKOFF)
+
+    def _post(self, url, payload):
+        # Queries only read data, so throttled and failed ones are safe to send again
+        for attempt in range(self.max_retries + 1):
+            response = self.session.post(
+                url, json=payload, timeout=self.timeout,
+                headers={'Authorization': f'Bearer {self.token()}', 'Content-Type': 'application/json'}
+            )
+            if response.status_code == 401 and attempt < self.max_retries:
+                # Revoked or rotated token, get a new one
+                with self._token_lock:
+                    self._token = None
+                continue
+            if (response.status_code == 429 or response.status_code >= 500) and attempt < self.max_retries:
+                delay = self._retry_delay(response, attempt)
+                logger.warning(f"[azure_costs] query returned {response.status_code}, retrying in {delay:.1f}s")
+                time.sleep(delay)
+                continue
+            break
+        response.raise_for_status()
+        return response.json()
+
+    def query(self, payload):
+        # Returns the first page's response with the rows of every page
+        result = self._post(self.url, payload)
+        properties = result['properties']
+        next_link = properties.get('nextLink')
+        while next_link:
+            page = self._post(next_link, payload)['properties']
+            properties['rows'].extend(page['rows'])
+            next_link = page.get('nextLink')
+        properties['nextLink'] = None
+        return result
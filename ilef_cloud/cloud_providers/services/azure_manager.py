@@ -1,7 +1,7 @@
 from kubernetes import client, config
 import logging
-from azure.mgmt.compute.models import InstanceViewTypes
 from azure.identity import ClientSecretCredential, DefaultAzureCredential
+from azure.mgmt.core.polling.arm_polling import ARMPolling
 from azure.mgmt.compute import ComputeManagementClient
 from azure.mgmt.storage import StorageManagementClient
 from azure.mgmt.resource import ResourceManagementClient
@@ -9,19 +9,23 @@ from azure.mgmt.network import NetworkManagementClient
 from azure.mgmt.network.models import NetworkInterfaceIPConfiguration
 from azure.mgmt.storage.models import StorageAccountCreateParameters, Sku, Kind
 from azure.mgmt.compute.models import OSProfile, LinuxConfiguration, SshConfiguration, SshPublicKey
-from azure.storage.blob import BlobServiceClient, generate_blob_sas, BlobSasPermissions
+from azure.storage.blob import BlobServiceClient, BlobBlock, generate_blob_sas, BlobSasPermissions
 from datetime import datetime, timedelta
-import requests
 import time
 import yaml
 import paramiko
 from django.conf import settings
 from .base import BaseCloudManager, logger
 from cloud_providers.services.shared import inspect_image
+from cloud_providers.services.concurrency import iter_prefetched, map_bounded, map_concurrently, read_parts
+from cloud_providers.services.operations import operation_tracker
+from cloud_providers.services.azure_cost_client import AzureCostClient
 from azure.mgmt.containerservice import ContainerServiceClient
 from azure.mgmt.containerservice.models import ManagedCluster, ManagedClusterAgentPoolProfile, ContainerServiceNetworkProfile
 from azure.mgmt.containerservice.models import ManagedCluster, ManagedClusterAgentPoolProfile, ManagedClusterServicePrincipalProfile, ContainerServiceNetworkProfile
+import base64
 import subprocess
+import threading
 import os
 
 AZURE_STATUS_MAP = {
@@ -35,7 +39,75 @@ AZURE_STATUS_MAP = {
 }
 
 
+class TrackedPolling(ARMPolling):
+    # ARM polling driven by the operation tracker instead of a thread per operation: run(), what the SDK poller's
+    # thread calls, returns at once, the tracker calls update_status() once per round and complete() when finished
+    def run(self):
+        pass
+
+    def complete(self):
+        # The status is final, this only raises for a failed operation or fetches the final resource
+        super().run()
+        return self.resource()
+
+
+def tracked_polling(final_state_via=None):
+    # Passed as polling= to the begin_* calls. The network API reads the final resource of some operations from the
+    # async operation or location header, given here as its SDK pollers do
+    return TrackedPolling(lro_options={'final-state-via': final_state_via} if final_state_via else None)
+
+
+class AzurePollers:
+    # One status request per long-running operation started with tracked_polling()
+    name = 'azure operation'
+    max_batch = 20
+
+    def poll(self, pollers):
+        results = []
+        for poller in pollers:
+            polling = poller.polling_method()
+            try:
+                if not polling.finished():
+                    polling.update_status()
+            except Exception as e:
+                logger.info(f"[operations] azure operation status check failed, will retry: {e}")
+                results.append((False, None, None))
+                continue
+            if not polling.finished():
+                results.append((False, None, None))
+                continue
+            try:
+                results.append((True, polling.complete(), None))
+            except Exception as e:
+                results.append((True, None, e))
+        return results
+
+
+AZURE_POLLERS = AzurePollers()
+
+
+def parse_cost_rows(properties):
+    # Turns the query API's column/row matrix into cost records, the cost column is named after the aggregation
+    # or the metric depending on the API version
+    columns = [column['name'] for column in properties['columns']]
+    cost_column = next((name for name in ('totalCost', 'Cost', 'PreTaxCost', 'CostUSD') if name in columns), columns[0])
+    index = {name: columns.index(name) for name in columns}
+    records = []
+    for row in properties['rows']:
+        usage_date = str(row[index['UsageDate']])
+        records.append({
+            'date': f"{usage_date[:4]}-{usage_date[4:6]}-{usage_date[6:8]}",
+            'service': row[index['ServiceName']] if 'ServiceName' in index else '',
+            'resource_id': row[index['ResourceId']] if 'ResourceId' in index else '',
+            'amount': row[index[cost_column]],
+            'currency': row[index['Currency']] if 'Currency' in index else ''
+        })
+    return records
+
+
 class AzureManager(BaseCloudManager):
+    provider = 'azure'
+
     def __init__(self, os_username='ubuntu'):
         self.os_username = os_username
         self.credentials = ClientSecretCredential(
@@ -52,7 +124,12 @@ class AzureManager(BaseCloudManager):
         self.resource_group = settings.AZURE_RESOURCE_GROUP
         self.location = settings.AZURE_LOCATION
         self.credential = DefaultAzureCredential()
-        self.cost_management_url = f"https://management.azure.com/subscriptions/{self.subscription_id}/providers/Microsoft.CostManagement/query?api-version=2021-10-01"
+        self.cost_client = AzureCostClient(self.credential, self.subscription_id)
+        self._blob_service_clients = {}
+        self._blob_service_clients_lock = threading.Lock()
+
+    def _wait(self, poller, description):
+        return operation_tracker.wait(AZURE_POLLERS, poller, description=description)
 
     def create_aks_cluster(self, cluster_name, node_count=3, vm_size='Standard_DS2_v2'):
         cluster = self.container_service_client.managed_clusters.begin_create_or_update(
@@ -80,10 +157,11 @@ class AzureManager(BaseCloudManager):
                     client_id=settings.AZURE_CLIENT_ID,
                     secret=settings.AZURE_CLIENT_SECRET
                 )
-            )
-        ).result()
+            ),
+            polling=tracked_polling()
+        )
 
-        return cluster
+        return self._wait(cluster, f"cluster {cluster_name}")
 
     def get_aks_credentials(self, resource_group, cluster_name):
         retries = 5
@@ -307,9 +385,10 @@ class AzureManager(BaseCloudManager):
     def delete_cluster(self, cluster_name):
         delete_operation = self.container_service_client.managed_clusters.begin_delete(
             self.resource_group,
-            cluster_name
+            cluster_name,
+            polling=tracked_polling()
         )
-        return delete_operation.result()
+        return self._wait(delete_operation, f"deletion of cluster {cluster_name}")
 
     def get_service_external_ip(self, kubeconfig_path, namespace='default'):
         # Find the service with type LoadBalancer
@@ -380,35 +459,41 @@ class AzureManager(BaseCloudManager):
 
     # Compute (VM) Methods
 
-    def serialize_instance(self, instance):
-        print(f'instance: {instance}')
+    def serialize_instance(self, instance, instance_view=None, network_interfaces=None, public_ips=None):
+        # `network_interfaces` and `public_ips` are id -> resource maps prefetched by list_instances,
+        # without them the NIC and the public IP of the instance are fetched one by one
         nic_id = instance.network_profile.network_interfaces[0].id
-        network_interface = self.network_client.network_interfaces.get(
-            self.resource_group, nic_id.split('/')[-1]
-        )
-        ip_config = network_interface.ip_configurations[0]
+        if network_interfaces is not None:
+            network_interface = network_interfaces.get(nic_id.lower())
+        else:
+            network_interface = self.network_client.network_interfaces.get(
+                self.resource_group, nic_id.split('/')[-1]
+            )
+        ip_config = network_interface.ip_configurations[0] if network_interface else None
 
         public_ip_address = None
-        if ip_config.public_ip_address:
-            public_ip = self.network_client.public_ip_addresses.get(
-                self.resource_group, ip_config.public_ip_address.id.split('/')[-1]
-            )
-            public_ip_address = public_ip.ip_address
-        print(instance)
+        if ip_config and ip_config.public_ip_address:
+            if public_ips is not None:
+                public_ip = public_ips.get(ip_config.public_ip_address.id.lower())
+            else:
+                public_ip = self.network_client.public_ip_addresses.get(
+                    self.resource_group, ip_config.public_ip_address.id.split('/')[-1]
+                )
+            public_ip_address = public_ip.ip_address if public_ip else None
         return {
             "provider": "azure",
             "id": instance.id,
             "name": instance.name,
-            "status": self.get_instance_status(instance),
+            "status": self.get_instance_status(instance, instance_view),
             "created_at": instance.time_created,
             "zone": instance.location,
             "machine_type": instance.hardware_profile.vm_size,
-            "network_ip": ip_config.private_ip_address,
+            "network_ip": ip_config.private_ip_address if ip_config else None,
             "external_ip": public_ip_address,
         }
 
-    def get_instance_status(self, instance):
-        instance_view = instance.instance_view
+    def get_instance_status(self, instance, instance_view=None):
+        instance_view = instance_view or instance.instance_view
         if instance_view and instance_view.statuses:
             for status in instance_view.statuses:
                 if 'PowerState' in status.code:
@@ -432,18 +517,30 @@ class AzureManager(BaseCloudManager):
         return status_mapping.get(azure_status, 'unknown')
 
     def list_instances(self):
-        instances = self.compute_client.virtual_machines.list_all()
-        instances_details = []
+        # VMs, NICs and public IPs are listed once for the whole subscription and joined by resource id,
+        # only the instance views (power state) are fetched per VM, in a bounded concurrent batch
+        instances, network_interfaces, public_ips = map_concurrently(lambda list_all: list(list_all()), [
+            self.compute_client.virtual_machines.list_all,
+            self.network_client.network_interfaces.list_all,
+            self.network_client.public_ip_addresses.list_all
+        ])
+        network_interfaces = {nic.id.lower(): nic for nic in network_interfaces}
+        public_ips = {public_ip.id.lower(): public_ip for public_ip in public_ips}
+        instance_views = map_concurrently(self._get_instance_view, instances)
+        return [
+            self.serialize_instance(instance, instance_view, network_interfaces, public_ips)
+            for instance, instance_view in zip(instances, instance_views)
+        ]
 
-        for instance in instances:
-            instance_detail = self.compute_client.virtual_machines.get(
+    def _get_instance_view(self, instance):
+        try:
+            return self.compute_client.virtual_machines.instance_view(
                 resource_group_name=instance.id.split('/')[4],  # Extract resource group name from instance ID
-                vm_name=instance.name,
-                expand=InstanceViewTypes.instance_view
+                vm_name=instance.name
             )
-            instances_details.append(self.serialize_instance(instance_detail))
-
-        return instances_details
+        except Exception as e:
+            logger.error(f"Error fetching the instance view of {instance.name}: {e}")
+            return None
 
     def create_virtual_network(self, vnet_name, subnet_name):
         vnet_params = {
@@ -451,13 +548,15 @@ class AzureManager(BaseCloudManager):
             'address_space': {'address_prefixes': ['10.0.0.0/16']},
             'subnets': [{'name': subnet_name, 'address_prefix': '10.0.0.0/24'}]
         }
-        async_vnet_creation = self.network_client.virtual_networks.begin_create_or_update(self.resource_group, vnet_name, vnet_params)
-        return async_vnet_creation.result()
+        async_vnet_creation = self.network_client.virtual_networks.begin_create_or_update(
+            self.resource_group, vnet_name, vnet_params, polling=tracked_polling('azure-async-operation'))
+        return self._wait(async_vnet_creation, f"virtual network {vnet_name}")
 
     def create_public_ip_address(self, public_ip_name):
         public_ip_params = {'location': settings.AZURE_LOCATION, 'public_ip_allocation_method': 'Dynamic'}
-        async_public_ip_creation = self.network_client.public_ip_addresses.begin_create_or_update(self.resource_group, public_ip_name, public_ip_params)
-        return async_public_ip_creation.result()
+        async_public_ip_creation = self.network_client.public_ip_addresses.begin_create_or_update(
+            self.resource_group, public_ip_name, public_ip_params, polling=tracked_polling('azure-async-operation'))
+        return self._wait(async_public_ip_creation, f"public IP {public_ip_name}")
 
     def create_network_interface(self, nic_name, vnet_name, subnet_name, public_ip_name):
         subnet_info = self.network_client.subnets.get(self.resource_group, vnet_name, subnet_name)
@@ -466,8 +565,9 @@ class AzureManager(BaseCloudManager):
             name='ipconfig1', subnet=subnet_info, private_ip_allocation_method='Dynamic', public_ip_address=public_ip_info
         )
         nic_params = {'location': settings.AZURE_LOCATION, 'ip_configurations': [ip_config]}
-        async_nic_creation = self.network_client.network_interfaces.begin_create_or_update(self.resource_group, nic_name, nic_params)
-        return async_nic_creation.result()
+        async_nic_creation = self.network_client.network_interfaces.begin_create_or_update(
+            self.resource_group, nic_name, nic_params, polling=tracked_polling('azure-async-operation'))
+        return self._wait(async_nic_creation, f"network interface {nic_name}")
 
     def create_instance(self, vm_name, vm_size, image_reference, admin_password=None, ssh_key=None, nic_name=None):
         nic_info = self.network_client.network_interfaces.get(self.resource_group, nic_name)
@@ -496,8 +596,9 @@ class AzureManager(BaseCloudManager):
             'storage_profile': {'image_reference': image_reference},
             'network_profile': {'network_interfaces': [{'id': nic_info.id, 'primary': True}]}
         }
-        async_vm_creation = self.compute_client.virtual_machines.begin_create_or_update(self.resource_group, vm_name, params)
-        return self.serialize_instance(async_vm_creation.result())
+        async_vm_creation = self.compute_client.virtual_machines.begin_create_or_update(
+            self.resource_group, vm_name, params, polling=tracked_polling())
+        return self.serialize_instance(self._wait(async_vm_creation, f"VM {vm_name}"))
 
     def get_instance_info(self, vm_name):
         vm = self.compute_client.virtual_machines.get(self.resource_group, vm_name)
@@ -524,8 +625,8 @@ class AzureManager(BaseCloudManager):
 
     def manage_instance(self, action, vm_name):
         method = getattr(self.compute_client.virtual_machines, f"begin_{action}")
-        async_vm_action = method(self.resource_group, vm_name)
-        async_vm_action.result()
+        async_vm_action = method(self.resource_group, vm_name, polling=tracked_polling())
+        self._wait(async_vm_action, f"{action} {vm_name}")
 
     def delete_instance(self, vm_name):
         try:
@@ -535,19 +636,21 @@ class AzureManager(BaseCloudManager):
             disk_name = vm.storage_profile.os_disk.name
 
             # Delete the VM
-            async_vm_delete = self.compute_client.virtual_machines.begin_delete(self.resource_group, vm_name)
-            async_vm_delete.result()
+            async_vm_delete = self.compute_client.virtual_machines.begin_delete(
+                self.resource_group, vm_name, polling=tracked_polling())
+            self._wait(async_vm_delete, f"deletion of VM {vm_name}")
 
             # Delete the OS disk
-            async_disk_delete = self.compute_client.disks.begin_delete(self.resource_group, disk_name)
-            async_disk_delete.result()
+            async_disk_delete = self.compute_client.disks.begin_delete(self.resource_group, disk_name, polling=tracked_polling())
+            self._wait(async_disk_delete, f"deletion of disk {disk_name}")
 
             # Get the NIC name from its ID
             nic_name = nic_id.split('/')[-1]
 
             # Delete the NIC
-            async_nic_delete = self.network_client.network_interfaces.begin_delete(self.resource_group, nic_name)
-            async_nic_delete.result()
+            async_nic_delete = self.network_client.network_interfaces.begin_delete(
+                self.resource_group, nic_name, polling=tracked_polling('location'))
+            self._wait(async_nic_delete, f"deletion of network interface {nic_name}")
 
             # Get the Public IP name associated with the NIC
             nic = self.network_client.network_interfaces.get(self.resource_group, nic_name)
@@ -555,8 +658,9 @@ class AzureManager(BaseCloudManager):
             public_ip_name = public_ip_id.split('/')[-1]
 
             # Delete the Public IP
-            async_public_ip_delete = self.network_client.public_ip_addresses.begin_delete(self.resource_group, public_ip_name)
-            async_public_ip_delete.result()
+            async_public_ip_delete = self.network_client.public_ip_addresses.begin_delete(
+                self.resource_group, public_ip_name, polling=tracked_polling('location'))
+            self._wait(async_public_ip_delete, f"deletion of public IP {public_ip_name}")
 
             return {"message": f"VM {vm_name} and its associated resources have been deleted."}
         except Exception as e:
@@ -590,26 +694,62 @@ class AzureManager(BaseCloudManager):
             blobs = container_client.list_blobs()
             return [{"name": blob.name, "size": blob.size, "last_modified": blob.last_modified} for blob in blobs]
         else:
-            containers = blob_service_client.list_containers()
-            all_blobs = []
-            for container in containers:
+            def list_container(container):
                 container_client = blob_service_client.get_container_client(container.name)
-                blobs = container_client.list_blobs()
-                for blob in blobs:
-                    print(blob)
-                    all_blobs.append({
-                        "container_name": container.name,
-                        "name": blob.name,
-                        "size": blob.size,
-                        "last_modified": blob.last_modified
-                    })
-            return all_blobs
+                return [{
+                    "container_name": container.name,
+                    "name": blob.name,
+                    "size": blob.size,
+                    "last_modified": blob.last_modified
+                } for blob in container_client.list_blobs()]
+
+            # Containers are listed concurrently, the result keeps the containers order
+            containers = blob_service_client.list_containers()
+            return [blob for blobs in map_concurrently(list_container, containers) for blob in blobs]
+
+    def iter_objects(self, account_name, prefix=None, start_after=None, resume_token=None):
+        # Yields ("container/blob", object) for every blob of the account, containers and blobs in name order.
+        # Blob listing can't start after a given name: every object carries the continuation token of its listing
+        # page as _resume_token, and a container resumed with that token only re-reads that one page.
+        blob_service_client = self._get_blob_service_client(account_name)
+        start_container, _, start_blob = (start_after or '').partition('/')
+        container_names = [
+            container.name for container in blob_service_client.list_containers() if container.name >= start_container
+        ]
+
+        def open_container(container_name):
+            resuming = container_name == start_container
+            page_token = resume_token if resuming else None
+            pages = blob_service_client.get_container_client(container_name).list_blobs(
+                name_starts_with=prefix).by_page(continuation_token=page_token)
+            for page in pages:
+                next_token = pages.continuation_token
+                for blob in page:
+                    if not resuming or blob.name > start_blob:
+                        yield page_token, blob
+                page_token = next_token
+
+        for container_name, (page_token, blob) in iter_prefetched(
+                open_container, container_names, settings.OBJECT_LIST_PAGE_SIZE):
+            yield f"{container_name}/{blob.name}", {
+                "id": blob.name,
+                "provider": "azure",
+                "bucket": account_name,
+                "container_name": container_name,
+                "name": blob.name,
+                "size": blob.size,
+                "etag": (blob.etag or '').strip('"'),
+                "last_modified": blob.last_modified,
+                "created_at": blob.creation_time or blob.last_modified,
+                "_resume_token": page_token
+            }
 
     def manage_bucket(self, action, account_name, location='eastus'):
         if action == 'create':
             params = StorageAccountCreateParameters(sku=Sku(name='Standard_LRS'), kind=Kind.STORAGE_V2, location=location)
-            async_storage_creation = self.storage_client.storage_accounts.begin_create(self.resource_group, account_name, params)
-            async_storage_creation.result()
+            async_storage_creation = self.storage_client.storage_accounts.begin_create(
+                self.resource_group, account_name, params, polling=tracked_polling())
+            self._wait(async_storage_creation, f"storage account {account_name}")
         else:
             self.storage_client.storage_accounts.delete(self.resource_group, account_name)
 
@@ -638,9 +778,38 @@ class AzureManager(BaseCloudManager):
             return {"message": f"File {file_path} uploaded to container {container_name} as {blob_name}"}
         else:
             with open(file_path, "wb") as download_file:
-                download_file.write(method().readall())
+                # Written chunk by chunk instead of reading the whole blob in memory first
+                method().readinto(download_file)
             return {"status": "downloaded"}
 
+    def upload_stream(self, file_obj, account_name, container_name, blob_name):
+        blob_service_client = self._get_blob_service_client(account_name)
+        container_client = blob_service_client.get_container_client(container_name)
+        if not container_client.exists():
+            self.manage_container('create', account_name, container_name)
+
+        blob_client = blob_service_client.get_blob_client(container=container_name, blob=blob_name)
+
+        def stage_block(part):
+            part_number, data = part
+            # Block ids must all have the same length within a blob
+            block_id = base64.b64encode(f'{part_number:06d}'.encode()).decode()
+            blob_client.stage_block(block_id, data)
+            return BlobBlock(block_id=block_id)
+
+        blocks = map_bounded(stage_block, read_parts(file_obj, settings.UPLOAD_PART_SIZE))
+        blob_client.commit_block_list(blocks)
+        return {"message": f"File uploaded to container {container_name} as {blob_name}", "blocks": len(blocks)}
+
+    def get_object_info(self, account_name, container_name, blob_name):
+        blob_client = self._get_blob_service_client(account_name).get_blob_client(container=container_name, blob=blob_name)
+        properties = blob_client.get_blob_properties()
+        return properties.size, properties.content_settings.content_type
+
+    def read_range(self, account_name, container_name, blob_name, start, end):
+        blob_client = self._get_blob_service_client(account_name).get_blob_client(container=container_name, blob=blob_name)
+        return blob_client.download_blob(offset=start, length=end - start + 1).readall()
+
     def delete_object(self, account_name, container_name, blob_name):
         blob_service_client = self._get_blob_service_client(account_name)
         blob_client = blob_service_client.get_blob_client(container=container_name, blob=blob_name)
@@ -648,8 +817,17 @@ class AzureManager(BaseCloudManager):
         return {"status": "deleted"}
 
     def _get_blob_service_client(self, account_name):
-        account_url = f"https://{account_name}.blob.core.windows.net"
-        return BlobServiceClient(account_url=account_url, credential=settings.AZURE_STORAGE_ACCOUNT_KEY)
+        # One client (and HTTP connection pool) per storage account, rebuilt when the account key is rotated
+        key = (account_name, settings.AZURE_STORAGE_ACCOUNT_KEY)
+        blob_service_client = self._blob_service_clients.get(key)
+        if blob_service_client is None:
+            with self._blob_service_clients_lock:
+                blob_service_client = self._blob_service_clients.get(key)
+                if blob_service_client is None:
+                    account_url = f"https://{account_name}.blob.core.windows.net"
+                    blob_service_client = BlobServiceClient(account_url=account_url, credential=settings.AZURE_STORAGE_ACCOUNT_KEY)
+                    self._blob_service_clients[key] = blob_service_client
+        return blob_service_client
 
     def generate_presigned_url(self, account_name, container_name, blob_name, expiration=3600):
         try:
@@ -692,14 +870,16 @@ class AzureManager(BaseCloudManager):
             for index, port in enumerate(ports)
         ]
         nsg_params = {'location': settings.AZURE_LOCATION, 'security_rules': security_rules}
-        async_nsg_creation = self.network_client.network_security_groups.begin_create_or_update(self.resource_group, nsg_name, nsg_params)
-        async_nsg_creation.result()
+        async_nsg_creation = self.network_client.network_security_groups.begin_create_or_update(
+            self.resource_group, nsg_name, nsg_params, polling=tracked_polling('azure-async-operation'))
+        self._wait(async_nsg_creation, f"network security group {nsg_name}")
 
     def associate_nsg_with_subnet(self, vnet_name, subnet_name, nsg_name):
         subnet_info = self.network_client.subnets.get(self.resource_group, vnet_name, subnet_name)
         subnet_info.network_security_group = self.network_client.network_security_groups.get(self.resource_group, nsg_name)
-        async_subnet_update = self.network_client.subnets.begin_create_or_update(self.resource_group, vnet_name, subnet_name, subnet_info)
-        async_subnet_update.result()
+        async_subnet_update = self.network_client.subnets.begin_create_or_update(
+            self.resource_group, vnet_name, subnet_name, subnet_info, polling=tracked_polling('azure-async-operation'))
+        self._wait(async_subnet_update, f"subnet {subnet_name}")
 
     def run_docker_container(self, ip_address, image, ports, ssh_key_path):
         container_name = f"{image}-container".replace('/', '-').replace(':', '-').replace(' ', '')
@@ -708,7 +888,7 @@ class AzureManager(BaseCloudManager):
         output, error = self.run_ssh_command(ip_address, run_container_command, ssh_key_path)
         if error:
             logger.error(f"Failed to start Docker container {container_name}: {error}")
-            list_containers_command = 'docker ps --format "{{.Names}}"'
+            list_containers_command = 'sudo docker ps --format "{{.Names}}"'
             output, error = self.run_ssh_command(ip_address, list_containers_command, ssh_key_path)
             if container_name in output or output.strip() == container_name:
                 logger.info(f"Docker container {container_name} is running despite the error.")
@@ -718,69 +898,34 @@ class AzureManager(BaseCloudManager):
             "ip_address": ip_address
         }
 
-    def install_docker(self, ip_address, ssh_private_key_path):
-        commands = [
-            'sudo apt-get update -y',
-            'sudo DEBIAN_FRONTEND=noninteractive apt-get install -y docker.io',
-            'sudo systemctl start docker',
-            f'sudo usermod -a -G docker {self.os_username}'
-        ]
-        for command in commands:
-            output, error = self.run_ssh_command(ip_address, command, ssh_private_key_path)
-            if error:
-                print(f"Error installing Docker: {error}")
-            else:
-                print(f"Docker installation output: {output}")
-        configure_docker_cmd = f'sudo mkdir -p /etc/docker && echo \'{{"insecure-registries":["{settings.NEXUS_REGISTRY_URL}:{settings.NEXUS_REGISTRY_DOCKER_PORT}"]}}\' | sudo tee /etc/docker/daemon.json && sudo systemctl restart docker'
-        self.run_ssh_command(ip_address, configure_docker_cmd, ssh_private_key_path)
-        docker_login_cmd = docker_login_cmd = f'echo {settings.NEXUS_REGISTRY_PASSWORD} | sudo docker login -u {settings.NEXUS_REGISTRY_USERNAME} --password-stdin {settings.NEXUS_REGISTRY_URL}:{settings.NEXUS_REGISTRY_DOCKER_PORT}'
-        self.run_ssh_command(ip_address, docker_login_cmd, settings.SSH_PRIVATE_KEY)
-
     def get_access_token(self):
-        token = self.credential.get_token("https://management.azure.com/.default")
-        return token.token
+        return self.cost_client.token()
 
-    def get_cost_and_usage(self, start_date, end_date):
-        headers = {
-            'Authorization': f'Bearer {self.get_access_token()}',
-            'Content-Type': 'application/json'
-        }
-        payload = {
+    def _cost_query(self, start_date, end_date, grouping):
+        return {
             "type": "Usage",
             "timeframe": "Custom",
             "timePeriod": {"from": start_date, "to": end_date},
             "dataset": {
                 "granularity": "Daily",
                 "aggregation": {"totalCost": {"name": "Cost", "function": "Sum"}},
-                "grouping": [{"type": "Dimension", "name": "ResourceGroup"}]
+                "grouping": [{"type": "Dimension", "name": name} for name in grouping]
             }
         }
-        response = requests.post(self.cost_management_url, headers=headers, json=payload)
-        if response.status_code == 200:
-            return response.json()
-        else:
-            response.raise_for_status()
+
+    def get_cost_and_usage(self, start_date, end_date):
+        return self.cost_client.query(self._cost_query(start_date, end_date, ['ResourceGroup']))
 
     def get_cost_by_service(self, start_date, end_date):
-        headers = {
-            'Authorization': f'Bearer {self.get_access_token()}',
-            'Content-Type': 'application/json'
-        }
-        payload = {
-            "type": "Usage",
-            "timeframe": "Custom",
-            "timePeriod": {"from": start_date, "to": end_date},
-            "dataset": {
-                "granularity": "Daily",
-                "aggregation": {"totalCost": {"name": "Cost", "function": "Sum"}},
-                "grouping": [{"type": "Dimension", "name": "ServiceName"}]
-            }
-        }
-        response = requests.post(self.cost_management_url, headers=headers, json=payload)
-        if response.status_code == 200:
-            return response.json()
-        else:
-            response.raise_for_status()
+        return self.cost_client.query(self._cost_query(start_date, end_date, ['ServiceName']))
+
+    def get_daily_costs(self, start_date, end_date):
+        # Daily cost per service and resource, `end_date` is exclusive while the query's "to" is inclusive
+        payload = self._cost_query(
+            f"{start_date.isoformat()}T00:00:00Z", f"{(end_date - timedelta(days=1)).isoformat()}T23:59:59Z",
+            ['ServiceName', 'ResourceId']
+        )
+        return parse_cost_rows(self.cost_client.query(payload)['properties'])
 
     def create_deploy_and_get_ip(self, cluster_name, image_name, service_name, container_port):
         insecure_registry = "{settings.NEXUS_REGISTRY_URL}:{settings.NEXUS_REGISTRY_DOCKER_PORT}"
@@ -1,9 +1,7 @@
-import base64
-from io import StringIO
-from django.conf import settings
-import paramiko
 import logging
-import time
+from cloud_providers.services.ssh_pool import ssh_pool
+from cloud_providers.services.bootstrap import docker_bootstrap_script, run_bootstrap
+from cloud_providers.services.readiness import wait_until_ready
 
 # Configure logging
 logger = logging.getLogger(__name__)
@@ -11,89 +9,37 @@ logging.basicConfig(level=logging.INFO)
 
 
 class BaseCloudManager:
+    provider = ''
+
     def __init__(self, os_username='ubuntu'):
         self.os_username = os_username
 
     def run_ssh_command(self, ip_address, command, ssh_private_key):
         try:
-            key = None
-            # Detect if the key is in PEM format
-            if ssh_private_key.startswith("-----BEGIN"):
-                key = paramiko.RSAKey.from_private_key(StringIO(ssh_private_key))
-            else:
-                # Decode base64 if the key is base64 encoded
-                try:
-                    decoded_key = base64.b64decode(ssh_private_key)
-                    key = paramiko.RSAKey.from_private_key(StringIO(decoded_key.decode('utf-8')))
-                except Exception as e:
-                    logger.error(f"Error decoding base64 key: {str(e)}")
-                    raise
-
-            client = paramiko.SSHClient()
-            client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-            client.connect(ip_address, username=self.os_username, pkey=key)
             # Run the command with DEBIAN_FRONTEND=noninteractive
             install_command = f"export DEBIAN_FRONTEND=noninteractive && {command}"
-            stdin, stdout, stderr = client.exec_command(install_command)
-            stdout.channel.recv_exit_status()
-            output = stdout.read().decode()
-            error = stderr.read().decode()
-            client.close()
+            output, error, _ = ssh_pool.exec_command(ip_address, self.os_username, ssh_private_key, install_command)
             return output, error
         except Exception as e:
             logger.error(f"SSH command execution failed: {str(e)}")
             raise
 
-    def wait_for_ssh(self, ip_address, ssh_private_key_path, retries=10, delay=10):
-        for i in range(retries):
-            try:
-                logger.info(f"Checking SSH availability on {ip_address}, attempt {i + 1}/{retries}")
-                self.run_ssh_command(ip_address, "echo SSH is available", ssh_private_key_path)
-                logger.info("SSH is available")
-                return
-            except Exception as e:
-                logger.info(f"SSH not available yet: {str(e)}")
-                time.sleep(delay)
-        raise Exception(f"SSH not available on {ip_address} after {retries * delay} seconds")
+    def wait_for_ssh(self, ip_address, ssh_private_key_path, image='', timeout=None):
+        logger.info(f"Waiting for SSH on {ip_address}")
+        return wait_until_ready(
+            ip_address, self.os_username, ssh_private_key_path, provider=self.provider, image=image, timeout=timeout)
 
-    def install_docker(self, ip_address, ssh_private_key_path):
-        commands = [
-            'export DEBIAN_FRONTEND=noninteractive',
-            'sudo apt-get update -y',
-            'sudo apt-get install -y docker.io',
-            'sudo systemctl start docker',
-            f'sudo usermod -a -G docker {self.os_username}'
-        ]
-        for command in commands:
-            output, error = self.run_ssh_command(ip_address, command, ssh_private_key_path)
-            if error:
-                logger.error(f"Error running command '{command}': {error}")
-            else:
-                logger.info(f"Command '{command}' output: {output}")
+    def report_step(self, on_step, step):
+        logger.info(f"[deploy] {step}")
+        if on_step:
+            on_step(step)
 
-        # Configure Docker to use the insecure registry
-        configure_docker_cmd = (
-            f'sudo mkdir -p /etc/docker && '
-            f'echo \'{{"insecure-registries":["{settings.NEXUS_REGISTRY_URL}:{settings.NEXUS_REGISTRY_DOCKER_PORT}"]}}\' '
-            f'| sudo tee /etc/docker/daemon.json && sudo systemctl restart docker'
-        )
-        output, error = self.run_ssh_command(ip_address, configure_docker_cmd, ssh_private_key_path)
-        if error:
-            logger.error(f"Error configuring Docker: {error}")
-        else:
-            logger.info(f"Docker configuration output: {output}")
-
-        # Log in to the Docker registry
-        docker_login_cmd = (
-            f'echo {settings.NEXUS_REGISTRY_PASSWORD} | '
-            f'sudo docker login -u {settings.NEXUS_REGISTRY_USERNAME} --password-stdin '
-            f'{settings.NEXUS_REGISTRY_URL}:{settings.NEXUS_REGISTRY_DOCKER_PORT}'
-        )
-        output, error = self.run_ssh_command(ip_address, docker_login_cmd, ssh_private_key_path)
-        if error:
-            logger.error(f"Error logging into Docker registry: {error}")
-        else:
-            logger.info(f"Docker login output: {output}")
+    def install_docker(self, ip_address, ssh_private_key_path):
+        # Installs Docker, trusts the Nexus registry and logs into it with a single script run in one SSH session
+        script = docker_bootstrap_script(self.os_username)
+        steps = run_bootstrap(ip_address, self.os_username, ssh_private_key_path, script)
+        logger.info(f"Docker host {ip_address} ready in {sum(step['duration_ms'] for step in steps)}ms")
+        return steps
 
     def manage_instance(self, action, *args, **kwargs):
         raise NotImplementedError("This method should be overridden in the subclass.")
@@ -0,0 +1,99 @@
+import hashlib
+import logging
+import shlex
+from functools import lru_cache
+from django.conf import settings
+
+from cloud_providers.services.ssh_pool import ssh_pool
+
+logger = logging.getLogger(__name__)
+
+STEP_MARKER = '__ILEF_STEP__'
+BOOTSTRAP_STATE_DIR = '/var/lib/ilef'
+
+
+class BootstrapError(Exception):
+    def __init__(self, message, steps):
+        super().__init__(message)
+        self.steps = steps
+
+
+def docker_bootstrap_steps(os_username, registry, registry_username, registry_password):
+    # (name, command, required): a failing required step stops the script, the others are only reported
+    daemon_json = f'{{"insecure-registries":["{registry}"]}}'
+    return [
+        ('apt_update', 'command -v docker >/dev/null 2>&1 || sudo apt-get update -y', True),
+        ('install_docker', 'command -v docker >/dev/null 2>&1 || sudo apt-get install -y docker.io', True),
+        ('start_docker', 'sudo systemctl start docker', True),
+        ('add_user_to_docker_group', f'sudo usermod -a -G docker {shlex.quote(os_username)}', True),
+        ('configure_registry', (
+            f'DAEMON_JSON={shlex.quote(daemon_json)}; '
+            'if [ "$(sudo cat /etc/docker/daemon.json 2>/dev/null)" != "$DAEMON_JSON" ]; then '
+            'sudo mkdir -p /etc/docker && echo "$DAEMON_JSON" | sudo tee /etc/docker/daemon.json >/dev/null '
+            '&& sudo systemctl restart docker; fi'
+        ), True),
+        ('registry_login', (
+            f'echo {shlex.quote(str(registry_password))} | '
+            f'sudo docker login -u {shlex.quote(str(registry_username))} --password-stdin {shlex.quote(registry)}'
+        ), False),
+    ]
+
+
+def render_script(steps):
+    body = '\n'.join(
+        f'__started=$(date +%s%N)\n'
+        f'( set -e; {command} )\n'
+        f'__rc=$?\n'
+        f'echo "{STEP_MARKER} {name} $__rc $(( ($(date +%s%N) - __started) / 1000000 ))"\n'
+        + ('[ $__rc -eq 0 ] || exit $__rc\n' if required else '[ $__rc -eq 0 ] || __failed=1\n')
+        for name, command, required in steps
+    )
+    # The digest identifies this exact script: a host that already ran it successfully skips it entirely
+    digest = hashlib.sha256(body.encode()).hexdigest()[:16]
+    done_marker = f'{BOOTSTRAP_STATE_DIR}/bootstrap-{digest}.done'
+    return (
+        '#!/bin/bash\n'
+        'export DEBIAN_FRONTEND=noninteractive\n'
+        f'if [ -f {done_marker} ]; then echo "{STEP_MARKER} already_bootstrapped 0 0"; exit 0; fi\n'
+        '__failed=0\n'
+        f'{body}'
+        f'[ $__failed -eq 0 ] && sudo mkdir -p {BOOTSTRAP_STATE_DIR} && sudo touch {done_marker}\n'
+        'exit 0\n'
+    )
+
+
+@lru_cache(maxsize=32)
+def _docker_bootstrap_script(os_username, registry, registry_username, registry_password):
+    return render_script(docker_bootstrap_steps(os_username, registry, registry_username, registry_password))
+
+
+def docker_bootstrap_script(os_username):
+    registry = f'{settings.NEXUS_REGISTRY_URL}:{settings.NEXUS_REGISTRY_DOCKER_PORT}'
+    return _docker_bootstrap_script(
+        os_username, registry, settings.NEXUS_REGISTRY_USERNAME, settings.NEXUS_REGISTRY_PASSWORD)
+
+
+def parse_step_line(line):
+    parts = line.strip().split(' ')
+    if len(parts) != 4 or parts[0] != STEP_MARKER:
+        return None
+    return {"step": parts[1], "exit_code": int(parts[2]), "duration_ms": int(parts[3])}
+
+
+def run_bootstrap(ip_address, os_username, ssh_private_key, script):
+    # The whole script is sent on stdin of a single `bash -s` session: one round-trip for every step
+    steps = []
+
+    def on_output_line(line):
+        step = parse_step_line(line)
+        if step:
+            steps.append(step)
+            log = logger.info if step['exit_code'] == 0 else logger.error
+            log(f"[bootstrap][{ip_address}] {step['step']} exited with {step['exit_code']} in {step['duration_ms']}ms")
+
+    _, error, exit_status = ssh_pool.exec_command(
+        ip_address, os_username, ssh_private_key, 'bash -s', stdin_data=script, on_output_line=on_output_line)
+    if exit_status != 0:
+        failed_step = steps[-1]['step'] if steps else 'bootstrap'
+        raise BootstrapError(f"Bootstrap of {ip_address} failed at step {failed_step}: {error.strip()[-500:]}", steps)
+    return steps
@@ -0,0 +1,115 @@
+import logging
+import time
+from collections import deque
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeoutError
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+def _timed_call(func):
+    started = time.monotonic()
+    try:
+        return True, func(), time.monotonic() - started
+    except Exception as e:
+        return False, e, time.monotonic() - started
+
+
+# Runs every callable of `tasks` (name -> callable) in parallel and returns (results, report).
+# `results` only holds the tasks that succeeded in time, `report` holds the status, latency and error of each task.
+# A task that times out keeps running in the background, its result is simply discarded.
+def fan_out(tasks, timeout=None, timeouts=None):
+    timeout = timeout or settings.CLOUD_FAN_OUT_TIMEOUT
+    timeouts = timeouts or {}
+    results, report = {}, {}
+    if not tasks:
+        return results, report
+
+    started = time.monotonic()
+    executor = ThreadPoolExecutor(max_workers=len(tasks), thread_name_prefix='fan-out')
+    futures = {name: executor.submit(_timed_call, func) for name, func in tasks.items()}
+    try:
+        for name, future in futures.items():
+            task_timeout = timeouts.get(name, timeout)
+            remaining = max(task_timeout - (time.monotonic() - started), 0)
+            try:
+                succeeded, value, elapsed = future.result(timeout=remaining)
+            except FuturesTimeoutError:
+                logger.warning(f"[fan_out] {name} did not respond within {task_timeout}s")
+                report[name] = {
+                    "status": "timeout",
+                    "latency_ms": round((time.monotonic() - started) * 1000),
+                    "error": f"{name} did not respond within {task_timeout} seconds"
+                }
+                continue
+            if succeeded:
+                results[name] = value
+                report[name] = {"status": "ok", "latency_ms": round(elapsed * 1000), "error": None}
+            else:
+                logger.error(f"[fan_out] {name} failed: {value}")
+                report[name] = {"status": "error", "latency_ms": round(elapsed * 1000), "error": str(value)}
+    finally:
+        executor.shutdown(wait=False)
+    return results, report
+
+
+# Applies `func` to every item with at most `max_workers` calls in flight and returns the results in the items order
+def map_concurrently(func, items, max_workers=None):
+    items = list(items)
+    if not items:
+        return []
+    max_workers = min(max_workers or settings.CLOUD_API_CONCURRENCY, len(items))
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='map') as executor:
+        return list(executor.map(func, items))
+
+
+def read_parts(file_obj, part_size):
+    # Yields (part_number, bytes) from a file-like object, part numbers start at 1
+    part_number = 1
+    while True:
+        data = file_obj.read(part_size)
+        if not data:
+            return
+        yield part_number, data
+        part_number += 1
+
+
+# Applies `func` to `items` pulled lazily, with at most `max_in_flight` of them submitted at once, and yields the
+# results in the items order as soon as they are ready. A generator of large buffers (upload parts, download ranges)
+# never holds more than `max_in_flight` + 1 of them in memory.
+def iter_bounded(func, items, max_in_flight):
+    pending = deque()
+    executor = ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix='bounded')
+    try:
+        for item in items:
+            if len(pending) >= max_in_flight:
+                yield pending.popleft().result()
+            pending.append(executor.submit(func, item))
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        # Reached on errors and when the consumer stops early (client disconnected)
+        for future in pending:
+            future.cancel()
+        executor.shutdown(wait=False)
+
+
+def map_bounded(func, items, max_in_flight=None):
+    return list(iter_bounded(func, items, max_in_flight or settings.UPLOAD_CONCURRENCY))
+
+
+# Opens `open_iter(item)` for every item with up to `max_in_flight` items fetching their first `prefetch` values
+# in parallel, and yields (item, value) in the items order. Only the head of each iterator is read concurrently,
+# the rest is consumed lazily in the caller's thread when the caller gets that far.
+def iter_prefetched(open_iter, items, prefetch, max_in_flight=None):
+    def start(item):
+        iterator = iter(open_iter(item))
+        return item, list(islice(iterator, prefetch)), iterator
+
+    for item, head, iterator in iter_bounded(start, items, max_in_flight or settings.CLOUD_API_CONCURRENCY):
+        for value in head:
+            yield item, value
+        if len(head) == prefetch:
+            for value in iterator:
+                yield item, value
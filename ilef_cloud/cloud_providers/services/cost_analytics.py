@@ -0,0 +1,158 @@
+import calendar
+import datetime
+import math
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncMonth, TruncWeek
+
+from cloud_providers.models import Cost
+from cloud_providers.services.cost_engine import cost_source
+
+# The heavy lifting (summing line items into days, weeks and months) is done by the database, what is left is a few
+# hundred daily points per provider, which plain column lists handle in well under a millisecond
+
+
+def _days(start_date, end_date):
+    return [start_date + datetime.timedelta(days=offset) for offset in range((end_date - start_date).days + 1)]
+
+
+def _as_date(value):
+    return value.date() if isinstance(value, datetime.datetime) else value
+
+
+def main_currency(costs):
+    # Amounts in different currencies cannot be added up, analytics run on one of them
+    row = costs.values('currency').annotate(rows=Count('id')).order_by('-rows').first()
+    return row['currency'] if row else ''
+
+
+def daily_series(costs, providers, start_date, end_date, date_field='date'):
+    # Columnar daily totals: {"date": [...], "<provider>": [...], "total": [...]}, missing days are 0
+    days = _days(start_date, end_date)
+    index = {day: position for position, day in enumerate(days)}
+    series = {provider: [0.0] * len(days) for provider in providers}
+    for row in costs.values('provider__name', date_field).annotate(amount=Sum('amount')):
+        series[row['provider__name']][index[row[date_field]]] = float(row['amount'])
+    series['total'] = [sum(values) for values in zip(*(series[provider] for provider in providers))] or [0.0] * len(days)
+    series['date'] = days
+    return series
+
+
+def rollups(costs, date_field='date'):
+    rollup = {}
+    for name, trunc in (('week', TruncWeek), ('month', TruncMonth)):
+        rows = costs.annotate(period=trunc(date_field)).values('period', 'provider__name').annotate(
+            amount=Sum('amount')).order_by('period', 'provider__name')
+        rollup[name] = {
+            "date": [_as_date(row['period']) for row in rows],
+            "provider": [row['provider__name'] for row in rows],
+            "amount": [float(row['amount']) for row in rows],
+        }
+    return rollup
+
+
+def moving_average(values, window):
+    # Trailing mean over the last `window` points (fewer at the start of the series)
+    averages, running = [], 0.0
+    for position, value in enumerate(values):
+        running += value
+        if position >= window:
+            running -= values[position - window]
+        averages.append(running / min(position + 1, window))
+    return averages
+
+
+def anomalies(values, baseline, threshold):
+    # A day is anomalous when it is more than `threshold` standard deviations away from the mean of the `baseline`
+    # days before it. Returns the flags and the z-scores (None while the history is too short).
+    flags, scores = [], []
+    for position, value in enumerate(values):
+        history = values[max(position - baseline, 0):position]
+        if len(history) < max(baseline // 2, 2):
+            flags.append(False)
+            scores.append(None)
+            continue
+        mean = sum(history) / len(history)
+        deviation = math.sqrt(sum((point - mean) ** 2 for point in history) / len(history))
+        score = (value - mean) / deviation if deviation else (0.0 if value == mean else math.inf)
+        flags.append(abs(score) > threshold)
+        scores.append(round(score, 3) if math.isfinite(score) else None)
+    return flags, scores
+
+
+def linear_fit(values):
+    # Least squares y = intercept + slope * x over x = 0..n-1
+    count = len(values)
+    if count < 2:
+        return (values[0] if values else 0.0), 0.0
+    mean_x = (count - 1) / 2
+    mean_y = sum(values) / count
+    variance = sum((x - mean_x) ** 2 for x in range(count))
+    slope = sum((x - mean_x) * (y - mean_y) for x, y in enumerate(values)) / variance
+    return mean_y - slope * mean_x, slope
+
+
+def month_end_forecast(days, totals, as_of):
+    # Month-to-date spend plus the fitted daily trend over the days left in the month of `as_of`
+    month_start = as_of.replace(day=1)
+    month_days = [total for day, total in zip(days, totals) if month_start <= day <= as_of]
+    month_end = as_of.replace(day=calendar.monthrange(as_of.year, as_of.month)[1])
+    intercept, slope = linear_fit(month_days)
+    remaining = [
+        max(intercept + slope * x, 0.0)
+        for x in range(len(month_days), len(month_days) + (month_end - as_of).days)
+    ]
+    month_to_date = sum(month_days)
+    return {
+        "month": month_start,
+        "month_to_date": round(month_to_date, 2),
+        "forecast": round(month_to_date + sum(remaining), 2),
+        "daily_trend": round(slope, 4),
+        "days_observed": len(month_days),
+    }
+
+
+def instance_totals(costs, limit):
+    rows = (
+        costs.filter(instance__isnull=False)
+        .values('instance__instance_id', 'instance__name', 'provider__name')
+        .annotate(total_cost=Sum('amount'))
+        .order_by('-total_cost')[:limit]
+    )
+    return [
+        {
+            "instance_id": row['instance__instance_id'],
+            "name": row['instance__name'],
+            "provider": row['provider__name'],
+            "total_cost": float(row['total_cost'])
+        }
+        for row in rows
+    ]
+
+
+def analyze_costs(providers, start_date, end_date, currency=None, window=7, baseline=28, threshold=3.0,
+                  top_instances=20):
+    # Day totals come from the daily rollup once it is filled, instance totals need the cost lines
+    days, date_field, _ = cost_source(providers, start_date, end_date, ['provider'], 'day')
+    days = days.filter(
+        provider__name__in=providers, **{f'{date_field}__gte': start_date, f'{date_field}__lte': end_date})
+    currency = currency or main_currency(days)
+    days = days.filter(currency=currency)
+    costs = Cost.objects.filter(
+        provider__name__in=providers, date__gte=start_date, date__lte=end_date, currency=currency)
+
+    series = daily_series(days, providers, start_date, end_date, date_field)
+    flags, scores = anomalies(series['total'], baseline, threshold)
+    series['moving_average'] = [round(value, 4) for value in moving_average(series['total'], window)]
+    series['anomaly'] = flags
+    series['zscore'] = scores
+    return {
+        "currency": currency,
+        "daily": series,
+        "rollups": rollups(days, date_field),
+        "anomalies": [
+            {"date": day, "amount": total, "zscore": score}
+            for day, total, flag, score in zip(series['date'], series['total'], flags, scores) if flag
+        ],
+        "forecast": month_end_forecast(series['date'], series['total'], end_date),
+        "instances": instance_totals(costs, top_instances),
+    }
@@ -0,0 +1,162 @@
+import datetime
+from collections import defaultdict
+from decimal import Decimal
+from django.db.models import F, Sum
+from django.db.models.functions import TruncMonth, TruncWeek
+from django.utils.dateparse import parse_date
+
+from cloud_providers.models import Cost, CostDailyRollup, CostMonthlyRollup
+from cloud_providers.services.concurrency import fan_out
+from cloud_providers.services.costs import COST_PROVIDERS, cost_coverage, resource_type_for, rollups_ready
+from cloud_providers.services.manager_registry import get_manager
+
+# Every cost record, live or stored, has these fields plus `date`, `amount` and `currency`
+COST_GROUP_FIELDS = {
+    'provider': 'provider__name',
+    'service': 'service',
+    'resource_type': 'resource_type',
+    'resource_id': 'resource_id',
+}
+COST_BUCKETS = ('day', 'week', 'month', 'total')
+DEFAULT_GROUP_BY = ('provider', 'resource_type')
+
+
+class InvalidCostQuery(Exception):
+    pass
+
+
+def parse_cost_query(params):
+    # Validates the query parameters shared by the cost endpoints
+    try:
+        start_date = parse_date(params['start_date'])
+        end_date = parse_date(params['end_date'])
+    except ValueError:
+        start_date = end_date = None
+    if not start_date or not end_date or start_date > end_date:
+        raise InvalidCostQuery("start_date and end_date must be YYYY-MM-DD dates, start_date first")
+    providers = [p for p in params.get('providers', '').split(',') if p] or list(COST_PROVIDERS)
+    group_by = [field for field in params.get('group_by', '').split(',') if field] or list(DEFAULT_GROUP_BY)
+    bucket = params.get('bucket') or 'day'
+    unknown = [p for p in providers if p not in COST_PROVIDERS]
+    if unknown:
+        raise InvalidCostQuery(f"Unknown providers: {', '.join(unknown)}")
+    if any(field not in COST_GROUP_FIELDS for field in group_by):
+        raise InvalidCostQuery(f"group_by must be made of {', '.join(COST_GROUP_FIELDS)}")
+    if bucket not in COST_BUCKETS:
+        raise InvalidCostQuery(f"bucket must be one of {', '.join(COST_BUCKETS)}")
+    return providers, start_date, end_date, group_by, bucket
+
+
+def bucket_start(day, bucket):
+    if bucket == 'week':
+        return day - datetime.timedelta(days=day.weekday())
+    if bucket == 'month':
+        return day.replace(day=1)
+    return day
+
+
+def fetch_live_costs(ranges):
+    # Asks every provider of `ranges` ({provider: (start_date, end_date)}, both inclusive) at once, the slowest one
+    # sets the latency
+    tasks = {
+        provider: (lambda provider=provider, start_date=start_date, end_date=end_date: get_manager(
+            provider).get_daily_costs(start_date, end_date + datetime.timedelta(days=1)))
+        for provider, (start_date, end_date) in ranges.items()
+    }
+    results, report = fan_out(tasks)
+    records = []
+    for provider, lines in results.items():
+        for line in lines:
+            day = line['date'] if isinstance(line['date'], datetime.date) else parse_date(str(line['date'])[:10])
+            records.append({
+                'provider': provider,
+                'service': line['service'] or '',
+                'resource_type': resource_type_for(line['service']),
+                'resource_id': line.get('resource_id') or '',
+                'date': day,
+                'amount': Decimal(str(line['amount'])),
+                'currency': line['currency'] or ''
+            })
+    return records, report
+
+
+def group_records(records, group_by, bucket):
+    totals = defaultdict(Decimal)
+    for record in records:
+        key = tuple(record[field] for field in group_by)
+        period = None if bucket == 'total' else bucket_start(record['date'], bucket)
+        totals[(key, period, record['currency'])] += record['amount']
+    grouped = []
+    for (key, period, currency), amount in totals.items():
+        row = dict(zip(group_by, key))
+        if period is not None:
+            row['date'] = period
+        row['amount'] = amount
+        row['currency'] = currency
+        grouped.append(row)
+    return sorted(grouped, key=lambda row: (row.get('date') or datetime.date.min, *(row[f] for f in group_by)))
+
+
+def cost_source(providers, start_date, end_date, group_by, bucket):
+    # Coarsest stored table that answers the query, as (queryset, date field, name): the monthly rollup for whole
+    # months, the daily rollup otherwise, the cost lines when grouping by resource (or before the first rollup)
+    if 'resource_id' in group_by or not rollups_ready(providers):
+        return Cost.objects.all(), 'date', 'cost'
+    whole_months = start_date.day == 1 and (end_date + datetime.timedelta(days=1)).day == 1
+    if bucket in ('month', 'total') and whole_months:
+        return CostMonthlyRollup.objects.all(), 'month', 'monthly_rollup'
+    return CostDailyRollup.objects.all(), 'day', 'daily_rollup'
+
+
+def stored_cost_groups(providers, start_date, end_date, group_by, bucket):
+    # Same rows as group_records, aggregated by the database, plus the name of the table they were read from
+    costs, date_field, table = cost_source(providers, start_date, end_date, group_by, bucket)
+    costs = costs.filter(
+        provider__name__in=providers, **{f'{date_field}__gte': start_date, f'{date_field}__lte': end_date})
+    fields = [COST_GROUP_FIELDS[field] for field in group_by]
+    if bucket == 'week':
+        costs = costs.annotate(period=TruncWeek(date_field))
+    elif bucket == 'month':
+        costs = costs.annotate(period=TruncMonth(date_field))
+    elif bucket == 'day':
+        costs = costs.annotate(period=F(date_field))
+    period_fields = [] if bucket == 'total' else ['period']
+    rows = costs.values(*fields, *period_fields, 'currency').annotate(total=Sum('amount')).order_by(*period_fields, *fields)
+    grouped = []
+    for row in rows:
+        record = {field: row[COST_GROUP_FIELDS[field]] for field in group_by}
+        if bucket != 'total':
+            period = row['period']
+            record['date'] = period.date() if isinstance(period, datetime.datetime) else period
+        record['amount'] = row['total']
+        record['currency'] = row['currency']
+        grouped.append(record)
+    return grouped, table
+
+
+def to_columnar(rows, group_by, bucket):
+    # {"columns": [...], "data": {column: [values...]}}, the compact layout charting libraries consume directly
+    columns = list(group_by) + ([] if bucket == 'total' else ['date']) + ['amount', 'currency']
+    return {"columns": columns, "data": {column: [row[column] for row in rows] for column in columns}}
+
+
+def cost_report(providers, start_date, end_date, group_by, bucket, fresh=False):
+    # Ingested providers are served from the warehouse, the others, and the days before the first stored day of an
+    # ingested one, are asked live (in parallel) and merged in
+    coverage = {} if fresh else cost_coverage(providers)
+    stored = [provider for provider in providers if provider in coverage and coverage[provider] <= end_date]
+    ranges = {}
+    for provider in providers:
+        if provider not in coverage:
+            ranges[provider] = (start_date, end_date)
+        elif start_date < coverage[provider]:
+            ranges[provider] = (start_date, min(coverage[provider] - datetime.timedelta(days=1), end_date))
+    rows, meta = [], {"source": "live" if not stored else "warehouse" if not ranges else "mixed"}
+    if stored:
+        rows, meta["table"] = stored_cost_groups(stored, start_date, end_date, group_by, bucket)
+        meta["covered_from"] = {provider: max(coverage[provider], start_date) for provider in stored}
+    if ranges:
+        records, meta["providers"] = fetch_live_costs(ranges)
+        # Stored rows are already grouped, grouping them again with the live records only merges equal keys
+        rows = group_records(records + rows, group_by, bucket)
+    return rows, meta
@@ -0,0 +1,217 @@
+import datetime
+import logging
+from collections import defaultdict
+from decimal import Decimal
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Max, Sum
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from cloud_providers.models import CloudProvider, Cost, CostDailyRollup, CostMonthlyRollup, Instance, Storage
+from cloud_providers.services.manager_registry import get_manager
+
+logger = logging.getLogger(__name__)
+
+# Hetzner has no billing API, its costs are estimated from the prices of its servers
+COST_PROVIDERS = ('aws', 'azure', 'gcp', 'hetzner')
+
+# First matching keyword of the service name decides the resource type of a cost line
+RESOURCE_TYPE_KEYWORDS = (
+    ('instance', ('compute', 'ec2', 'virtual machine', 'instance', 'server')),
+    ('storage', ('storage', 's3', 'blob', 'disk', 'backup', 'snapshot')),
+    ('cluster', ('kubernetes', 'eks', 'aks', 'gke', 'container')),
+    ('network', ('network', 'bandwidth', 'load balanc', 'ip address', 'cloudfront', 'dns', 'vpc', 'data transfer')),
+    ('database', ('sql', 'database', 'rds', 'dynamo', 'cosmos')),
+)
+
+
+def resource_type_for(service):
+    service = (service or '').lower()
+    for resource_type, keywords in RESOURCE_TYPE_KEYWORDS:
+        if any(keyword in service for keyword in keywords):
+            return resource_type
+    return 'other'
+
+
+def _as_date(value):
+    return value if isinstance(value, datetime.date) else parse_date(str(value)[:10])
+
+
+def _instances_by_resource_id(cloud_provider):
+    # Azure reports lower-cased ARM ids, match case-insensitively
+    return {
+        instance_id.lower(): pk
+        for pk, instance_id in Instance.objects.filter(provider=cloud_provider).values_list('pk', 'instance_id')
+    }
+
+
+def _storages_by_name(cloud_provider):
+    return {
+        storage_id.lower(): pk
+        for pk, storage_id in Storage.objects.filter(provider=cloud_provider).values_list('pk', 'storage_id')
+    }
+
+
+def _storage_name(resource_id):
+    # Bucket names are reported as is, Azure storage accounts as ARM ids ending with the account name
+    return resource_id.rstrip('/').rsplit('/', 1)[-1].lower()
+
+
+ROLLUP_FIELDS = ['provider', 'service', 'resource_type', 'currency']
+
+
+def _upsert_rollup(model, date_field, cloud_provider, since, rows, now):
+    # Writes the recomputed periods from `since` on and drops the ones that no longer have any cost
+    model.objects.bulk_create(
+        [model(provider=cloud_provider, updated_at=now, **row) for row in rows],
+        batch_size=settings.COST_INGEST_BATCH_SIZE, update_conflicts=True,
+        unique_fields=[*ROLLUP_FIELDS, date_field], update_fields=['amount', 'updated_at']
+    )
+    stale = model.objects.filter(provider=cloud_provider, updated_at__lt=now)
+    if since:
+        stale = stale.filter(**{f'{date_field}__gte': since})
+    stale.delete()
+
+
+def refresh_rollups(cloud_provider, since=None):
+    # Re-sums the cost lines of the days from `since` on (all of them when None) into the daily rollup, then the
+    # months those days belong to into the monthly rollup
+    now = timezone.now()
+    lines = Cost.objects.filter(provider=cloud_provider)
+    if since:
+        lines = lines.filter(date__gte=since)
+    daily = lines.values('service', 'resource_type', 'currency', day=F('date')).annotate(amount=Sum('amount'))
+    _upsert_rollup(CostDailyRollup, 'day', cloud_provider, since, daily, now)
+
+    month_start = since.replace(day=1) if since else None
+    days = CostDailyRollup.objects.filter(provider=cloud_provider)
+    if month_start:
+        days = days.filter(day__gte=month_start)
+    monthly = days.annotate(period=TruncMonth('day')).values('service', 'resource_type', 'currency', 'period').annotate(
+        amount=Sum('amount'))
+    rows = [
+        {'service': row['service'], 'resource_type': row['resource_type'], 'currency': row['currency'],
+         'month': _as_date(row['period']), 'amount': row['amount']}
+        for row in monthly
+    ]
+    _upsert_rollup(CostMonthlyRollup, 'month', cloud_provider, month_start, rows, now)
+
+
+def rollups_ready(providers):
+    # The rollups are filled by the first ingestion that maintains them, until then the cost lines are read
+    with_lines = set(Cost.objects.filter(provider__name__in=providers).values_list('provider__name', flat=True).distinct())
+    rolled_up = set(
+        CostDailyRollup.objects.filter(provider__name__in=providers).values_list('provider__name', flat=True).distinct())
+    return with_lines <= rolled_up
+
+
+def ingest_provider_costs(provider, today=None):
+    # Re-reads every day that is not final yet (and, on the first run, the last COST_INGEST_LOOKBACK_DAYS days),
+    # replaces the stored lines of those days and marks the days older than COST_FINAL_AFTER_DAYS final
+    today = today or timezone.now().date()
+    cloud_provider, _ = CloudProvider.objects.get_or_create(name=provider)
+    last_final = Cost.objects.filter(provider=cloud_provider, is_final=True).aggregate(Max('date'))['date__max']
+    start_date = last_final + datetime.timedelta(days=1) if last_final else today - datetime.timedelta(
+        days=settings.COST_INGEST_LOOKBACK_DAYS)
+    end_date = today + datetime.timedelta(days=1)
+    final_before = today - datetime.timedelta(days=settings.COST_FINAL_AFTER_DAYS)
+
+    records = get_manager(provider).get_daily_costs(start_date, end_date)
+    instances = _instances_by_resource_id(cloud_provider)
+    storages = _storages_by_name(cloud_provider)
+    rows = []
+    for record in records:
+        day = _as_date(record['date'])
+        resource_id = record.get('resource_id') or ''
+        resource_type = resource_type_for(record['service'])
+        rows.append(Cost(
+            provider=cloud_provider,
+            instance_id=instances.get(resource_id.lower()),
+            storage_id=storages.get(_storage_name(resource_id)) if resource_type == 'storage' and resource_id else None,
+            resource_type=resource_type,
+            service=record['service'] or '',
+            resource_id=resource_id,
+            amount=Decimal(str(record['amount'])),
+            currency=record['currency'] or '',
+            date=day,
+            is_final=day < final_before
+        ))
+
+    with transaction.atomic():
+        Cost.objects.filter(provider=cloud_provider, date__gte=start_date).delete()
+        Cost.objects.bulk_create(rows, batch_size=settings.COST_INGEST_BATCH_SIZE)
+        # Rolls up everything on the first run, then only the days just replaced
+        has_rollups = CostDailyRollup.objects.filter(provider=cloud_provider).exists()
+        refresh_rollups(cloud_provider, start_date if has_rollups else None)
+        cloud_provider.costs_ingested_at = timezone.now()
+        cloud_provider.costs_ingested_from = min(start_date, cloud_provider.costs_ingested_from or start_date)
+        cloud_provider.save(update_fields=['costs_ingested_at', 'costs_ingested_from'])
+    logger.info(f"[costs] {provider}: {len(rows)} lines from {start_date} to {today}")
+    return {'from': start_date, 'to': today, 'lines': len(rows)}
+
+
+def ingest_costs(providers=None):
+    report = {}
+    for provider in providers or COST_PROVIDERS:
+        try:
+            report[provider] = ingest_provider_costs(provider)
+        except Exception as e:
+            logger.error(f"[costs] ingesting {provider} costs failed: {e}")
+            report[provider] = {'error': str(e)}
+    return report
+
+
+def cost_coverage(providers):
+    # First stored day of every ingested provider, the days before it are only known to the provider itself
+    return dict(
+        CloudProvider.objects.filter(name__in=providers, costs_ingested_at__isnull=False, costs_ingested_from__isnull=False)
+        .values_list('name', 'costs_ingested_from')
+    )
+
+
+def costs_ingested(providers, start_date=None):
+    # Whether the stored costs answer for every provider, from `start_date` on when given
+    coverage = cost_coverage(providers)
+    return all(
+        provider in coverage and (start_date is None or coverage[provider] <= start_date) for provider in providers)
+
+
+def _resource_group(resource_id):
+    parts = resource_id.split('/')
+    lowered = [part.lower() for part in parts]
+    if 'resourcegroups' in lowered:
+        index = lowered.index('resourcegroups') + 1
+        if index < len(parts):
+            return parts[index].lower()
+    return ''
+
+
+def stored_azure_costs(start_date, end_date, dimension):
+    # Rebuilds the Cost Management query response (properties.columns/rows) from the stored lines, grouped by day
+    # and `dimension` ('ResourceGroup' or 'ServiceName')
+    lines = (
+        Cost.objects.filter(provider__name='azure', date__gte=start_date, date__lte=end_date)
+        .values('date', 'service', 'resource_id', 'currency')
+        .annotate(amount=Sum('amount'))
+    )
+    totals = defaultdict(Decimal)
+    for line in lines:
+        key = line['service'] if dimension == 'ServiceName' else _resource_group(line['resource_id'])
+        totals[(int(line['date'].strftime('%Y%m%d')), key, line['currency'])] += line['amount']
+    return {
+        "properties": {
+            "nextLink": None,
+            "columns": [
+                {"name": "Cost", "type": "Number"},
+                {"name": "UsageDate", "type": "Number"},
+                {"name": dimension, "type": "String"},
+                {"name": "Currency", "type": "String"}
+            ],
+            "rows": [
+                [float(amount), usage_date, key, currency]
+                for (usage_date, key, currency), amount in sorted(totals.items())
+            ]
+        }
+    }
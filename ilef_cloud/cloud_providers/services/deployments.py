@@ -0,0 +1,96 @@
+import threading
+from django.conf import settings
+
+from cloud_providers.services.manager_registry import get_manager
+from cloud_providers.services.shared import inspect_image
+
+# Every Azure deployment shares one virtual network, subnet and NSG. Concurrent PUTs on them fail with
+# AnotherOperationInProgress, and a vnet PUT resets the subnet's NSG association under the other hosts, so they are
+# set up by one deployment at a time and only once per set of open ports.
+_azure_network_lock = threading.Lock()
+_azure_networks_ready = set()
+
+
+def prepare_azure_network(manager, vnet_name, subnet_name, nsg_name, ports):
+    key = (vnet_name, subnet_name, nsg_name, tuple(sorted(set(ports))))
+    with _azure_network_lock:
+        if key in _azure_networks_ready:
+            return
+        manager.create_virtual_network(vnet_name, subnet_name)
+        manager.create_network_security_group(nsg_name, ports)
+        manager.associate_nsg_with_subnet(vnet_name, subnet_name, nsg_name)
+        # The NSG now only opens these ports, other port sets must rewrite it
+        _azure_networks_ready.clear()
+        _azure_networks_ready.add(key)
+
+
+def deploy_docker_image(provider, server_name, server_type, os_image, image, ssh_key_id=None, ports=None, on_step=None):
+    if provider == 'hetzner':
+        if not ssh_key_id:
+            ssh_key_id = settings.HETZNER_DEFAULT_KEY_NAME
+        manager = get_manager('hetzner')
+        return manager.create_docker_image_server(
+            server_name, server_type, image, os_image, ssh_key_id, ports=ports, on_step=on_step)
+    elif provider == 'gcp':
+        image_family = os_image.get('image_family')
+        image_project = os_image.get('image_project')
+        manager = get_manager('gcp')
+        source_image = f"projects/{image_project}/global/images/family/{image_family}"
+        return manager.create_docker_image_server(
+            server_name, server_type, image, source_image, ports=ports, on_step=on_step)
+    elif provider == 'aws':
+        if not ssh_key_id:
+            ssh_key_id = settings.AWS_DEFAULT_KEY_NAME
+        image_id = os_image.get('image_id')
+        manager = get_manager('aws')
+        return manager.create_docker_image_server(
+            instance_name=server_name,
+            image_id=image_id,
+            instance_type=server_type,
+            key_name=ssh_key_id,
+            image=image,
+            ssh_private_key=settings.AWS_SSH_PRIVATE_KEY,
+            ports=ports,
+            on_step=on_step
+        )
+    elif provider == 'azure':
+        if not ssh_key_id:
+            ssh_key_id = settings.SSH_PUBLIC_KEY
+        ssh_private_key = settings.SSH_PRIVATE_KEY
+        if ports is None:
+            ports = inspect_image(image)
+        image_reference = {
+            'publisher': os_image.get('publisher', 'Canonical'),
+            'offer': os_image.get('offer', '0001-com-ubuntu-server-jammy'),
+            'sku': os_image.get('sku', '22_04-lts'),
+            'version': os_image.get('version', 'latest')
+        }
+        manager = get_manager('azure')
+        vnet_name = 'my-vnet'
+        subnet_name = 'my-subnet'
+        nsg_name = 'my-nsg'
+        nic_name = f'{server_name}-nic'
+        public_ip_name = f'{server_name}-ip'
+
+        # Create network resources
+        manager.report_step(on_step, 'open_ports')
+        prepare_azure_network(manager, vnet_name, subnet_name, nsg_name, ports + [22, 80])
+        manager.create_network_interface(nic_name, vnet_name, subnet_name, public_ip_name)
+
+        # Create VM with the specified image
+        manager.report_step(on_step, 'create_instance')
+        manager.create_instance(server_name, server_type, image_reference, None, ssh_key_id, nic_name=nic_name)
+
+        # Get public IP address of the VM
+        public_ip_info = manager.network_client.public_ip_addresses.get(manager.resource_group, public_ip_name)
+        public_ip_address = public_ip_info.ip_address
+
+        # Install Docker and run the container
+        manager.report_step(on_step, 'wait_for_ssh')
+        manager.wait_for_ssh(
+            public_ip_address, ssh_private_key, image=f"{image_reference['offer']}:{image_reference['sku']}")
+        manager.report_step(on_step, 'install_docker')
+        manager.install_docker(public_ip_address, ssh_private_key)
+        manager.report_step(on_step, 'run_container')
+        return manager.run_docker_container(public_ip_address, image, ports, ssh_private_key)
+    raise ValueError(f"Invalid provider: {provider}")
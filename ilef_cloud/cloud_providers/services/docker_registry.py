@@ -0,0 +1,157 @@
+import json
+import logging
+import threading
+import time
+import requests
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+DOCKER_HUB_REGISTRY = 'registry-1.docker.io'
+
+MANIFEST_LIST_TYPES = (
+    'application/vnd.docker.distribution.manifest.list.v2+json',
+    'application/vnd.oci.image.index.v1+json',
+)
+MANIFEST_ACCEPT = ', '.join(MANIFEST_LIST_TYPES + (
+    'application/vnd.docker.distribution.manifest.v2+json',
+    'application/vnd.oci.image.manifest.v1+json',
+))
+
+
+class RegistryError(Exception):
+    pass
+
+
+def parse_reference(image):
+    # "nexus:8082/team/app:1.0" -> ("nexus:8082", "team/app", "1.0"), "nginx" -> ("registry-1.docker.io", "library/nginx", "latest")
+    name, reference = image, 'latest'
+    if '@' in name:
+        name, reference = name.split('@', 1)
+    elif ':' in name.rsplit('/', 1)[-1]:
+        name, reference = name.rsplit(':', 1)
+
+    parts = name.split('/', 1)
+    if len(parts) == 2 and ('.' in parts[0] or ':' in parts[0] or parts[0] == 'localhost'):
+        registry, repository = parts
+    else:
+        registry, repository = DOCKER_HUB_REGISTRY, name
+    if registry in ('docker.io', 'index.docker.io'):
+        registry = DOCKER_HUB_REGISTRY
+    if registry == DOCKER_HUB_REGISTRY and '/' not in repository:
+        repository = f'library/{repository}'
+    return registry, repository, reference
+
+
+def parse_challenge(header):
+    # 'Bearer realm="https://auth.docker.io/token",service="registry.docker.io"' -> ("bearer", {...})
+    scheme, _, params = header.partition(' ')
+    values = {}
+    for item in params.split(','):
+        key, _, value = item.strip().partition('=')
+        if key:
+            values[key] = value.strip('"')
+    return scheme.lower(), values
+
+
+# Reads image manifests and config blobs over the Registry v2 HTTP API, so exposed ports are known from a few
+# kilobytes instead of a full pull through the docker daemon
+class RegistryClient:
+    def __init__(self, timeout=None):
+        self.timeout = timeout or settings.DOCKER_REGISTRY_TIMEOUT
+        self.session = requests.Session()
+        self._lock = threading.Lock()
+        self._tokens = {}
+
+    def _scheme(self, registry):
+        host = registry.split(':')[0]
+        # Our Nexus registry and local stand-in registries only speak plain http
+        if host in (settings.NEXUS_REGISTRY_URL, 'localhost', '127.0.0.1'):
+            return 'http'
+        return 'https'
+
+    def _credentials(self, registry):
+        if registry == DOCKER_HUB_REGISTRY:
+            return settings.DOCKER_HUB_USERNAME, settings.DOCKER_HUB_PASSWORD
+        if registry.split(':')[0] == settings.NEXUS_REGISTRY_URL:
+            return settings.NEXUS_REGISTRY_USERNAME, settings.NEXUS_REGISTRY_PASSWORD
+        return None
+
+    def _cached_token(self, registry, repository):
+        with self._lock:
+            token, expires_at = self._tokens.get((registry, repository), (None, 0))
+        return token if token and time.monotonic() < expires_at else None
+
+    def _fetch_token(self, registry, repository, challenge):
+        params = {'scope': challenge.get('scope') or f'repository:{repository}:pull'}
+        if challenge.get('service'):
+            params['service'] = challenge['service']
+        credentials = self._credentials(registry)
+        response = self.session.get(
+            challenge['realm'], params=params, auth=credentials if credentials and all(credentials) else None,
+            timeout=self.timeout)
+        response.raise_for_status()
+        body = response.json()
+        token = body.get('token') or body.get('access_token')
+        # Renew a little before the registry would reject the token
+        expires_in = int(body.get('expires_in') or 60)
+        with self._lock:
+            self._tokens[(registry, repository)] = (token, time.monotonic() + max(expires_in - 10, 1))
+        return token
+
+    def _request(self, method, registry, repository, path, headers=None):
+        url = f'{self._scheme(registry)}://{registry}/v2/{repository}/{path}'
+        headers = dict(headers or {})
+        token = self._cached_token(registry, repository)
+        if token:
+            headers['Authorization'] = f'Bearer {token}'
+        response = self.session.request(method, url, headers=headers, timeout=self.timeout)
+        if response.status_code == 401:
+            scheme, challenge = parse_challenge(response.headers.get('WWW-Authenticate', ''))
+            if scheme == 'bearer' and challenge.get('realm'):
+                headers['Authorization'] = f'Bearer {self._fetch_token(registry, repository, challenge)}'
+                response = self.session.request(method, url, headers=headers, timeout=self.timeout)
+            elif scheme == 'basic' and self._credentials(registry):
+                headers.pop('Authorization', None)
+                response = self.session.request(
+                    method, url, headers=headers, auth=self._credentials(registry), timeout=self.timeout)
+        if response.status_code >= 400:
+            raise RegistryError(f"{method} {url} returned {response.status_code}")
+        return response
+
+    def resolve_digest(self, image):
+        registry, repository, reference = parse_reference(image)
+        if reference.startswith('sha256:'):
+            return reference
+        response = self._request('HEAD', registry, repository, f'manifests/{reference}', {'Accept': MANIFEST_ACCEPT})
+        return response.headers.get('Docker-Content-Digest')
+
+    def get_manifest(self, registry, repository, reference):
+        response = self._request('GET', registry, repository, f'manifests/{reference}', {'Accept': MANIFEST_ACCEPT})
+        manifest = response.json()
+        digest = response.headers.get('Docker-Content-Digest') or (reference if reference.startswith('sha256:') else '')
+        media_type = manifest.get('mediaType') or response.headers.get('Content-Type', '').split(';')[0]
+        if media_type in MANIFEST_LIST_TYPES or 'manifests' in manifest:
+            # Multi-platform image: our servers are linux/amd64
+            platform_manifest = next((
+                m for m in manifest['manifests']
+                if m.get('platform', {}).get('os') == 'linux' and m.get('platform', {}).get('architecture') == 'amd64'
+            ), None)
+            if platform_manifest is None:
+                raise RegistryError(f"No linux/amd64 manifest for {repository}:{reference}")
+            response = self._request(
+                'GET', registry, repository, f"manifests/{platform_manifest['digest']}", {'Accept': MANIFEST_ACCEPT})
+            manifest = response.json()
+        return digest, manifest
+
+    def inspect(self, image):
+        registry, repository, reference = parse_reference(image)
+        digest, manifest = self.get_manifest(registry, repository, reference)
+        if 'config' not in manifest:
+            raise RegistryError(f"Unsupported manifest for {image}: {manifest.get('mediaType')}")
+        config = json.loads(self._request('GET', registry, repository, f"blobs/{manifest['config']['digest']}").content)
+        exposed_ports = config.get('config', {}).get('ExposedPorts') or {}
+        return digest, [int(port.split('/')[0]) for port in exposed_ports]
+
+
+registry_client = RegistryClient()
@@ -0,0 +1,43 @@
+import re
+from django.conf import settings
+
+from cloud_providers.services.concurrency import iter_bounded
+
+RANGE_PATTERN = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def parse_range(header, size):
+    # Returns the inclusive (start, end) of a single "bytes=" range, or None to send the whole object
+    if not header:
+        return None
+    match = RANGE_PATTERN.match(header.strip())
+    if not match or match.groups() == ('', ''):
+        # Multiple ranges and other units are not supported, RFC 9110 allows ignoring the header
+        return None
+    first, last = match.groups()
+    if first and last and int(last) < int(first):
+        # An invalid range, not an unsatisfiable one: RFC 9110 ignores it
+        return None
+    if first:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    else:
+        # "bytes=-500": the last 500 bytes
+        start = max(size - int(last), 0)
+        end = size - 1
+    if start >= size:
+        raise RangeNotSatisfiable(f"bytes */{size}")
+    return start, end
+
+
+def iter_object(read_range, start, end, chunk_size=None, concurrency=None):
+    # Yields the bytes start..end (inclusive) with several ranged GETs in flight. The first chunk is sent as soon as
+    # it arrives while the following ones are already being fetched.
+    chunk_size = chunk_size or settings.DOWNLOAD_CHUNK_SIZE
+    concurrency = concurrency or settings.DOWNLOAD_CONCURRENCY
+    ranges = ((offset, min(offset + chunk_size, end + 1) - 1) for offset in range(start, end + 1, chunk_size))
+    return iter_bounded(lambda chunk_range: read_range(*chunk_range), ranges, concurrency)
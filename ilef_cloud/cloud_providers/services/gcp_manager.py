@@ -7,7 +7,7 @@ from typing import Any
 from django.utils.crypto import get_random_string
 from google.cloud import billing_v1
 from google.oauth2 import service_account
-from google.cloud import compute_v1, storage
+from google.cloud import bigquery, compute_v1, storage
 from google.api_core.extended_operation import ExtendedOperation
 from django.conf import settings
 import logging
@@ -16,6 +16,7 @@ from google.cloud import container_v1
 import subprocess
 from cloud_providers.services.base import BaseCloudManager, logger
 from cloud_providers.services.shared import inspect_image
+from cloud_providers.services.operations import OperationFailed, OperationTimeout, operation_tracker
 
 GCP_STATUS_MAP = {
     'PROVISIONING': 'pending',
@@ -27,7 +28,37 @@ GCP_STATUS_MAP = {
 }
 
 
+class GCPZoneOperations:
+    # Polls the zone operations of a project, every due operation in one filtered list call
+    name = 'gcp zone operation'
+    max_batch = 50
+
+    def __init__(self, client, project, zone):
+        self.client = client
+        self.project = project
+        self.zone = zone
+
+    def poll(self, names):
+        operation_filter = ' OR '.join(f'(name = "{name}")' for name in names)
+        operations = {
+            operation.name: operation
+            for operation in self.client.list(project=self.project, zone=self.zone, filter=operation_filter)
+        }
+        results = []
+        for name in names:
+            operation = operations.get(name)
+            if operation is None or operation.status != compute_v1.Operation.Status.DONE:
+                results.append((False, None, None))
+            elif operation.error and operation.error.errors:
+                results.append((True, None, OperationFailed(f"Operation {name} failed: {operation.error.errors[0].message}")))
+            else:
+                results.append((True, operation, None))
+        return results
+
+
 class GCPManager(BaseCloudManager):
+    provider = 'gcp'
+
     def __init__(self, os_username='ubuntu'):
         super().__init__(os_username)
         self.credentials = service_account.Credentials.from_service_account_info(settings.GCP_SERVICE_ACCOUNT_INFO)
@@ -35,11 +66,19 @@ class GCPManager(BaseCloudManager):
         self.zone_operations_client = compute_v1.ZoneOperationsClient(credentials=self.credentials)
         self.project = settings.GCP_PROJECT_ID
         self.zone = settings.GCP_ZONE
+        self.zone_operations = GCPZoneOperations(self.zone_operations_client, self.project, self.zone)
         self.billing_client = billing_v1.CloudBillingClient(credentials=self.credentials)
         self.billing_account_id = settings.GCP_BILLING_ACCOUNT_ID
         self.os_username = os_username
         self.cluster_client = container_v1.ClusterManagerClient(credentials=self.credentials)
         self.location = f"projects/{self.project}/locations/{self.zone}"
+        self._storage_client = None
+
+    def get_storage_client(self):
+        # Built on first use and then reused, the manager itself is shared between requests
+        if self._storage_client is None:
+            self._storage_client = storage.Client(credentials=self.credentials, project=self.project)
+        return self._storage_client
 
     def list_instances(self):
         request = compute_v1.ListInstancesRequest(project=self.project, zone=self.zone)
@@ -103,19 +142,19 @@ class GCPManager(BaseCloudManager):
     def manage_instance(self, action, instance_name):
         method = getattr(self.compute_client, action)
         operation = method(project=self.project, zone=self.zone, instance=instance_name)
-        operation.result()
+        self._wait_for_operation(operation, f"{action} {instance_name}")
         return {"status": action}
 
     def terminate_instance(self, instance_name):
         return self.manage_instance('delete', instance_name)
 
     def list_buckets(self):
-        storage_client = storage.Client(credentials=self.credentials, project=self.project)
+        storage_client = self.get_storage_client()
         buckets = list(storage_client.list_buckets())
         return buckets
 
     def manage_bucket(self, action, bucket_name, location='US'):
-        storage_client = storage.Client(credentials=self.credentials, project=self.project)
+        storage_client = self.get_storage_client()
         if action == 'create_bucket':
             method = getattr(storage_client, action)
             bucket = storage_client.bucket(bucket_name)
@@ -127,7 +166,7 @@ class GCPManager(BaseCloudManager):
             return {"status": "deleted"}
 
     def manage_file(self, action, file_path, bucket_name, object_name=None):
-        storage_client = storage.Client(credentials=self.credentials, project=self.project)
+        storage_client = self.get_storage_client()
         bucket = storage_client.bucket(bucket_name)
         blob = bucket.blob(object_name or file_path)
         if action == 'upload_from_filename':
@@ -137,20 +176,56 @@ class GCPManager(BaseCloudManager):
             blob.download_to_filename(file_path)
             return {"status": "downloaded"}
 
+    def upload_stream(self, file_obj, bucket_name, object_name, size=None, content_type=None):
+        storage_client = self.get_storage_client()
+        blob = storage_client.bucket(bucket_name).blob(object_name)
+        # A resumable upload fed straight from the request file, one chunk in memory at a time
+        blob.chunk_size = settings.UPLOAD_PART_SIZE
+        blob.upload_from_file(file_obj, size=size, content_type=content_type)
+        return {"status": "uploaded"}
+
+    def get_object_info(self, bucket_name, object_name):
+        blob = self.get_storage_client().bucket(bucket_name).get_blob(object_name)
+        if blob is None:
+            raise FileNotFoundError(f"Object {object_name} not found in bucket {bucket_name}")
+        return blob.size, blob.content_type
+
+    def read_range(self, bucket_name, object_name, start, end):
+        blob = self.get_storage_client().bucket(bucket_name).blob(object_name)
+        return blob.download_as_bytes(start=start, end=end)
+
     def list_objects(self, bucket_name):
-        storage_client = storage.Client(credentials=self.credentials, project=self.project)
+        storage_client = self.get_storage_client()
         blobs = list(storage_client.list_blobs(bucket_name))
         return blobs
 
+    def iter_objects(self, bucket_name, prefix=None, start_after=None):
+        # Yields (name, object) in name order, the client fetches the pages lazily
+        blobs = self.get_storage_client().list_blobs(bucket_name, prefix=prefix, start_offset=start_after)
+        for blob in blobs:
+            if blob.name == start_after:
+                # start_offset is inclusive
+                continue
+            yield blob.name, {
+                "id": blob.etag,
+                "provider": "gcp",
+                "bucket": bucket_name,
+                "name": blob.name,
+                "size": blob.size,
+                "etag": blob.etag,
+                "last_modified": blob.updated,
+                "created_at": blob.time_created
+            }
+
     def delete_object(self, bucket_name, object_name):
-        storage_client = storage.Client(credentials=self.credentials, project=self.project)
+        storage_client = self.get_storage_client()
         bucket = storage_client.bucket(bucket_name)
         blob = bucket.blob(object_name)
         blob.delete()
         return {"status": "deleted"}
 
     def generate_presigned_url(self, bucket_name, object_name, expiration=3600):
-        storage_client = storage.Client(credentials=self.credentials, project=self.project)
+        storage_client = self.get_storage_client()
         bucket = storage_client.bucket(bucket_name)
         blob = bucket.blob(object_name)
 
@@ -161,8 +236,9 @@ class GCPManager(BaseCloudManager):
         url = blob.generate_signed_url(expiration=expiration_time, version='v4')
         return url
 
-    def create_docker_image_server(self, name, machine_type, image, source_image, ssh_key_path=settings.SSH_PUBLIC_KEY, ssh_private_key_path=settings.SSH_PRIVATE_KEY):
+    def create_docker_image_server(self, name, machine_type, image, source_image, ssh_key_path=settings.SSH_PUBLIC_KEY, ssh_private_key_path=settings.SSH_PRIVATE_KEY, ports=None, on_step=None):
         # Create the instance
+        self.report_step(on_step, 'create_instance')
         instance = self.create_instance(name, machine_type, source_image, ssh_key_path)
         print(f'name=> {name}')
         print(f'instance=> {instance}')
@@ -172,17 +248,22 @@ class GCPManager(BaseCloudManager):
 
         print(f'ip_address: {ip_address}')
         # Wait for SSH to be available and install Docker on the instance
-        self.wait_for_ssh(ip_address, ssh_private_key_path)
+        self.report_step(on_step, 'wait_for_ssh')
+        self.wait_for_ssh(ip_address, ssh_private_key_path, image=source_image.rsplit('/', 1)[-1])
+        self.report_step(on_step, 'install_docker')
         self.install_docker(ip_address, ssh_private_key_path)
 
         # Inspect the image to get the necessary ports
-        ports = inspect_image(image)
+        if ports is None:
+            ports = inspect_image(image)
 
         # Create a firewall rule to allow traffic on the necessary ports
+        self.report_step(on_step, 'open_ports')
         network = instance.network_interfaces[0].network
         self.create_firewall_rule(f"firewall-{name}-{get_random_string(4).lower()}", network, list(map(str, ports)) + ["22", "80"])
 
         # Run the Docker container
+        self.report_step(on_step, 'run_container')
         container_name = f"{name}_container"
         port_mappings = ' '.join([f'-p 80:{port}' for port in ports])
         run_container_command = f'sudo docker run -d --name {container_name} {port_mappings} {image}'
@@ -190,7 +271,7 @@ class GCPManager(BaseCloudManager):
 
         if error:
             logger.error(f"Failed to start Docker container {container_name}: {error}")
-            list_containers_command = 'docker ps --format "{{.Names}}"'
+            list_containers_command = 'sudo docker ps --format "{{.Names}}"'
             output, error = self.run_ssh_command(ip_address, list_containers_command, ssh_private_key_path)
             if container_name in output.strip():
                 logger.info(f"Docker container {container_name} is running despite the error.")
@@ -221,22 +302,19 @@ class GCPManager(BaseCloudManager):
         return firewall_client.get(project=self.project, firewall=firewall_rule_name)
 
     def _wait_for_operation(self, operation, verbose_name="operation"):
-        while not operation.done:
-            logger.info(f"Waiting for {verbose_name}...")
-            time.sleep(1)
-            operation = self.zone_operations_client.get(project=self.project, zone=self.zone, operation=operation.name)
-        if operation.error:
-            logger.error(f"Failed to complete {verbose_name}: {operation.error}")
-            raise Exception(f"Failed to complete {verbose_name}: {operation.error}")
+        logger.info(f"Waiting for {verbose_name}...")
+        return operation_tracker.wait(self.zone_operations, operation.name, description=verbose_name)
 
     def _wait_for_network_interfaces(self, name):
-        for _ in range(10):
+        def network_ready():
             instance = self.compute_client.get(project=self.project, zone=self.zone, instance=name)
-            if instance.network_interfaces[0].network_i_p:
-                return instance
-            logger.info("Waiting for network interfaces to be ready...")
-            time.sleep(5)
-        raise Exception("Network interfaces not available after retries")
+            return instance if instance.network_interfaces[0].network_i_p else None
+
+        try:
+            return operation_tracker.wait_until(
+                network_ready, description=f"network interfaces of {name}", timeout=settings.GCP_NETWORK_READY_TIMEOUT)
+        except OperationTimeout:
+            raise Exception("Network interfaces not available after retries")
 
     def get_cost_and_usage(self, start_date, end_date):
         request = billing_v1.QueryUsageRequest(
@@ -251,6 +329,28 @@ class GCPManager(BaseCloudManager):
         response = self.billing_client.query_usage(request=request)
         return response.usage
 
+    def get_daily_costs(self, start_date, end_date):
+        # The billing API has no cost query, daily costs are read from the Cloud Billing export to BigQuery.
+        # Credits (sustained use, committed use...) are negative amounts and are netted in.
+        if not settings.GCP_BILLING_EXPORT_TABLE:
+            raise ValueError("GCP_BILLING_EXPORT_TABLE is not configured")
+        query = f"""
+            SELECT DATE(usage_start_time) AS day, service.description AS service, currency,
+                   SUM(cost) + SUM(IFNULL((SELECT SUM(credit.amount) FROM UNNEST(credits) AS credit), 0)) AS amount
+            FROM `{settings.GCP_BILLING_EXPORT_TABLE}`
+            WHERE DATE(usage_start_time) >= @start_date AND DATE(usage_start_time) < @end_date
+            GROUP BY day, service, currency
+        """
+        job_config = bigquery.QueryJobConfig(query_parameters=[
+            bigquery.ScalarQueryParameter('start_date', 'DATE', start_date),
+            bigquery.ScalarQueryParameter('end_date', 'DATE', end_date),
+        ])
+        client = bigquery.Client(credentials=self.credentials, project=self.project)
+        return [
+            {'date': row.day, 'service': row.service, 'resource_id': '', 'amount': row.amount, 'currency': row.currency}
+            for row in client.query(query, job_config=job_config).result()
+        ]
+
     def get_cost_by_service(self, start_date, end_date):
         request = billing_v1.QueryUsageRequest(
             billing_account_name=f'billingAccounts/{self.billing_account_id}',
@@ -267,7 +367,9 @@ class GCPManager(BaseCloudManager):
 
     def wait_for_extended_operation(
             self, operation: ExtendedOperation, verbose_name: str = "operation", timeout: int = 300) -> Any:
-        result = operation.result(timeout=timeout)
+        # done() refreshes the operation, the tracker only decides when to call it
+        operation_tracker.wait_until(operation.done, description=verbose_name, timeout=timeout)
+        result = operation.result()
 
         if operation.error_code:
             print(
@@ -308,12 +410,16 @@ class GCPManager(BaseCloudManager):
     def wait_for_cluster(self, cluster_name):
         cluster_location = f"projects/{self.project}/locations/{self.zone}/clusters/{cluster_name}"
         request = container_v1.GetClusterRequest(name=cluster_location)
-        while True:
+
+        def cluster_running():
             cluster = self.cluster_client.get_cluster(request=request)
-            if cluster.status == container_v1.Cluster.Status.RUNNING:
-                break
-            print(f"Waiting for cluster {cluster_name} to be ready...")
-            time.sleep(30)
+            if cluster.status in (container_v1.Cluster.Status.ERROR, container_v1.Cluster.Status.DEGRADED):
+                raise OperationFailed(f"Cluster {cluster_name} is {cluster.status.name}: {cluster.status_message}")
+            return cluster.status == container_v1.Cluster.Status.RUNNING
+
+        print(f"Waiting for cluster {cluster_name} to be ready...")
+        operation_tracker.wait_until(
+            cluster_running, description=f"cluster {cluster_name}", max_interval=settings.CLUSTER_POLL_MAX_INTERVAL)
         print(f"Cluster {cluster_name} is ready.")
 
     def get_gke_credentials(self, cluster_name):
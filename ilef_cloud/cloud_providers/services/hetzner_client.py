@@ -0,0 +1,90 @@
+import logging
+import random
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+HETZNER_API_URL = 'https://api.hetzner.cloud/v1'
+
+# Requests that can safely be sent again after a server error, a POST may already have created something
+IDEMPOTENT_METHODS = ('GET', 'HEAD', 'PUT', 'DELETE')
+
+
+# Talks to the Hetzner Cloud API over one pooled keep-alive session. Rate limited (429) requests are retried once the
+# limit resets, server errors on idempotent requests are retried with exponential backoff, and list endpoints are
+# read page by page until the last one.
+class HetznerClient:
+    def __init__(self, token, api_url=HETZNER_API_URL, timeout=None, max_retries=None):
+        self.api_url = api_url
+        self.timeout = timeout or settings.HETZNER_API_TIMEOUT
+        self.max_retries = settings.HETZNER_API_MAX_RETRIES if max_retries is None else max_retries
+        self.session = requests.Session()
+        self.session.headers.update({'Authorization': f'Bearer {token}'})
+        adapter = HTTPAdapter(pool_maxsize=settings.CLOUD_API_CONCURRENCY)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def _retry_delay(self, response, attempt):
+        # Hetzner sends RateLimit-Reset as the UNIX time at which the bucket is full again
+        if response is not None:
+            reset = response.headers.get('RateLimit-Reset') or ''
+            if reset.isdigit():
+                return min(max(int(reset) - time.time(), 0) + random.uniform(0, 0.5), settings.HETZNER_API_MAX_BACKOFF)
+            retry_after = response.headers.get('Retry-After') or ''
+            if retry_after.isdigit():
+                return min(int(retry_after), settings.HETZNER_API_MAX_BACKOFF)
+        backoff = settings.HETZNER_API_BACKOFF * 2 ** attempt
+        return min(backoff + random.uniform(0, backoff / 2), settings.HETZNER_API_MAX_BACKOFF)
+
+    def request(self, method, path, **kwargs):
+        url = f'{self.api_url}{path}'
+        method = method.upper()
+        for attempt in range(self.max_retries + 1):
+            last_attempt = attempt == self.max_retries
+            try:
+                response = self.session.request(method, url, timeout=self.timeout, **kwargs)
+            except requests.ConnectionError as e:
+                if last_attempt or method not in IDEMPOTENT_METHODS:
+                    raise
+                delay = self._retry_delay(None, attempt)
+                logger.warning(f"[hetzner] {method} {path} failed ({e}), retrying in {delay:.1f}s")
+                time.sleep(delay)
+                continue
+
+            retryable = response.status_code == 429 or (response.status_code >= 500 and method in IDEMPOTENT_METHODS)
+            if not retryable or last_attempt:
+                break
+            delay = self._retry_delay(response, attempt)
+            logger.warning(f"[hetzner] {method} {path} returned {response.status_code}, retrying in {delay:.1f}s")
+            time.sleep(delay)
+
+        response.raise_for_status()
+        if response.content:
+            return response.json()
+        return None
+
+    def get(self, path, params=None):
+        return self.request('GET', path, params=params)
+
+    def post(self, path, json=None):
+        return self.request('POST', path, json=json)
+
+    def delete(self, path):
+        return self.request('DELETE', path)
+
+    def paginate(self, path, key, params=None, per_page=None):
+        # Yields the `key` items of every page, following meta.pagination.next_page
+        params = dict(params or {}, per_page=per_page or settings.HETZNER_API_PAGE_SIZE, page=1)
+        while True:
+            data = self.get(path, params=params)
+            yield from data[key]
+            next_page = ((data.get('meta') or {}).get('pagination') or {}).get('next_page')
+            if not next_page:
+                return
+            params['page'] = next_page
+
+    def list_all(self, path, key, params=None):
+        return list(self.paginate(path, key, params))
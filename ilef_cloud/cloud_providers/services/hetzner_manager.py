@@ -1,8 +1,13 @@
-import requests
+import datetime
 import logging
+from decimal import Decimal
 from django.conf import settings
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 
 from cloud_providers.services.shared import inspect_image
+from cloud_providers.services.hetzner_client import HetznerClient
+from cloud_providers.services.operations import OperationFailed, operation_tracker
 from cloud_providers.services.base import *
 
 # Configure logging
@@ -16,11 +21,40 @@ HETZNER_STATUS_MAP = {
 }
 
 
+class HetznerActions:
+    # Polls Hetzner actions, every due action in one GET /actions?id=..&id=.. call
+    name = 'hetzner action'
+    max_batch = 50
+
+    def __init__(self, client):
+        self.client = client
+
+    def poll(self, action_ids):
+        if len(action_ids) == 1:
+            actions = [self.client.get(f'/actions/{action_ids[0]}')['action']]
+        else:
+            actions = self.client.list_all('/actions', 'actions', params={'id': action_ids})
+        actions = {action['id']: action for action in actions}
+        results = []
+        for action_id in action_ids:
+            action = actions.get(action_id)
+            if action is None or action['status'] == 'running':
+                results.append((False, None, None))
+            elif action['status'] == 'error':
+                error = action.get('error') or {}
+                results.append((True, None, OperationFailed(f"Action {action['command']} failed: {error.get('message')}")))
+            else:
+                results.append((True, action, None))
+        return results
+
+
 class HetznerManager(BaseCloudManager):
+    provider = 'hetzner'
+
     def __init__(self, os_username="root"):
         super().__init__(os_username)
-        self.api_url = 'https://api.hetzner.cloud/v1'
-        self.headers = {'Authorization': f'Bearer {settings.HETZNER_API_TOKEN}'}
+        self.client = HetznerClient(settings.HETZNER_API_TOKEN)
+        self.actions = HetznerActions(self.client)
 
     def serialize_instance(self, instance):
         return {
@@ -36,90 +70,105 @@ class HetznerManager(BaseCloudManager):
         }
 
     def list_instances(self):
-        response = requests.get(f'{self.api_url}/servers', headers=self.headers)
-        response.raise_for_status()
-        serialized_instances = [self.serialize_instance(instance) for instance in response.json()['servers']]
-        return serialized_instances
+        return [self.serialize_instance(instance) for instance in self.client.paginate('/servers', 'servers')]
+
+    def get_daily_costs(self, start_date, end_date):
+        # Hetzner has no billing API, costs are estimated from the hourly gross price of every current server for the
+        # hours of each day it existed. Deleted servers, traffic, volumes and the monthly price cap are not accounted.
+        now = timezone.now()
+        records = []
+        for server in self.client.paginate('/servers', 'servers'):
+            location = server['datacenter']['location']['name']
+            prices = server['server_type']['prices']
+            price = next((price for price in prices if price['location'] == location), prices[0])
+            hourly_price = Decimal(price['price_hourly']['gross'])
+            created = parse_datetime(server['created'])
+            day = start_date
+            while day < end_date:
+                day_start = datetime.datetime.combine(day, datetime.time.min, tzinfo=datetime.timezone.utc)
+                hours = (min(day_start + datetime.timedelta(days=1), now) - max(day_start, created)).total_seconds() / 3600
+                if hours > 0:
+                    records.append({
+                        'date': day,
+                        'service': 'Cloud Servers',
+                        'resource_id': str(server['id']),
+                        'amount': (hourly_price * Decimal(str(round(hours, 4)))).quantize(Decimal('0.000001')),
+                        'currency': 'EUR'
+                    })
+                day += datetime.timedelta(days=1)
+        return records
 
     def create_instance(self, name, server_type, os_image, ssh_key_id=None):
         data = {"name": name, "server_type": server_type, "image": os_image}
         if ssh_key_id:
             data["ssh_keys"] = [ssh_key_id]
         logger.info(f"Creating instance with data: {data}")
-        response = requests.post(f'{self.api_url}/servers', headers=self.headers, json=data)
-        print(response.json())
-        response.raise_for_status()
-        return response.json()
+        return self.client.post('/servers', json=data)
 
     def manage_instance(self, action, instance_id):
-        response = requests.post(f'{self.api_url}/servers/{instance_id}/actions/{action}', headers=self.headers)
-        response.raise_for_status()
-        return response.json()
+        return self.client.post(f'/servers/{instance_id}/actions/{action}')
+
+    def wait_for_actions(self, actions, description):
+        # Tracks all the actions at once, the server is ready when the last one succeeded
+        futures = [
+            operation_tracker.track(self.actions, action['id'], description=f"{description}: {action['command']}")
+            for action in actions
+        ]
+        return [future.result() for future in futures]
 
     def delete_instance(self, instance_id):
-        response = requests.delete(f'{self.api_url}/servers/{instance_id}', headers=self.headers)
-        response.raise_for_status()
-        return response.json()
+        return self.client.delete(f'/servers/{instance_id}')
 
     def list_key_pairs(self):
-        response = requests.get(f'{self.api_url}/ssh_keys', headers=self.headers)
-        response.raise_for_status()
-        return response.json()['ssh_keys']
+        return self.client.list_all('/ssh_keys', 'ssh_keys')
 
     def manage_key_pair(self, action, key_id=None, data=None):
-        url = f'{self.api_url}/ssh_keys'
         if action == 'create':
-            response = requests.post(url, headers=self.headers, json=data)
+            response = self.client.post('/ssh_keys', json=data)
+        elif action == 'delete':
+            response = self.client.delete(f'/ssh_keys/{key_id}')
         else:
-            url = f'{url}/{key_id}'
-            response = requests.delete(url, headers=self.headers) if action == 'delete' else requests.get(url, headers=self.headers)
-        response.raise_for_status()
-        if response.content:
-            return response.json()
+            response = self.client.get(f'/ssh_keys/{key_id}')
+        if response is not None:
+            return response
         return key_id
 
     def open_ports(self, server_id, ports):
         firewall_rules = [{"direction": "in", "source_ips": ["0.0.0.0/0", "::/0"], "port": "22", "protocol": "tcp"}]
         firewall_rules += [{"direction": "in", "source_ips": ["0.0.0.0/0", "::/0"], "port": str(port), "protocol": "tcp"} for port in ports]
         firewall_data = {"name": f"firewall-{server_id}", "apply_to": [{"type": "server", "server": {"id": server_id}}], "rules": firewall_rules}
-        response = requests.post(f'{self.api_url}/firewalls', headers=self.headers, json=firewall_data)
-        response.raise_for_status()
-        return response.json()
+        return self.client.post('/firewalls', json=firewall_data)
 
-    def create_docker_image_server(self, name, server_type, image, os_image, ssh_key_id, ssh_private_key_path=settings.SSH_PRIVATE_KEY):
+    def create_docker_image_server(self, name, server_type, image, os_image, ssh_key_id, ssh_private_key_path=settings.SSH_PRIVATE_KEY, ports=None, on_step=None):
         logger.info("Starting server creation process")
+        self.report_step(on_step, 'create_instance')
         server_info = self.create_instance(name, server_type, os_image, ssh_key_id)
         server_id = server_info['server']['id']
         ip_address = server_info['server']['public_net']['ipv4']['ip']
         root_password = server_info['root_password']
 
+        logger.info("Waiting for the server to be created and started")
+        self.report_step(on_step, 'wait_for_server')
+        self.wait_for_actions([server_info['action']] + server_info.get('next_actions', []), f"server {name}")
+
         logger.info("Waiting for SSH to become available")
-        self.wait_for_ssh(ip_address, ssh_private_key_path)
+        self.report_step(on_step, 'wait_for_ssh')
+        self.wait_for_ssh(ip_address, ssh_private_key_path, image=os_image)
 
         logger.info("Installing Docker on the server")
+        self.report_step(on_step, 'install_docker')
         self.install_docker(ip_address, ssh_private_key_path)
 
-        configure_docker_cmd = (
-            f'sudo mkdir -p /etc/docker && '
-            f'echo \'{{"insecure-registries":["{settings.NEXUS_REGISTRY_URL}:{settings.NEXUS_REGISTRY_DOCKER_PORT}"]}}\' '
-            f'| sudo tee /etc/docker/daemon.json && sudo systemctl restart docker'
-        )
-        self.run_ssh_command(ip_address, configure_docker_cmd, ssh_private_key_path)
-
-        docker_login_cmd = (
-            f'echo {settings.NEXUS_REGISTRY_PASSWORD} | '
-            f'sudo docker login -u {settings.NEXUS_REGISTRY_USERNAME} --password-stdin '
-            f'{settings.NEXUS_REGISTRY_URL}:{settings.NEXUS_REGISTRY_DOCKER_PORT}'
-        )
-        self.run_ssh_command(ip_address, docker_login_cmd, ssh_private_key_path)
-
-        logger.info(f"Inspecting Docker image {image}")
-        ports = inspect_image(image)
+        if ports is None:
+            logger.info(f"Inspecting Docker image {image}")
+            ports = inspect_image(image)
 
         logger.info(f"Opening ports: {ports}")
+        self.report_step(on_step, 'open_ports')
         self.open_ports(server_id, ports + [80])
 
         logger.info(f"Running Docker container with image {image}")
+        self.report_step(on_step, 'run_container')
         container_name = f"{image}-container".replace('/', '-').replace(':', '-').replace(' ', '')
         port_mappings = ' '.join([f'-p 80:{port}' for port in ports])
         run_container_command = f'docker run -d --name {container_name} {port_mappings} {image}'
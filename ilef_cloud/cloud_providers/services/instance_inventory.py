@@ -0,0 +1,104 @@
+import datetime
+import logging
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from cloud_providers.models import CloudProvider, Instance
+from cloud_providers.services.concurrency import fan_out
+from cloud_providers.services.manager_registry import get_manager
+
+logger = logging.getLogger(__name__)
+
+INSTANCE_FIELDS = [
+    'provider', 'name', 'instance_type', 'status', 'zone', 'created_at', 'updated_at', 'private_ip', 'public_ip',
+    'synced_at'
+]
+
+
+def _parse_created_at(value, default):
+    if isinstance(value, datetime.datetime):
+        return value if timezone.is_aware(value) else timezone.make_aware(value, datetime.timezone.utc)
+    if value:
+        parsed = parse_datetime(str(value))
+        if parsed:
+            return parsed if timezone.is_aware(parsed) else timezone.make_aware(parsed, datetime.timezone.utc)
+    return default
+
+
+def _to_instance(cloud_provider, data, now):
+    return Instance(
+        provider=cloud_provider,
+        instance_id=str(data['id']),
+        name=data.get('name') or '',
+        instance_type=data.get('machine_type') or '',
+        status=data.get('status') or '',
+        zone=data.get('zone') or '',
+        created_at=_parse_created_at(data.get('created_at'), now),
+        updated_at=now,
+        private_ip=data.get('network_ip') or None,
+        public_ip=data.get('external_ip') or None,
+        synced_at=now
+    )
+
+
+def store_instances(provider, instances):
+    # Upserts what the provider returned and drops the instances it no longer knows about
+    now = timezone.now()
+    cloud_provider, _ = CloudProvider.objects.get_or_create(name=provider)
+    rows = [_to_instance(cloud_provider, data, now) for data in instances]
+    with transaction.atomic():
+        if rows:
+            Instance.objects.bulk_create(
+                rows, update_conflicts=True, unique_fields=['instance_id'], update_fields=INSTANCE_FIELDS)
+        Instance.objects.filter(provider=cloud_provider).exclude(
+            instance_id__in=[row.instance_id for row in rows]).delete()
+        cloud_provider.instances_synced_at = now
+        cloud_provider.save(update_fields=['instances_synced_at'])
+
+
+def refresh_instances(providers):
+    # Lists the providers live (in parallel) and writes every successful listing to the inventory
+    tasks = {name: (lambda name=name: get_manager(name).list_instances()) for name in providers}
+    results, report = fan_out(tasks)
+    for provider, instances in results.items():
+        try:
+            store_instances(provider, instances)
+        except Exception as e:
+            logger.error(f"[inventory] storing {provider} instances failed: {e}")
+    return results, report
+
+
+def inventory_synced_at(providers):
+    # Oldest refresh of the requested providers, None when one of them was never refreshed
+    synced = dict(CloudProvider.objects.filter(name__in=providers).values_list('name', 'instances_synced_at'))
+    if any(synced.get(provider) is None for provider in providers):
+        return None
+    return min(synced[provider] for provider in providers)
+
+
+def serialize_instance(instance):
+    # Same shape as the managers' serialize_instance
+    return {
+        "provider": instance.provider.name,
+        "id": instance.instance_id,
+        "name": instance.name,
+        "status": instance.status,
+        "created_at": instance.created_at,
+        "zone": instance.zone,
+        "machine_type": instance.instance_type,
+        "network_ip": instance.private_ip,
+        "external_ip": instance.public_ip,
+    }
+
+
+def cached_instances(providers, with_cost=False):
+    instances = Instance.objects.filter(provider__name__in=providers).select_related('provider').order_by('provider__name', 'name')
+    if not with_cost:
+        return [serialize_instance(instance) for instance in instances]
+    return [{**serialize_instance(instance), "total_cost": instance.total_cost()} for instance in instances.with_total_cost()]
+
+
+def instance_costs(instance_ids):
+    # Total cost of each stored instance, by provider instance id, in one query
+    return dict(Instance.objects.filter(instance_id__in=instance_ids).with_total_cost().values_list('instance_id', 'cost_total'))
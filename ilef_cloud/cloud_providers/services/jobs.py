@@ -0,0 +1,124 @@
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from cloud_providers.models import DeploymentJob
+from cloud_providers.services.deployments import deploy_docker_image
+from cloud_providers.services.shared import inspect_image
+
+logger = logging.getLogger(__name__)
+
+# Deployments run here instead of in the request: the pool size bounds how many servers are provisioned at once
+job_executor = ThreadPoolExecutor(max_workers=settings.DEPLOYMENT_WORKERS, thread_name_prefix='deploy')
+# The hosts of a batch mostly wait on the cloud, they get their own pool so a whole batch is provisioned at once
+batch_executor = ThreadPoolExecutor(max_workers=settings.DEPLOYMENT_BATCH_MAX_HOSTS, thread_name_prefix='deploy-batch')
+
+
+class StepRecorder:
+    def __init__(self, job):
+        self.job = job
+        self.current = None
+        self.started = None
+
+    def _close_current(self):
+        if self.current:
+            self.job.timings[self.current] = round(time.monotonic() - self.started, 3)
+
+    def __call__(self, step):
+        self._close_current()
+        self.current = step
+        self.started = time.monotonic()
+        self.job.step = step
+        self.job.save(update_fields=['step', 'timings'])
+
+    def finish(self):
+        self._close_current()
+        self.current = None
+
+
+def run_deployment_job(job_id):
+    close_old_connections()
+    try:
+        job = DeploymentJob.objects.get(pk=job_id)
+        job.state = 'running'
+        job.started_at = timezone.now()
+        job.save(update_fields=['state', 'started_at'])
+
+        recorder = StepRecorder(job)
+        params = job.parameters
+        try:
+            result = deploy_docker_image(
+                job.provider, job.server_name, params.get('server_type'), params.get('os_image'), job.image,
+                ssh_key_id=params.get('ssh_key_id'), ports=params.get('ports'), on_step=recorder
+            )
+            recorder.finish()
+            if isinstance(result, dict) and result.get('error'):
+                job.state = 'failed'
+                job.error = result['error']
+            else:
+                job.state = 'succeeded'
+            job.result = result
+        except Exception as e:
+            recorder.finish()
+            logger.error(f"Deployment job {job_id} failed at step {job.step}: {e}")
+            job.state = 'failed'
+            job.error = str(e)
+        job.finished_at = timezone.now()
+        job.save()
+        logger.info(f"Deployment job {job_id} {job.state} in {(job.finished_at - job.started_at).total_seconds():.1f}s")
+    finally:
+        close_old_connections()
+
+
+def submit_deployment(job):
+    # Only hand the job to a worker once the row is visible to the worker's own DB connection
+    transaction.on_commit(lambda: job_executor.submit(run_deployment_job, job.pk))
+
+
+def run_deployment_batch(job_ids, image):
+    # The image is inspected once for the whole batch, then every host is provisioned by its own worker so the
+    # cloud waiters (instance running, zone operations, server actions, SSH) of all the hosts overlap
+    close_old_connections()
+    try:
+        jobs = list(DeploymentJob.objects.filter(pk__in=job_ids))
+        if any(job.parameters.get('ports') is None for job in jobs):
+            try:
+                ports = inspect_image(image)
+            except Exception as e:
+                logger.error(f"Failed to inspect {image} for deployment batch: {e}")
+                DeploymentJob.objects.filter(pk__in=job_ids).update(
+                    state='failed', step='inspect_image', error=str(e), finished_at=timezone.now())
+                return
+            for job in jobs:
+                if job.parameters.get('ports') is None:
+                    job.parameters['ports'] = ports
+                    job.save(update_fields=['parameters'])
+        for job in jobs:
+            batch_executor.submit(run_deployment_job, job.pk)
+    finally:
+        close_old_connections()
+
+
+def submit_deployment_batch(jobs, image):
+    job_ids = [job.pk for job in jobs]
+    transaction.on_commit(lambda: job_executor.submit(run_deployment_batch, job_ids, image))
+
+
+def recover_jobs(requeue=False):
+    # Jobs live in the executors of the process that accepted them, a restart leaves them queued or running forever.
+    # Running ones may have left a half-provisioned server behind and are failed, queued ones never reached the cloud
+    # and are run again when `requeue` (in this process) or failed.
+    now = timezone.now()
+    running = DeploymentJob.objects.filter(state='running').update(
+        state='failed', error="Interrupted by a restart, check the provider for a partially created server",
+        finished_at=now)
+    queued = list(DeploymentJob.objects.filter(state='queued').values_list('pk', flat=True))
+    if not requeue:
+        DeploymentJob.objects.filter(pk__in=queued).update(
+            state='failed', error="Interrupted by a restart before it started", finished_at=now)
+        return {'failed': running + len(queued), 'requeued': []}
+    futures = [job_executor.submit(run_deployment_job, job_id) for job_id in queued]
+    return {'failed': running, 'requeued': futures}
@@ -0,0 +1,122 @@
+import hashlib
+import logging
+import threading
+import time
+from django.conf import settings
+
+from cloud_providers.services.aws_manager import AWSManager
+from cloud_providers.services.azure_manager import AzureManager
+from cloud_providers.services.gcp_manager import GCPManager
+from cloud_providers.services.hetzner_manager import HetznerManager
+
+logger = logging.getLogger(__name__)
+
+MANAGER_CLASSES = {
+    'aws': AWSManager,
+    'azure': AzureManager,
+    'gcp': GCPManager,
+    'hetzner': HetznerManager
+}
+
+# Settings a manager is built from: when one of them changes (credential rotation) the manager is rebuilt
+CREDENTIAL_SETTINGS = {
+    'aws': ('AWS_ACCESS_KEY_ID', 'AWS_SECRET_ACCESS_KEY'),
+    'azure': ('AZURE_TENANT_ID', 'AZURE_CLIENT_ID', 'AZURE_CLIENT_SECRET', 'AZURE_SUBSCRIPTION_ID', 'AZURE_RESOURCE_GROUP'),
+    'gcp': ('GCP_SERVICE_ACCOUNT_INFO', 'GCP_PROJECT_ID', 'GCP_BILLING_ACCOUNT_ID'),
+    'hetzner': ('HETZNER_API_TOKEN',)
+}
+
+REGION_SETTINGS = {
+    'aws': 'AWS_REGION',
+    'azure': 'AZURE_LOCATION',
+    'gcp': 'GCP_ZONE',
+    'hetzner': None
+}
+
+
+# Process wide cache of cloud managers: building a manager creates the SDK sessions, credentials and clients of its
+# provider, so it is done once per (provider, credential set, region) and shared by the requests of the worker.
+class ManagerRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._build_locks = {}
+        self._managers = {}
+        self._metrics = {}
+
+    def _key(self, provider):
+        credentials = repr([getattr(settings, name, None) for name in CREDENTIAL_SETTINGS[provider]])
+        fingerprint = hashlib.sha256(credentials.encode()).hexdigest()[:12]
+        region_setting = REGION_SETTINGS[provider]
+        region = getattr(settings, region_setting, None) if region_setting else None
+        return provider, fingerprint, region
+
+    def get(self, provider):
+        if provider not in MANAGER_CLASSES:
+            raise ValueError(f"Unknown provider: {provider}")
+        key = self._key(provider)
+        manager = self._managers.get(key)
+        if manager is not None:
+            self._record_hit(key)
+            return manager
+
+        with self._lock:
+            build_lock = self._build_locks.setdefault(key, threading.Lock())
+        with build_lock:
+            # Another thread may have built it while we were waiting for the lock
+            manager = self._managers.get(key)
+            if manager is not None:
+                self._record_hit(key)
+                return manager
+
+            started = time.monotonic()
+            manager = MANAGER_CLASSES[provider]()
+            build_seconds = time.monotonic() - started
+            logger.info(f"[ManagerRegistry] built {provider} manager in {build_seconds:.3f}s")
+
+            with self._lock:
+                # Drop the managers built from credentials that have been rotated since
+                for stale_key in [k for k in self._managers if k[0] == provider and k != key]:
+                    logger.info(f"[ManagerRegistry] discarding {provider} manager built from rotated credentials")
+                    del self._managers[stale_key]
+                    self._build_locks.pop(stale_key, None)
+                previous = self._metrics.pop(key, None) or {'builds': 0, 'hits': 0, 'total_build_seconds': 0.0}
+                self._metrics[key] = {
+                    'builds': previous['builds'] + 1,
+                    'hits': previous['hits'],
+                    'total_build_seconds': previous['total_build_seconds'] + build_seconds,
+                    'last_build_seconds': build_seconds,
+                    'built_at': time.time()
+                }
+                self._managers[key] = manager
+            return manager
+
+    def _record_hit(self, key):
+        metrics = self._metrics.get(key)
+        if metrics:
+            metrics['hits'] += 1
+
+    def invalidate(self, provider=None):
+        with self._lock:
+            for key in [k for k in self._managers if provider in (None, k[0])]:
+                del self._managers[key]
+
+    def metrics(self):
+        with self._lock:
+            return [{
+                'provider': key[0],
+                'credentials': key[1],
+                'region': key[2],
+                'active': key in self._managers,
+                'builds': values['builds'],
+                'hits': values['hits'],
+                'last_build_seconds': round(values['last_build_seconds'], 3),
+                'total_build_seconds': round(values['total_build_seconds'], 3),
+                'built_at': values['built_at']
+            } for key, values in self._metrics.items()]
+
+
+manager_registry = ManagerRegistry()
+
+
+def get_manager(provider):
+    return manager_registry.get(provider)
@@ -0,0 +1,196 @@
+import logging
+from itertools import islice
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from cloud_providers.models import CloudProvider, Storage, StorageObject
+from cloud_providers.services.manager_registry import get_manager
+from cloud_providers.services.object_listing import STORAGE_PROVIDERS, decode_cursor, encode_cursor, list_bucket_names
+
+logger = logging.getLogger(__name__)
+
+STORAGE_TYPES = {
+    'aws': 'S3',
+    'azure': 'Blob',
+    'gcp': 'GCS'
+}
+
+STORAGE_LOCATIONS = {
+    'aws': 'https://{bucket}.s3.amazonaws.com/',
+    'azure': 'https://{bucket}.blob.core.windows.net/',
+    'gcp': 'https://storage.googleapis.com/{bucket}/'
+}
+
+OBJECT_FIELDS = ['name', 'size', 'etag', 'last_modified', 'created_at', 'seen_at']
+
+
+def get_storage(provider, bucket_name):
+    cloud_provider, _ = CloudProvider.objects.get_or_create(name=provider)
+    storage, _ = Storage.objects.get_or_create(
+        provider=cloud_provider,
+        storage_id=bucket_name,
+        defaults={
+            'storage_type': STORAGE_TYPES[provider],
+            'created_at': timezone.now(),
+            'location': STORAGE_LOCATIONS[provider].format(bucket=bucket_name)
+        }
+    )
+    return storage
+
+
+def _store_batch(storage, provider, bucket_name, batch, seen_at):
+    # Only the objects whose etag, size or modification date changed are rewritten, the others just get their
+    # seen_at bumped so the sweep keeps them
+    keys = [key for key, _ in batch]
+    known = {
+        row['key']: (row['etag'], row['size'], row['last_modified'])
+        for row in StorageObject.objects.filter(provider=provider, bucket=bucket_name, key__in=keys)
+        .values('key', 'etag', 'size', 'last_modified')
+    }
+    changed, unchanged = [], []
+    for key, obj in batch:
+        etag = obj.get('etag') or ''
+        if known.get(key) == (etag, obj['size'] or 0, obj['last_modified']):
+            unchanged.append(key)
+            continue
+        changed.append(StorageObject(
+            storage=storage, provider=provider, bucket=bucket_name, key=key, name=obj['name'], size=obj['size'] or 0,
+            etag=etag, last_modified=obj['last_modified'], created_at=obj.get('created_at'), seen_at=seen_at
+        ))
+    if changed:
+        StorageObject.objects.bulk_create(
+            changed, update_conflicts=True, unique_fields=['provider', 'bucket', 'key'], update_fields=OBJECT_FIELDS)
+    if unchanged:
+        StorageObject.objects.filter(provider=provider, bucket=bucket_name, key__in=unchanged).update(seen_at=seen_at)
+    return len(changed), len(unchanged)
+
+
+def sync_bucket(provider, bucket_name, batch_size=None):
+    batch_size = batch_size or settings.OBJECT_SYNC_BATCH_SIZE
+    storage = get_storage(provider, bucket_name)
+    # An interrupted sync resumes after the last stored key instead of listing the bucket from the start
+    if storage.sync_cursor and storage.sync_started_at:
+        logger.info(f"[object_sync] resuming {provider}://{bucket_name} after {storage.sync_cursor}")
+    else:
+        storage.sync_started_at = timezone.now()
+        storage.sync_cursor = ''
+        storage.save(update_fields=['sync_started_at', 'sync_cursor'])
+    started_at = storage.sync_started_at
+
+    manager = get_manager(provider)
+    objects = manager.iter_objects(bucket_name, start_after=storage.sync_cursor or None)
+    stats = {'changed': 0, 'unchanged': 0, 'deleted': 0}
+    while True:
+        batch = list(islice(objects, batch_size))
+        if not batch:
+            break
+        changed, unchanged = _store_batch(storage, provider, bucket_name, batch, timezone.now())
+        stats['changed'] += changed
+        stats['unchanged'] += unchanged
+        storage.sync_cursor = batch[-1][0]
+        storage.save(update_fields=['sync_cursor'])
+
+    # Everything the complete pass did not see is gone from the bucket
+    stats['deleted'], _ = StorageObject.objects.filter(storage=storage, seen_at__lt=started_at).delete()
+    storage.synced_at = timezone.now()
+    storage.sync_cursor = ''
+    storage.save(update_fields=['synced_at', 'sync_cursor'])
+    logger.info(f"[object_sync] {provider}://{bucket_name}: {stats}")
+    return stats
+
+
+def sync_objects(providers=None):
+    report = {}
+    for provider in providers or STORAGE_PROVIDERS:
+        started_at = timezone.now()
+        bucket_names = list_bucket_names(provider)
+        failed = False
+        for bucket_name in bucket_names:
+            try:
+                report[f"{provider}://{bucket_name}"] = sync_bucket(provider, bucket_name)
+            except Exception as e:
+                logger.error(f"[object_sync] {provider}://{bucket_name} failed: {e}")
+                report[f"{provider}://{bucket_name}"] = {'error': str(e)}
+                failed = True
+        # Buckets deleted on the provider side take their objects with them
+        Storage.objects.filter(provider__name=provider).exclude(storage_id__in=bucket_names).delete()
+        if not failed:
+            # The index holds every object of the provider as of the start of this pass
+            CloudProvider.objects.update_or_create(name=provider, defaults={'objects_synced_at': started_at})
+    return report
+
+
+def serialize_object(obj):
+    data = {
+        "id": obj.etag,
+        "provider": obj.provider,
+        "bucket": obj.bucket,
+        "name": obj.name,
+        "size": obj.size,
+        "etag": obj.etag,
+        "last_modified": obj.last_modified,
+        "created_at": obj.created_at
+    }
+    if obj.provider == 'azure':
+        data["container_name"] = obj.key.partition('/')[0]
+        data["id"] = obj.name
+    return data
+
+
+def index_synced_at(providers):
+    # Oldest complete sync of the requested storage providers, None when one of them was never fully synced
+    providers = [provider for provider in STORAGE_PROVIDERS if provider in providers]
+    synced = dict(CloudProvider.objects.filter(name__in=providers).values_list('name', 'objects_synced_at'))
+    if not providers or any(synced.get(provider) is None for provider in providers):
+        return None
+    return min(synced[provider] for provider in providers)
+
+
+def indexed_objects_page(providers, page_size, prefix=None, cursor=None):
+    # Same ordering and cursor as the live listing: provider, bucket, key
+    objects = StorageObject.objects.filter(provider__in=providers).order_by('provider', 'bucket', 'key')
+    if prefix:
+        objects = objects.filter(name__startswith=prefix)
+    if cursor:
+        provider, bucket_name, key = decode_cursor(cursor)
+        objects = objects.filter(
+            Q(provider__gt=provider) |
+            Q(provider=provider, bucket__gt=bucket_name) |
+            Q(provider=provider, bucket=bucket_name, key__gt=key)
+        )
+    page = list(objects[:page_size + 1])
+    next_cursor = None
+    if len(page) > page_size:
+        page = page[:page_size]
+        next_cursor = encode_cursor(page[-1].provider, page[-1].bucket, page[-1].key)
+    return [serialize_object(obj) for obj in page], next_cursor
+
+
+SEARCH_ORDERINGS = ('name', 'size', 'last_modified', 'created_at', 'bucket', 'provider')
+
+
+def search_objects(query=None, providers=None, bucket_name=None, min_size=None, max_size=None,
+                   modified_after=None, modified_before=None, ordering='name', page=1, page_size=None):
+    objects = StorageObject.objects.all()
+    if query:
+        objects = objects.filter(name__icontains=query)
+    if providers:
+        objects = objects.filter(provider__in=providers)
+    if bucket_name:
+        objects = objects.filter(bucket=bucket_name)
+    if min_size is not None:
+        objects = objects.filter(size__gte=min_size)
+    if max_size is not None:
+        objects = objects.filter(size__lte=max_size)
+    if modified_after:
+        objects = objects.filter(last_modified__gte=modified_after)
+    if modified_before:
+        objects = objects.filter(last_modified__lt=modified_before)
+    if ordering.lstrip('-') not in SEARCH_ORDERINGS:
+        raise ValueError(f"ordering must be one of {', '.join(SEARCH_ORDERINGS)}, optionally prefixed with '-'")
+    objects = objects.order_by(ordering, 'provider', 'bucket', 'key')
+
+    page_size = page_size or settings.OBJECT_LIST_PAGE_SIZE
+    offset = (page - 1) * page_size
+    return [serialize_object(obj) for obj in objects[offset:offset + page_size]], objects.count()
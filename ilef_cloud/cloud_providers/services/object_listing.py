@@ -0,0 +1,86 @@
+import base64
+import json
+from itertools import islice
+from django.conf import settings
+
+from cloud_providers.services.concurrency import iter_prefetched
+from cloud_providers.services.manager_registry import get_manager
+
+# Providers with object storage, in the order they are listed
+STORAGE_PROVIDERS = ('aws', 'azure', 'gcp')
+
+BUCKET_NAME_GETTERS = {
+    'aws': lambda bucket: bucket['Name'],
+    'azure': lambda bucket: bucket['name'],
+    'gcp': lambda bucket: bucket.name
+}
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+def encode_cursor(provider, bucket, key, resume_token=None):
+    # `resume_token` is the provider's own listing position, for providers that can't start after a key
+    payload = {"p": provider, "b": bucket, "k": key}
+    if resume_token:
+        payload["t"] = resume_token
+    return base64.urlsafe_b64encode(json.dumps(payload, separators=(',', ':')).encode()).decode()
+
+
+def decode_cursor(cursor, with_token=False):
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        position = payload['p'], payload['b'], payload['k']
+    except Exception:
+        raise InvalidCursor("Invalid cursor")
+    return (*position, payload.get('t')) if with_token else position
+
+
+def list_bucket_names(provider):
+    manager = get_manager(provider)
+    return sorted(BUCKET_NAME_GETTERS[provider](bucket) for bucket in manager.list_buckets())
+
+
+def iter_all_objects(providers, prefix=None, cursor=None, prefetch=None):
+    # Walks providers, then buckets by name, then keys in order, yielding (provider, bucket, key, object).
+    # Everything before the cursor position is skipped without being listed. The first `prefetch` objects of the
+    # next buckets are fetched concurrently, so a page spanning many small buckets costs about one bucket's latency.
+    prefetch = prefetch or settings.OBJECT_LIST_PAGE_SIZE
+    start_provider, start_bucket, start_key, start_token = (
+        decode_cursor(cursor, with_token=True) if cursor else (None, None, None, None))
+    providers = [provider for provider in STORAGE_PROVIDERS if provider in providers]
+    if start_provider is not None and start_provider not in providers:
+        raise InvalidCursor("Cursor does not match the requested providers")
+
+    for provider in providers:
+        if start_provider is not None and providers.index(provider) < providers.index(start_provider):
+            continue
+        resuming_provider = provider == start_provider
+        manager = get_manager(provider)
+        bucket_names = [
+            bucket_name for bucket_name in list_bucket_names(provider)
+            if not resuming_provider or bucket_name >= start_bucket
+        ]
+
+        def open_bucket(bucket_name, manager=manager, resuming_provider=resuming_provider):
+            if not resuming_provider or bucket_name != start_bucket:
+                return manager.iter_objects(bucket_name, prefix=prefix)
+            if start_token:
+                return manager.iter_objects(bucket_name, prefix=prefix, start_after=start_key, resume_token=start_token)
+            return manager.iter_objects(bucket_name, prefix=prefix, start_after=start_key)
+
+        for bucket_name, (key, obj) in iter_prefetched(open_bucket, bucket_names, prefetch):
+            yield provider, bucket_name, key, obj
+
+
+def list_objects_page(providers, page_size, prefix=None, cursor=None):
+    # One item past the page tells whether there is a next page
+    items = list(islice(iter_all_objects(providers, prefix, cursor, prefetch=page_size + 1), page_size + 1))
+    page = items[:page_size]
+    resume_tokens = [obj.pop('_resume_token', None) for _, _, _, obj in page]
+    next_cursor = None
+    if len(items) > page_size:
+        provider, bucket_name, key, _ = page[-1]
+        next_cursor = encode_cursor(provider, bucket_name, key, resume_tokens[-1])
+    return [obj for _, _, _, obj in page], next_cursor
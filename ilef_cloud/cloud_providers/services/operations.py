@@ -0,0 +1,161 @@
+import heapq
+import itertools
+import logging
+import random
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+class OperationTimeout(Exception):
+    pass
+
+
+class OperationFailed(Exception):
+    pass
+
+
+# An adapter knows how to poll one kind of cloud operation. `poll(targets)` receives every due target of that adapter
+# at once (up to `max_batch`) and returns one (done, result, error) tuple per target: a target is failed when it is
+# done with an error, an exception raised by `poll` itself is treated as transient and the targets are polled again.
+class ConditionCheck:
+    name = 'condition'
+    max_batch = 1
+
+    def poll(self, targets):
+        # Targets are callables returning a falsy value until the condition holds, or raising OperationFailed when it
+        # never will
+        results = []
+        for check in targets:
+            try:
+                value = check()
+            except OperationFailed as e:
+                results.append((True, None, e))
+                continue
+            except Exception as e:
+                logger.info(f"[operations] condition check failed, will retry: {e}")
+                value = None
+            results.append((bool(value), value, None))
+        return results
+
+
+CONDITION = ConditionCheck()
+
+
+class TrackedOperation:
+    def __init__(self, adapter, target, description, interval, max_interval, deadline, jitter):
+        self.adapter = adapter
+        self.target = target
+        self.description = description
+        self.interval = interval
+        self.max_interval = max_interval
+        self.deadline = deadline
+        self.jitter = jitter
+        self.future = Future()
+        self.polls = 0
+
+
+# Polls every pending cloud operation (zone operations, LROs, instance states, actions...) from a single scheduler
+# thread. Each operation is polled with exponential backoff and due operations of the same adapter are polled in one
+# batch, so hundreds of in-flight operations cost a few threads and a handful of API calls per round. The batches run
+# on a small pool, a slow list call of one cloud does not hold back the operations (and deadlines) of the others.
+class OperationTracker:
+    def __init__(self):
+        self._executor = ThreadPoolExecutor(max_workers=settings.OPERATION_POLL_WORKERS, thread_name_prefix='operation-poll')
+        self._condition = threading.Condition()
+        self._queue = []
+        self._sequence = itertools.count()
+        self._thread = None
+
+    def track(self, adapter, target, description=None, timeout=None, initial_interval=None, max_interval=None,
+              jitter=0):
+        interval = initial_interval or settings.OPERATION_POLL_INITIAL_INTERVAL
+        operation = TrackedOperation(
+            adapter, target, description or adapter.name, interval,
+            max_interval or settings.OPERATION_POLL_MAX_INTERVAL,
+            time.monotonic() + (timeout or settings.OPERATION_TIMEOUT), jitter
+        )
+        self._schedule(operation, time.monotonic())
+        return operation.future
+
+    def wait(self, adapter, target, **kwargs):
+        return self.track(adapter, target, **kwargs).result()
+
+    def wait_until(self, check, **kwargs):
+        return self.wait(CONDITION, check, **kwargs)
+
+    def pending(self):
+        with self._condition:
+            return len(self._queue)
+
+    def _schedule(self, operation, when):
+        with self._condition:
+            heapq.heappush(self._queue, (when, next(self._sequence), operation))
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='operation-tracker', daemon=True)
+                self._thread.start()
+            self._condition.notify()
+
+    def _next_due(self):
+        with self._condition:
+            while True:
+                if not self._queue:
+                    self._condition.wait()
+                    continue
+                delay = self._queue[0][0] - time.monotonic()
+                if delay > 0:
+                    self._condition.wait(delay)
+                    continue
+                due = []
+                now = time.monotonic()
+                while self._queue and self._queue[0][0] <= now:
+                    due.append(heapq.heappop(self._queue)[2])
+                return due
+
+    def _run(self):
+        while True:
+            due = self._next_due()
+            batches = {}
+            for operation in due:
+                batches.setdefault(id(operation.adapter), []).append(operation)
+            for operations in batches.values():
+                adapter = operations[0].adapter
+                for start in range(0, len(operations), adapter.max_batch):
+                    self._executor.submit(self._poll, adapter, operations[start:start + adapter.max_batch])
+
+    def _poll(self, adapter, operations):
+        try:
+            results = adapter.poll([operation.target for operation in operations])
+        except Exception as e:
+            logger.warning(f"[operations] polling {len(operations)} {adapter.name} operation(s) failed, will retry: {e}")
+            results = [(False, None, None)] * len(operations)
+        if len(results) < len(operations):
+            # An adapter bug, the operations left without a status would otherwise never be polled nor resolved
+            logger.error(f"[operations] {adapter.name} returned {len(results)} statuses for {len(operations)} operations")
+            for operation in operations[len(results):]:
+                operation.future.set_exception(
+                    OperationFailed(f"{adapter.name} returned no status for {operation.description}"))
+
+        now = time.monotonic()
+        for operation, (done, result, error) in zip(operations, results):
+            operation.polls += 1
+            if done:
+                if error is not None:
+                    logger.error(f"[operations] {operation.description} failed: {error}")
+                    operation.future.set_exception(error)
+                else:
+                    operation.future.set_result(result)
+            elif now >= operation.deadline:
+                operation.future.set_exception(
+                    OperationTimeout(f"{operation.description} did not complete after {operation.polls} polls"))
+            else:
+                # Jitter spreads out operations started together, e.g. the hosts of one batch deploy
+                delay = operation.interval * random.uniform(1 - operation.jitter, 1 + operation.jitter)
+                self._schedule(operation, now + delay)
+                operation.interval = min(operation.interval * settings.OPERATION_POLL_BACKOFF, operation.max_interval)
+
+
+operation_tracker = OperationTracker()
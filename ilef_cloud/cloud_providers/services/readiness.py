@@ -0,0 +1,145 @@
+import errno
+import logging
+import random
+import select
+import socket
+import time
+from django.conf import settings
+from django.db.models import Avg, Count, Max, Q
+
+from cloud_providers.models import ReadinessProbe
+from cloud_providers.services.operations import OperationTimeout, operation_tracker
+from cloud_providers.services.ssh_pool import ssh_pool
+
+logger = logging.getLogger(__name__)
+
+
+class HostNotReady(Exception):
+    pass
+
+
+def _start_connect(host, port):
+    # Returns a socket whose non-blocking connect is in progress, True when it connected at once, False when refused
+    try:
+        address = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)[0]
+    except socket.gaierror:
+        return False
+    sock = socket.socket(address[0], socket.SOCK_STREAM)
+    sock.setblocking(False)
+    result = sock.connect_ex(address[4])
+    if result in (errno.EINPROGRESS, errno.EWOULDBLOCK, errno.EALREADY):
+        return sock
+    sock.close()
+    return result == 0
+
+
+class PortProbe:
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.attempts = 0
+
+
+class PortProbes:
+    # Connects to every due host at once and waits for all the handshakes with a single select, so probing many
+    # booting hosts costs one TCP_PROBE_TIMEOUT per round whatever their number
+    name = 'tcp probe'
+    max_batch = 200
+
+    def poll(self, probes):
+        opened = {}
+        for probe in probes:
+            probe.attempts += 1
+            opened[probe] = _start_connect(probe.host, probe.port)
+        sockets = [sock for sock in opened.values() if isinstance(sock, socket.socket)]
+        try:
+            pending = list(sockets)
+            connected = set()
+            deadline = time.monotonic() + settings.TCP_PROBE_TIMEOUT
+            while pending and time.monotonic() < deadline:
+                _, writable, _ = select.select([], pending, [], max(deadline - time.monotonic(), 0))
+                for sock in writable:
+                    pending.remove(sock)
+                    if sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR) == 0:
+                        connected.add(sock)
+            results = []
+            for probe in probes:
+                sock = opened[probe]
+                ready = sock in connected if isinstance(sock, socket.socket) else sock
+                results.append((ready, probe.attempts, None))
+            return results
+        finally:
+            for sock in sockets:
+                sock.close()
+
+
+PORT_PROBES = PortProbes()
+
+
+def wait_for_port(host, port=22, timeout=None):
+    # Returns the number of probes it took, raises OperationTimeout when the port never opened
+    return operation_tracker.wait(
+        PORT_PROBES, PortProbe(host, port), description=f"port {port} on {host}",
+        timeout=timeout or settings.SSH_READY_TIMEOUT, initial_interval=settings.TCP_PROBE_INTERVAL,
+        max_interval=settings.TCP_PROBE_MAX_INTERVAL, jitter=settings.TCP_PROBE_JITTER
+    )
+
+
+def wait_until_ready(host, username, ssh_private_key, provider='', image='', port=22, timeout=None):
+    # TCP probes first, on a jittered backoff starting well under a second, then a single SSH login once the port
+    # accepts connections. sshd can accept before the key is installed, so a failed login is retried a few times.
+    timeout = timeout or settings.SSH_READY_TIMEOUT
+    probe = ReadinessProbe(provider=provider, image=image, host=host)
+    started = time.monotonic()
+    try:
+        try:
+            probe.tcp_attempts = wait_for_port(host, port, timeout)
+        except OperationTimeout:
+            raise HostNotReady(f"SSH not available on {host} after {timeout} seconds")
+        probe.tcp_seconds = time.monotonic() - started
+
+        delay = settings.SSH_LOGIN_RETRY_INTERVAL
+        while True:
+            probe.ssh_attempts += 1
+            try:
+                # The pooled connection stays open for the commands that follow
+                ssh_pool.exec_command(host, username, ssh_private_key, "echo ready", port=port)
+                break
+            except Exception as e:
+                logger.info(f"SSH login to {host} failed: {e}")
+                if probe.ssh_attempts >= settings.SSH_LOGIN_ATTEMPTS:
+                    raise HostNotReady(f"SSH login to {host} failed after {probe.ssh_attempts} attempts: {e}")
+            time.sleep(delay * random.uniform(1 - settings.TCP_PROBE_JITTER, 1 + settings.TCP_PROBE_JITTER))
+            delay *= 2
+        probe.ready = True
+    except Exception as e:
+        probe.error = str(e)
+        raise
+    finally:
+        probe.ssh_seconds = time.monotonic() - started
+        try:
+            probe.save()
+        except Exception as e:
+            logger.error(f"Saving the readiness probe of {host} failed: {e}")
+    logger.info(
+        f"{host} ready in {probe.ssh_seconds:.1f}s "
+        f"(port open after {probe.tcp_seconds:.1f}s and {probe.tcp_attempts} probes, {probe.ssh_attempts} SSH logins)")
+    return probe
+
+
+def readiness_stats(provider=None):
+    # Time to ready per provider and image, to tune the probe schedule from real boots
+    probes = ReadinessProbe.objects.all()
+    if provider:
+        probes = probes.filter(provider=provider)
+    return list(
+        probes.values('provider', 'image').annotate(
+            probes=Count('id'),
+            failures=Count('id', filter=Q(ready=False)),
+            avg_tcp_seconds=Avg('tcp_seconds', filter=Q(ready=True)),
+            avg_ready_seconds=Avg('ssh_seconds', filter=Q(ready=True)),
+            max_ready_seconds=Max('ssh_seconds', filter=Q(ready=True)),
+            avg_tcp_attempts=Avg('tcp_attempts'),
+            avg_ssh_attempts=Avg('ssh_attempts'),
+        ).order_by('provider', 'image')
+    )
@@ -4,35 +4,91 @@ import subprocess
 
 
 import docker
-import json
+import logging
 from django.conf import settings
+from django.utils import timezone
 
+from cloud_providers.models import ImageInspection
+from cloud_providers.services.docker_registry import registry_client
 
-def inspect_image(image, username=settings.NEXUS_REGISTRY_USERNAME, password=settings.NEXUS_REGISTRY_PASSWORD):
+logger = logging.getLogger(__name__)
+
+
+def _registry_auth_configs(username, password):
+    # Nexus first, then our Docker Hub account
+    return [
+        {'username': username, 'password': password},
+        {'username': settings.DOCKER_HUB_USERNAME, 'password': settings.DOCKER_HUB_PASSWORD}
+    ]
+
+
+def _digest_from_attrs(image_info):
+    repo_digests = image_info.get('RepoDigests') or []
+    return repo_digests[0].split('@')[-1] if repo_digests else ''
+
+
+def _inspect_with_daemon(image, username, password):
     client = docker.from_env()
-    print('new change')
     try:
         # Try to get the image locally
         image_info = client.images.get(image).attrs
     except docker.errors.ImageNotFound:
         # If the image is not found, pull it from the remote registry with authentication
-        print(f"Image {image} not found locally. Pulling from remote registry...")
-        auth_config = {
-            'username': username,
-            'password': password
-        }
+        logger.info(f"[inspect_image] {image} not found locally, pulling it from the remote registry")
+        auth_config = _registry_auth_configs(username, password)[0]
         image_info = client.images.pull(image, auth_config=auth_config).attrs
     except Exception as exception:
         # If the image is not found, pull it from the remote registry with authentication
-        print(f'[error][inspect_image]: {exception}')
-        print(f"Image {image} not found locally. Pulling from your dockerhub registry...")
-        auth_config = {
-            'username': settings.DOCKER_HUB_USERNAME,
-            'password': settings.DOCKER_HUB_PASSWORD
-        }
+        logger.warning(f"[inspect_image] local lookup of {image} failed ({exception}), pulling it from our Docker Hub account")
+        auth_config = _registry_auth_configs(username, password)[1]
         image_info = client.images.pull(image, auth_config=auth_config).attrs
     ports = image_info.get('Config', {}).get('ExposedPorts', {})
-    return [int(port.split('/')[0]) for port in ports]
+    return _digest_from_attrs(image_info), [int(port.split('/')[0]) for port in ports]
+
+
+def _resolve_digest(image, username, password):
+    # Asks the registry which digest the reference points to now, without pulling anything
+    try:
+        return registry_client.resolve_digest(image)
+    except Exception as exception:
+        logger.warning(f"[resolve_digest] registry lookup of {image} failed ({exception}), asking the docker daemon")
+    client = docker.from_env()
+    for auth_config in _registry_auth_configs(username, password):
+        try:
+            return client.images.get_registry_data(image, auth_config=auth_config).id
+        except Exception as exception:
+            logger.warning(f"[resolve_digest] docker daemon lookup of {image} failed ({exception})")
+    return None
+
+
+def _inspect(image, username, password):
+    # The manifest and config blob are enough to know the exposed ports, the daemon only pulls when the registry
+    # API can't be used
+    try:
+        return registry_client.inspect(image)
+    except Exception as exception:
+        logger.warning(f"[inspect_image] registry inspection of {image} failed ({exception}), using the docker daemon")
+    return _inspect_with_daemon(image, username, password)
+
+
+def inspect_image(image, username=settings.NEXUS_REGISTRY_USERNAME, password=settings.NEXUS_REGISTRY_PASSWORD):
+    cached = ImageInspection.objects.filter(image=image).first()
+    if cached:
+        age = (timezone.now() - cached.inspected_at).total_seconds()
+        # A reference pinned to a digest never changes, a tag is trusted for IMAGE_INSPECTION_TTL seconds
+        if '@sha256:' in image or age < settings.IMAGE_INSPECTION_TTL:
+            return cached.exposed_ports
+        digest = _resolve_digest(image, username, password)
+        if digest and digest == cached.digest:
+            cached.inspected_at = timezone.now()
+            cached.save(update_fields=['inspected_at'])
+            return cached.exposed_ports
+        logger.info(f"[inspect_image] {image} moved from {cached.digest or 'unknown'} to {digest or 'unknown'}, inspecting again")
+
+    digest, ports = _inspect(image, username, password)
+    ImageInspection.objects.update_or_create(
+        image=image, defaults={'digest': digest, 'exposed_ports': ports, 'inspected_at': timezone.now()})
+    return ports
 
 
 def get_default_os_image(provider: str) -> dict:
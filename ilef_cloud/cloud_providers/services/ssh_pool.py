@@ -0,0 +1,162 @@
+import base64
+import hashlib
+import logging
+import threading
+import time
+from io import StringIO
+import paramiko
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+_keys_lock = threading.Lock()
+_keys = {}
+
+
+def load_private_key(ssh_private_key):
+    # Parsing an RSA key is expensive, every distinct key is parsed once and kept for the life of the process
+    key_id = hashlib.sha256(ssh_private_key.encode()).hexdigest()
+    with _keys_lock:
+        key = _keys.get(key_id)
+    if key is not None:
+        return key_id, key
+
+    # Detect if the key is in PEM format
+    if ssh_private_key.startswith("-----BEGIN"):
+        key = paramiko.RSAKey.from_private_key(StringIO(ssh_private_key))
+    else:
+        # Decode base64 if the key is base64 encoded
+        try:
+            decoded_key = base64.b64decode(ssh_private_key)
+            key = paramiko.RSAKey.from_private_key(StringIO(decoded_key.decode('utf-8')))
+        except Exception as e:
+            logger.error(f"Error decoding base64 key: {str(e)}")
+            raise
+    with _keys_lock:
+        _keys[key_id] = key
+    return key_id, key
+
+
+class PooledConnection:
+    def __init__(self, client):
+        self.client = client
+        self.last_used = time.monotonic()
+        self.users = 0
+
+    def is_active(self):
+        transport = self.client.get_transport()
+        return transport is not None and transport.is_active()
+
+
+# Keeps one authenticated SSH transport per (host, port, user, key). Every command runs on a new channel of that
+# transport, so running several commands on a host costs a single TCP + SSH handshake.
+# Connections nobody used for `idle_timeout` seconds are closed.
+class SSHConnectionPool:
+    def __init__(self, idle_timeout=None, connect_timeout=None):
+        self.idle_timeout = idle_timeout or settings.SSH_POOL_IDLE_TIMEOUT
+        self.connect_timeout = connect_timeout or settings.SSH_CONNECT_TIMEOUT
+        self._lock = threading.Lock()
+        self._connections = {}
+
+    def _connect(self, host, port, username, key):
+        client = paramiko.SSHClient()
+        client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        client.connect(
+            host, port=port, username=username, pkey=key, timeout=self.connect_timeout,
+            banner_timeout=self.connect_timeout, auth_timeout=self.connect_timeout,
+            allow_agent=False, look_for_keys=False
+        )
+        client.get_transport().set_keepalive(30)
+        return client
+
+    def _acquire(self, host, port, username, ssh_private_key):
+        key_id, key = load_private_key(ssh_private_key)
+        pool_key = (host, port, username, key_id)
+        self.evict_idle()
+        with self._lock:
+            connection = self._connections.get(pool_key)
+            if connection is not None and connection.is_active():
+                connection.users += 1
+                connection.last_used = time.monotonic()
+                return pool_key, connection
+
+        logger.info(f"Opening SSH connection to {username}@{host}:{port}")
+        client = self._connect(host, port, username, key)
+        with self._lock:
+            connection = self._connections.get(pool_key)
+            if connection is not None and connection.is_active():
+                # Another thread connected to the same host in the meantime, keep a single transport
+                client.close()
+            else:
+                if connection is not None:
+                    connection.client.close()
+                connection = PooledConnection(client)
+                self._connections[pool_key] = connection
+            connection.users += 1
+            connection.last_used = time.monotonic()
+            return pool_key, connection
+
+    def _release(self, connection):
+        with self._lock:
+            connection.users -= 1
+            connection.last_used = time.monotonic()
+
+    def discard(self, pool_key):
+        with self._lock:
+            connection = self._connections.pop(pool_key, None)
+        if connection is not None:
+            connection.client.close()
+
+    def evict_idle(self):
+        now = time.monotonic()
+        with self._lock:
+            idle_keys = [
+                pool_key for pool_key, connection in self._connections.items()
+                if connection.users == 0 and (now - connection.last_used > self.idle_timeout or not connection.is_active())
+            ]
+            idle_connections = [self._connections.pop(pool_key) for pool_key in idle_keys]
+        for connection in idle_connections:
+            connection.client.close()
+
+    def close_all(self):
+        with self._lock:
+            connections = list(self._connections.values())
+            self._connections.clear()
+        for connection in connections:
+            connection.client.close()
+
+    def exec_command(self, host, username, ssh_private_key, command, stdin_data=None, port=22, on_output_line=None):
+        for attempt in range(2):
+            pool_key, connection = self._acquire(host, port, username, ssh_private_key)
+            try:
+                stdin, stdout, stderr = connection.client.exec_command(command)
+                break
+            except (paramiko.SSHException, EOFError, OSError) as e:
+                # The pooled transport died between two commands, reconnect once
+                self._release(connection)
+                self.discard(pool_key)
+                if attempt:
+                    raise
+                logger.info(f"Pooled SSH connection to {host} is gone ({e}), reconnecting")
+
+        try:
+            if stdin_data is not None:
+                stdin.write(stdin_data)
+                stdin.channel.shutdown_write()
+            if on_output_line is not None:
+                # Hand the output over line by line while the command is still running
+                lines = []
+                for line in stdout:
+                    on_output_line(line)
+                    lines.append(line)
+                output = ''.join(lines)
+            else:
+                output = stdout.read().decode()
+            error = stderr.read().decode()
+            exit_status = stdout.channel.recv_exit_status()
+            return output, error, exit_status
+        finally:
+            self._release(connection)
+
+
+ssh_pool = SSHConnectionPool()
@@ -0,0 +1,191 @@
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler, StopFutureHandlers
+from django.http import QueryDict
+from django.http.multipartparser import MultiPartParser as DjangoMultiPartParser, MultiPartParserError
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import DataAndFiles, MultiPartParser
+
+# Uploads run here while the request thread keeps receiving the body and feeding them
+upload_executor = ThreadPoolExecutor(max_workers=settings.UPLOAD_STREAMS, thread_name_prefix='upload')
+
+
+class UploadAborted(Exception):
+    pass
+
+
+class ChunkPipe:
+    # File-like reading end of a bounded queue of request chunks: the request thread writes what it receives, the
+    # upload reads it. A full queue blocks the writer, so at most UPLOAD_STREAM_BUFFER bytes wait in memory.
+    def __init__(self, name, content_type, size=None):
+        self.name = name
+        self.content_type = content_type
+        self.size = size
+        self._chunks = queue.Queue(maxsize=max(settings.UPLOAD_STREAM_BUFFER // FileUploadHandler.chunk_size, 1))
+        self._buffer = bytearray()
+        self._position = 0
+        self._eof = False
+        self._abandoned = threading.Event()
+
+    def write(self, data):
+        # Dropped once the upload stopped reading (it failed), the error is reported by the upload itself
+        while not self._abandoned.is_set():
+            try:
+                self._chunks.put(data, timeout=1)
+                return
+            except queue.Full:
+                continue
+
+    def close(self):
+        self.write(b'')
+
+    def abort(self):
+        self.write(UploadAborted("The request was not received completely"))
+
+    def abandon(self):
+        self._abandoned.set()
+
+    def _fill(self):
+        chunk = self._chunks.get()
+        if isinstance(chunk, Exception):
+            raise chunk
+        if not chunk:
+            self._eof = True
+        self._buffer.extend(chunk)
+
+    def read(self, size=-1):
+        # Blocks until `size` bytes (everything when negative) or the end of the file arrived
+        while not self._eof and (size < 0 or len(self._buffer) < size):
+            self._fill()
+        size = len(self._buffer) if size < 0 else min(size, len(self._buffer))
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        self._position += len(data)
+        return data
+
+    def tell(self):
+        return self._position
+
+
+class StreamedUpload(UploadedFile):
+    # What request.FILES holds for a file that was uploaded while it was received
+    def __init__(self, future, name, content_type, size):
+        super().__init__(file=None, name=name, content_type=content_type, size=size)
+        self.future = future
+
+    def result(self):
+        return self.future.result()
+
+
+class CloudUploadHandler(FileUploadHandler):
+    # Starts the cloud upload of a file part as soon as its headers are read and feeds it the chunks as they
+    # arrive, instead of spooling the file to memory or /tmp first. `uploader(fields, file_name, content_type)`
+    # returns the upload to run on a file-like object, or None when the fields sent before the file don't say
+    # where it goes; the file is then handled by the default handlers.
+    def __init__(self, request, uploader, destination_fields):
+        super().__init__(request)
+        self.uploader = uploader
+        self.destination_fields = destination_fields
+        self.form_fields = QueryDict  # set by StreamingMultiPartParser
+        self.pipe = None
+        self.pending = []
+
+    def _destination(self):
+        fields = self.form_fields()
+        return {field: fields.get(field) for field in self.destination_fields}
+
+    def new_file(self, field_name, file_name, content_type, content_length, charset=None, content_type_extra=None):
+        super().new_file(field_name, file_name, content_type, content_length, charset, content_type_extra)
+        upload = self.uploader(self.form_fields(), file_name, content_type)
+        if upload is None:
+            self.pipe = None
+            return
+        pipe = ChunkPipe(file_name, content_type, content_length)
+        future = upload_executor.submit(upload, pipe)
+        future.add_done_callback(lambda _: pipe.abandon())
+        self.pipe = pipe
+        self.pending.append({'pipe': pipe, 'future': future, 'destination': self._destination(), 'complete': False})
+        raise StopFutureHandlers()
+
+    def receive_data_chunk(self, raw_data, start):
+        if self.pipe is None:
+            return raw_data
+        self.pipe.write(raw_data)
+        return None
+
+    def file_complete(self, file_size):
+        if self.pipe is None:
+            return None
+        # The end of the file is only signalled once the whole body is read (upload_complete), so the upload can
+        # still be cancelled before it is committed if a field that decides its destination comes after the file
+        upload = self.pending[-1]
+        upload['complete'] = True
+        self.pipe = None
+        return StreamedUpload(upload['future'], upload['pipe'].name, upload['pipe'].content_type, file_size)
+
+    def upload_complete(self):
+        # Also called after a StopUpload, files cut short are aborted rather than committed
+        destination = self._destination()
+        for upload in self.pending:
+            used = upload['destination']
+            if not upload['complete']:
+                upload['pipe'].abort()
+            elif used == destination:
+                upload['pipe'].close()
+            else:
+                late = ', '.join(field for field in self.destination_fields if used[field] != destination[field])
+                upload['pipe'].write(UploadAborted(f"Send {late} before the file in the form"))
+        self.pending = []
+
+    def upload_interrupted(self):
+        for upload in self.pending:
+            upload['pipe'].abort()
+        self.pending = []
+
+
+class StreamingMultiPartParser(MultiPartParser):
+    # DRF's multipart parser, except that CloudUploadHandlers can read the form fields received before a file
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        request = parser_context['request']
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+        meta = request.META.copy()
+        meta['CONTENT_TYPE'] = media_type
+        upload_handlers = request.upload_handlers
+
+        try:
+            parser = DjangoMultiPartParser(meta, stream, upload_handlers, encoding)
+            for handler in upload_handlers:
+                if isinstance(handler, CloudUploadHandler):
+                    # Django fills this QueryDict field by field while it reads the body
+                    handler.form_fields = lambda: getattr(parser, '_post', None) or QueryDict()
+            data, files = parser.parse()
+            return DataAndFiles(data, files)
+        except MultiPartParserError as exc:
+            self._interrupt(upload_handlers)
+            raise ParseError('Multipart form parse error - %s' % str(exc))
+        except Exception:
+            # A body that could not be read (client gone) must not leave uploads waiting for more chunks
+            self._interrupt(upload_handlers)
+            raise
+
+    @staticmethod
+    def _interrupt(upload_handlers):
+        for handler in upload_handlers:
+            if isinstance(handler, CloudUploadHandler):
+                handler.upload_interrupted()
+
+
+def stream_uploads(request, uploader, destination_fields):
+    # Must run before request.data or request.FILES is read
+    request.upload_handlers.insert(0, CloudUploadHandler(request, uploader, destination_fields))
+
+
+def upload_file(file_obj, upload):
+    # Result of the upload started while the request was received, or of `upload` on a file that was spooled
+    if isinstance(file_obj, StreamedUpload):
+        return file_obj.result()
+    return upload(file_obj)
@@ -1,3 +1,186 @@
-from django.test import TestCase
+import base64
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+from django.test import SimpleTestCase, override_settings
 
-# Create your tests here.
+from cloud_providers.services.docker_registry import (
+    DOCKER_HUB_REGISTRY, MANIFEST_LIST_TYPES, RegistryClient, RegistryError, parse_challenge, parse_reference
+)
+
+LIST_DIGEST = 'sha256:' + 'a' * 64
+AMD64_DIGEST = 'sha256:' + 'b' * 64
+ARM64_DIGEST = 'sha256:' + 'c' * 64
+CONFIG_DIGEST = 'sha256:' + 'd' * 64
+TOKEN = 'stub-token'
+
+
+class StubRegistry(BaseHTTPRequestHandler):
+    # Registry v2 endpoints of a multi-platform image "team/app:1.0", plus the token endpoint of its auth server
+    auth = 'bearer'
+    platforms = ('arm64', 'amd64')
+    exposed_ports = {'80/tcp': {}, '443/tcp': {}, '53/udp': {}}
+    requests = []
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status, body=b'', headers=None):
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+
+    def _send_json(self, document, headers=None):
+        self._send(200, json.dumps(document).encode(), {'Content-Type': 'application/json', **(headers or {})})
+
+    def _authorized(self):
+        header = self.headers.get('Authorization', '')
+        if self.auth == 'bearer':
+            return header == f'Bearer {TOKEN}'
+        return header == 'Basic ' + base64.b64encode(b'nexus-user:nexus-password').decode()
+
+    def _challenge(self):
+        host = f'127.0.0.1:{self.server.server_port}'
+        if self.auth == 'bearer':
+            return f'Bearer realm="http://{host}/token",service="stub-registry"'
+        return 'Basic realm="stub-registry"'
+
+    def do_HEAD(self):
+        self.do_GET()
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        self.requests.append((self.command, url.path, parse_qs(url.query), self.headers.get('Authorization')))
+        if url.path == '/token':
+            return self._send_json({'token': TOKEN, 'expires_in': 300})
+        if not self._authorized():
+            return self._send(401, headers={'WWW-Authenticate': self._challenge()})
+
+        if url.path == '/v2/team/app/manifests/1.0':
+            return self._send_json({
+                'schemaVersion': 2,
+                'mediaType': MANIFEST_LIST_TYPES[0],
+                'manifests': [
+                    {'digest': ARM64_DIGEST if architecture == 'arm64' else AMD64_DIGEST,
+                     'platform': {'os': 'linux', 'architecture': architecture}}
+                    for architecture in self.platforms
+                ]
+            }, {'Docker-Content-Digest': LIST_DIGEST})
+        if url.path == f'/v2/team/app/manifests/{AMD64_DIGEST}':
+            return self._send_json({
+                'schemaVersion': 2,
+                'mediaType': 'application/vnd.docker.distribution.manifest.v2+json',
+                'config': {'digest': CONFIG_DIGEST}
+            }, {'Docker-Content-Digest': AMD64_DIGEST})
+        if url.path == f'/v2/team/app/blobs/{CONFIG_DIGEST}':
+            return self._send_json({'config': {'ExposedPorts': self.exposed_ports}})
+        self._send(404)
+
+
+class RegistryClientTests(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), StubRegistry)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.image = f'127.0.0.1:{cls.server.server_port}/team/app:1.0'
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        StubRegistry.requests = []
+        self.client = RegistryClient(timeout=5)
+
+    def paths(self, path):
+        return [request for request in StubRegistry.requests if request[1] == path]
+
+    def test_bearer_challenge_fetches_a_token_for_the_repository(self):
+        digest, ports = self.client.inspect(self.image)
+        self.assertEqual(digest, LIST_DIGEST)
+        self.assertEqual(sorted(ports), [53, 80, 443])
+
+        token_requests = self.paths('/token')
+        self.assertEqual(len(token_requests), 1)
+        _, _, params, _ = token_requests[0]
+        self.assertEqual(params, {'scope': ['repository:team/app:pull'], 'service': ['stub-registry']})
+        # Only the first call goes without a token and gets the challenge
+        registry_auth = [auth for _, path, _, auth in StubRegistry.requests if path.startswith('/v2/')]
+        self.assertIsNone(registry_auth[0])
+        self.assertTrue(all(auth == f'Bearer {TOKEN}' for auth in registry_auth[1:]))
+
+    def test_token_is_cached_between_calls(self):
+        self.client.inspect(self.image)
+        StubRegistry.requests = []
+        self.assertEqual(self.client.resolve_digest(self.image), LIST_DIGEST)
+        self.assertEqual(self.paths('/token'), [])
+        self.assertEqual([command for command, *_ in StubRegistry.requests], ['HEAD'])
+
+    @override_settings(NEXUS_REGISTRY_URL='127.0.0.1', NEXUS_REGISTRY_USERNAME='nexus-user',
+                       NEXUS_REGISTRY_PASSWORD='nexus-password')
+    def test_basic_challenge_retries_with_the_registry_credentials(self):
+        StubRegistry.auth = 'basic'
+        try:
+            digest, ports = self.client.inspect(self.image)
+        finally:
+            StubRegistry.auth = 'bearer'
+        self.assertEqual(digest, LIST_DIGEST)
+        self.assertEqual(sorted(ports), [53, 80, 443])
+        self.assertEqual(self.paths('/token'), [])
+
+    @override_settings(NEXUS_REGISTRY_URL='nexus.example')
+    def test_basic_challenge_without_credentials_fails(self):
+        StubRegistry.auth = 'basic'
+        try:
+            with self.assertRaises(RegistryError):
+                self.client.inspect(self.image)
+        finally:
+            StubRegistry.auth = 'bearer'
+
+    def test_manifest_list_resolves_the_linux_amd64_manifest(self):
+        self.client.inspect(self.image)
+        manifest_paths = [path for command, path, *_ in StubRegistry.requests if '/manifests/' in path]
+        self.assertIn(f'/v2/team/app/manifests/{AMD64_DIGEST}', manifest_paths)
+        self.assertNotIn(f'/v2/team/app/manifests/{ARM64_DIGEST}', manifest_paths)
+
+    def test_manifest_list_without_linux_amd64_fails(self):
+        StubRegistry.platforms = ('arm64',)
+        try:
+            with self.assertRaisesMessage(RegistryError, 'No linux/amd64 manifest'):
+                self.client.inspect(self.image)
+        finally:
+            StubRegistry.platforms = ('arm64', 'amd64')
+
+    def test_image_without_exposed_ports(self):
+        StubRegistry.exposed_ports = None
+        try:
+            _, ports = self.client.inspect(self.image)
+        finally:
+            StubRegistry.exposed_ports = {'80/tcp': {}, '443/tcp': {}, '53/udp': {}}
+        self.assertEqual(ports, [])
+
+    def test_unknown_image_fails(self):
+        with self.assertRaises(RegistryError):
+            self.client.inspect(f'127.0.0.1:{self.server.server_port}/team/other:1.0')
+
+
+class RegistryParsingTests(SimpleTestCase):
+    def test_parse_reference(self):
+        self.assertEqual(parse_reference('nginx'), (DOCKER_HUB_REGISTRY, 'library/nginx', 'latest'))
+        self.assertEqual(parse_reference('docker.io/bitnami/redis:7'), (DOCKER_HUB_REGISTRY, 'bitnami/redis', '7'))
+        self.assertEqual(parse_reference('nexus:8082/team/app:1.0'), ('nexus:8082', 'team/app', '1.0'))
+        self.assertEqual(parse_reference(f'localhost:5000/app@{AMD64_DIGEST}'), ('localhost:5000', 'app', AMD64_DIGEST))
+
+    def test_parse_challenge(self):
+        self.assertEqual(
+            parse_challenge('Bearer realm="https://auth.docker.io/token",service="registry.docker.io"'),
+            ('bearer', {'realm': 'https://auth.docker.io/token', 'service': 'registry.docker.io'}))
+        self.assertEqual(parse_challenge('Basic realm="nexus"'), ('basic', {'realm': 'nexus'}))
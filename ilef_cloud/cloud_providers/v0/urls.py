@@ -10,10 +10,11 @@ from cloud_providers.views import (
     ListGCPObjects, DeleteGCPObject, GenerateGCPPresignedUrl,
     ListAzureInstances, CreateAzureInstance, StartAzureInstance, StopAzureInstance, TerminateAzureInstance,
     ListAzureBuckets, CreateAzureBucket, DeleteAzureBucket, UploadFileToAzure, DownloadFileFromAzure,
-    ListAzureObjects, DeleteAzureObject, GenerateAzurePresignedUrl, RetrieveCosts, DeployDockerImage, DeployDockerImageToCluster,
+    ListAzureObjects, DeleteAzureObject, GenerateAzurePresignedUrl, RetrieveCosts, CostAnalytics, DeployDockerImage, DeployDockerImageToCluster,
+    DeploymentJobList, DeploymentJobDetail, DeployDockerImageBatch, DeploymentBatchDetail, DeploymentReadinessStats,
     ListClusters, AzureGetCluster, DeleteCluster, ListAWSClusters, GetAWSCluster, DeleteAWSCluster, CreateAndDeployAWSCluster,
     InstanceView, StartInstance, StopInstance, RestartInstance, TerminateInstance, ListAllObjects,
-    GeneratePresignedUrl, DeleteObject,
+    GeneratePresignedUrl, DeleteObject, DownloadObject, SearchObjects, StorageList, ManagerRegistryMetrics,
 )
 
 urlpatterns = [
@@ -84,9 +85,15 @@ urlpatterns = [
 
     # Cost Management
     path('costs/retrieve/', RetrieveCosts.as_view(), name='retrieve_costs'),
+    path('costs/analytics/', CostAnalytics.as_view(), name='cost_analytics'),
 
     # Docker Deployment
     path('docker/deploy/', DeployDockerImage.as_view(), name='deploy_docker_image'),
+    path('docker/deploy/batch/', DeployDockerImageBatch.as_view(), name='deploy_docker_image_batch'),
+    path('docker/deploy/batch/<uuid:batch_id>/', DeploymentBatchDetail.as_view(), name='deployment_batch_detail'),
+    path('docker/deploy/jobs/', DeploymentJobList.as_view(), name='deployment_job_list'),
+    path('docker/deploy/jobs/<int:job_id>/', DeploymentJobDetail.as_view(), name='deployment_job_detail'),
+    path('docker/deploy/readiness/', DeploymentReadinessStats.as_view(), name='deployment_readiness_stats'),
     path('docker/cluster/deploy/', DeployDockerImageToCluster.as_view(), name='deploy_docker_image_to_cluster'),
     path('docker/clusters/', ListClusters.as_view(), name='list-clusters'),
     path('docker/clusters/node/cordon/', CordonNodeView.as_view(), name='cordon-node'),
@@ -101,9 +108,13 @@ urlpatterns = [
     path('instances/restart/', RestartInstance.as_view(), name='restart_instances'),
     path('instances/terminate/', TerminateInstance.as_view(), name='terminate_instances'),
     path('objects/', ListAllObjects.as_view(), name='list_objects'),
+    path('objects/search/', SearchObjects.as_view(), name='search_objects'),
+    path('storages/', StorageList.as_view(), name='list_storages'),
     path('objects/generate-presigned-url/', GeneratePresignedUrl.as_view(), name='generate-presigned-url'),
     path('objects/upload-file/', UploadFile.as_view(), name='upload-file'),
+    path('objects/download/', DownloadObject.as_view(), name='download-object'),
     path('objects/delete-object/', DeleteObject.as_view(), name='delete-object'),
+    path('managers/metrics/', ManagerRegistryMetrics.as_view(), name='manager-registry-metrics'),
 
 
 
@@ -1,38 +1,98 @@
 from .utils import get_image_name
 from django.utils.crypto import get_random_string
 from datetime import datetime
-from time import sleep
 from django.utils import timezone
-from cloud_providers.services.azure_manager import AzureManager
-from rest_framework.parsers import MultiPartParser, FormParser
+from django.utils.dateparse import parse_date
+from rest_framework.parsers import FormParser
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
 from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.http import HttpResponse, StreamingHttpResponse
+from django.db import transaction
 
 from cloud_providers.services.shared import get_default_os_image, inspect_image
-from .models import KeyPair, CloudProvider, Storage, Instance
-from .serializers import KeyPairSerializer, StorageSerializer
-from cloud_providers.services.aws_manager import AWSManager
-from cloud_providers.services.gcp_manager import GCPManager
-from cloud_providers.services.hetzner_manager import HetznerManager
+from cloud_providers.services.downloads import RangeNotSatisfiable, iter_object, parse_range
+from cloud_providers.services.streaming_upload import StreamingMultiPartParser, stream_uploads, upload_file
+from cloud_providers.services.object_listing import InvalidCursor, list_objects_page
+from cloud_providers.services.object_inventory import index_synced_at, indexed_objects_page, search_objects
+from cloud_providers.services.instance_inventory import cached_instances, instance_costs, inventory_synced_at, refresh_instances
+from cloud_providers.services.jobs import submit_deployment, submit_deployment_batch
+from cloud_providers.services.readiness import readiness_stats
+from cloud_providers.services.costs import cost_coverage, costs_ingested, stored_azure_costs
+from cloud_providers.services.cost_engine import InvalidCostQuery, cost_report, parse_cost_query, to_columnar
+from cloud_providers.services.cost_analytics import analyze_costs
+from .models import KeyPair, CloudProvider, Storage, Instance, DeploymentJob
+from .serializers import KeyPairSerializer, StorageSerializer, DeploymentJobSerializer
+from cloud_providers.services.manager_registry import MANAGER_CLASSES, get_manager, manager_registry
 from ilef_cloud.response_utils import success_response, error_response
 import os
+import uuid
+
+
+def stream_object_response(request, manager, location, file_name):
+    # `location` identifies the object for the manager: (bucket, object) or, on Azure, (account, container, blob)
+    size, content_type = manager.get_object_info(*location)
+    try:
+        byte_range = parse_range(request.headers.get('Range'), size)
+    except RangeNotSatisfiable as e:
+        response = HttpResponse(status=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE)
+        response['Content-Range'] = str(e)
+        return response
+    start, end = byte_range or (0, size - 1)
+
+    response = StreamingHttpResponse(
+        iter_object(lambda chunk_start, chunk_end: manager.read_range(*location, chunk_start, chunk_end), start, end),
+        content_type=content_type or 'application/octet-stream',
+        status=status.HTTP_206_PARTIAL_CONTENT if byte_range else status.HTTP_200_OK
+    )
+    response['Content-Length'] = str(end - start + 1) if size else '0'
+    response['Accept-Ranges'] = 'bytes'
+    response['Content-Disposition'] = f'attachment; filename="{os.path.basename(file_name)}"'
+    if byte_range:
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    return response
+
+
+def inventory_response(request, providers):
+    # Instances come from the inventory kept by `manage.py refresh_instances` while it is fresh enough,
+    # ?fresh=1 (or a missing or stale inventory) lists the providers live and refreshes the inventory.
+    # ?with_cost=1 adds the total ingested cost of every instance.
+    fresh = request.query_params.get('fresh') == '1'
+    with_cost = request.query_params.get('with_cost') == '1'
+    synced_at = None if fresh else inventory_synced_at(providers)
+    if synced_at:
+        age = (timezone.now() - synced_at).total_seconds()
+        if age <= settings.INVENTORY_MAX_AGE:
+            return success_response(
+                cached_instances(providers, with_cost=with_cost),
+                meta={"source": "inventory", "synced_at": synced_at},
+                headers={"X-Inventory-Age": str(int(age))}
+            )
+
+    # Query the providers in parallel, a slow or failing provider only costs its own instances
+    results, report = refresh_instances(providers)
+    if len(providers) == 1 and providers[0] not in results:
+        return error_response(report[providers[0]]['error'])
+
+    instances = []
+    for name in providers:
+        instances.extend(results.get(name, []))
+    if with_cost:
+        costs = instance_costs([str(instance['id']) for instance in instances])
+        instances = [{**instance, "total_cost": costs.get(str(instance['id']))} for instance in instances]
+    return success_response(instances, meta={"source": "live", "providers": report}, headers={"X-Inventory-Age": "0"})
 
 
 class ListEC2Instances(APIView):
     def get(self, request):
-        aws_manager = AWSManager()
-        try:
-            instances = aws_manager.list_instances()
-            return success_response(instances)
-        except Exception as e:
-            return error_response(str(e))
+        return inventory_response(request, ['aws'])
 
 
 class CreateEC2Instance(APIView):
     def post(self, request):
-        aws_manager = AWSManager()
+        aws_manager = get_manager('aws')
         image_id = request.data.get('image_id')
         instance_type = request.data.get('instance_type')
         key_name = request.data.get('key_name')
@@ -68,7 +128,7 @@ class CreateEC2Instance(APIView):
 
 class StartEC2Instance(APIView):
     def post(self, request):
-        aws_manager = AWSManager()
+        aws_manager = get_manager('aws')
         instance_id = request.data.get('instance_id')
         try:
             response = aws_manager.manage_instance('start_instances', instance_id)
@@ -84,7 +144,7 @@ class StartEC2Instance(APIView):
 
 class StopEC2Instance(APIView):
     def post(self, request):
-        aws_manager = AWSManager()
+        aws_manager = get_manager('aws')
         instance_id = request.data.get('instance_id')
         try:
             response = aws_manager.manage_instance('stop_instances', instance_id)
@@ -100,7 +160,7 @@ class StopEC2Instance(APIView):
 
 class TerminateEC2Instance(APIView):
     def post(self, request):
-        aws_manager = AWSManager()
+        aws_manager = get_manager('aws')
         instance_id = request.data.get('instance_id')
         try:
             response = aws_manager.manage_instance('terminate_instances', instance_id)
@@ -116,7 +176,7 @@ class TerminateEC2Instance(APIView):
 
 class ListS3Buckets(APIView):
     def get(self, request):
-        aws_manager = AWSManager()
+        aws_manager = get_manager('aws')
         try:
             buckets = aws_manager.list_buckets()
             # provider = CloudProvider.objects.get(name='aws')
@@ -138,7 +198,7 @@ class ListS3Buckets(APIView):
 
 class CreateS3Bucket(APIView):
     def post(self, request):
-        aws_manager = AWSManager()
+        aws_manager = get_manager('aws')
         bucket_name = request.data.get('bucket_name')
         region = request.data.get('region', 'us-east-1')
         try:
@@ -158,7 +218,7 @@ class CreateS3Bucket(APIView):
 
 class DeleteS3Bucket(APIView):
     def post(self, request):
-        aws_manager = AWSManager()
+        aws_manager = get_manager('aws')
         bucket_name = request.data.get('bucket_name')
         try:
             response = aws_manager.manage_bucket('delete_bucket', bucket_name)
@@ -173,22 +233,21 @@ class DeleteS3Bucket(APIView):
 
 
 class UploadFileToS3(APIView):
-    parser_classes = (MultiPartParser, FormParser)
+    parser_classes = (StreamingMultiPartParser, FormParser)
+
+    @staticmethod
+    def uploader(fields, file_name, content_type):
+        bucket_name = fields.get('bucket_name')
+        object_name = fields.get('object_name', file_name)
+        return lambda file_obj: get_manager('aws').upload_stream(file_obj, bucket_name, object_name)
 
     def post(self, request):
-        aws_manager = AWSManager()
+        # The file is sent to S3 while it is received, the form fields must come before it
+        stream_uploads(request, self.uploader, ('bucket_name', 'object_name'))
         file_obj = request.FILES['file']
-        bucket_name = request.data.get('bucket_name')
-        object_name = request.data.get('object_name', file_obj.name)
-
-        file_path = os.path.join(settings.MEDIA_ROOT, file_obj.name)
-        # with open(file_path, 'wb+') as f:
-        #     for chunk in file_obj.chunks():
-        #         f.write(chunk)
 
         try:
-            response = aws_manager.manage_file('upload_file', file_path, bucket_name, object_name)
-            os.remove(file_path)
+            response = upload_file(file_obj, self.uploader(request.data, file_obj.name, file_obj.content_type))
             return success_response(response, "File uploaded successfully")
         except Exception as e:
             return error_response(str(e))
@@ -196,20 +255,19 @@ class UploadFileToS3(APIView):
 
 class DownloadFileFromS3(APIView):
     def post(self, request):
-        aws_manager = AWSManager()
+        aws_manager = get_manager('aws')
         bucket_name = request.data.get('bucket_name')
         object_name = request.data.get('object_name')
-        file_name = request.data.get('file_name')
+        file_name = request.data.get('file_name') or object_name
         try:
-            response = aws_manager.manage_file('download_file', file_name, bucket_name, object_name)
-            return success_response(response)
+            return stream_object_response(request, aws_manager, (bucket_name, object_name), file_name)
         except Exception as e:
             return error_response(str(e))
 
 
 class ListS3Objects(APIView):
     def get(self, request):
-        aws_manager = AWSManager()
+        aws_manager = get_manager('aws')
         bucket_name = request.query_params.get('bucket_name')
         try:
             objects = aws_manager.list_objects(bucket_name)
@@ -220,7 +278,7 @@ class ListS3Objects(APIView):
 
 class DeleteS3Object(APIView):
     def post(self, request):
-        aws_manager = AWSManager()
+        aws_manager = get_manager('aws')
         bucket_name = request.data.get('bucket_name')
         object_name = request.data.get('object_name')
         try:
@@ -232,7 +290,7 @@ class DeleteS3Object(APIView):
 
 class GeneratePresignedUrl(APIView):
     def post(self, request):
-        aws_manager = AWSManager()
+        aws_manager = get_manager('aws')
         bucket_name = request.data.get('bucket_name')
         object_name = request.data.get('object_name')
         expiration = request.data.get('expiration', 3600)
@@ -245,7 +303,7 @@ class GeneratePresignedUrl(APIView):
 
 class ListKeyPairs(APIView):
     def get(self, request):
-        aws_manager = AWSManager()
+        aws_manager = get_manager('aws')
         try:
             key_pairs = aws_manager.list_key_pairs()
             # provider = CloudProvider.objects.get(name='aws')
@@ -268,7 +326,7 @@ class ListKeyPairs(APIView):
 
 class CreateKeyPair(APIView):
     def post(self, request):
-        aws_manager = AWSManager()
+        aws_manager = get_manager('aws')
         key_name = request.data.get('key_name')
         try:
             key_pair = aws_manager.manage_key_pair('create_key_pair', key_name)
@@ -288,7 +346,7 @@ class CreateKeyPair(APIView):
 
 class DeleteAWSKeyPair(APIView):
     def post(self, request):
-        aws_manager = AWSManager()
+        aws_manager = get_manager('aws')
         key_name = request.data.get('key_name')
         try:
             response = aws_manager.manage_key_pair('delete_key_pair', key_name)
@@ -304,7 +362,7 @@ class DeleteAWSKeyPair(APIView):
 
 class ListAWSClusters(APIView):
     def get(self, request):
-        aws_manager = AWSManager()
+        aws_manager = get_manager('aws')
         try:
             clusters = aws_manager.list_clusters()
             return Response(clusters, status=status.HTTP_200_OK)
@@ -314,7 +372,7 @@ class ListAWSClusters(APIView):
 
 class GetAWSCluster(APIView):
     def get(self, request, cluster_name):
-        aws_manager = AWSManager()
+        aws_manager = get_manager('aws')
         try:
             cluster = aws_manager.get_cluster_details(cluster_name)
             return Response(cluster, status=status.HTTP_200_OK)
@@ -324,7 +382,7 @@ class GetAWSCluster(APIView):
 
 class DeleteAWSCluster(APIView):
     def delete(self, request, cluster_name):
-        aws_manager = AWSManager()
+        aws_manager = get_manager('aws')
         try:
             aws_manager.delete_cluster(cluster_name)
             return Response({"message": "Cluster deleted successfully"}, status=status.HTTP_200_OK)
@@ -334,7 +392,7 @@ class DeleteAWSCluster(APIView):
 
 class CreateAndDeployAWSCluster(APIView):
     def post(self, request):
-        aws_manager = AWSManager()
+        aws_manager = get_manager('aws')
         cluster_name = request.data.get('cluster_name')
         image_name = request.data.get('image_name')
         service_name = request.data.get('service_name')
@@ -357,17 +415,12 @@ class CreateAndDeployAWSCluster(APIView):
 
 class ListHetznerInstances(APIView):
     def get(self, request):
-        hetzner_manager = HetznerManager()
-        try:
-            instances = hetzner_manager.list_instances()
-            return success_response(instances)
-        except Exception as e:
-            return error_response(str(e))
+        return inventory_response(request, ['hetzner'])
 
 
 class CreateHetznerInstance(APIView):
     def post(self, request):
-        hetzner_manager = HetznerManager()
+        hetzner_manager = get_manager('hetzner')
         name = request.data.get('name')
         server_type = request.data.get('server_type')
         image = request.data.get('image')
@@ -407,7 +460,7 @@ class CreateHetznerInstance(APIView):
 
 class StartHetznerInstance(APIView):
     def post(self, request):
-        hetzner_manager = HetznerManager()
+        hetzner_manager = get_manager('hetzner')
         instance_id = request.data.get('instance_id')
 
         try:
@@ -427,7 +480,7 @@ class StartHetznerInstance(APIView):
 
 class StopHetznerInstance(APIView):
     def post(self, request):
-        hetzner_manager = HetznerManager()
+        hetzner_manager = get_manager('hetzner')
         instance_id = request.data.get('instance_id')
 
         try:
@@ -447,7 +500,7 @@ class StopHetznerInstance(APIView):
 
 class TerminateHetznerInstance(APIView):
     def post(self, request):
-        hetzner_manager = HetznerManager()
+        hetzner_manager = get_manager('hetzner')
         instance_id = request.data.get('instance_id')
 
         try:
@@ -464,7 +517,7 @@ class TerminateHetznerInstance(APIView):
 
 class ListHetznerKeyPairs(APIView):
     def get(self, request):
-        hetzner_manager = HetznerManager()
+        hetzner_manager = get_manager('hetzner')
         try:
             key_pairs = hetzner_manager.list_key_pairs()
             return success_response(key_pairs)
@@ -474,7 +527,7 @@ class ListHetznerKeyPairs(APIView):
 
 class CreateHetznerKeyPair(APIView):
     def post(self, request):
-        hetzner_manager = HetznerManager()
+        hetzner_manager = get_manager('hetzner')
         name = request.data.get('name')
         public_key = request.data.get('public_key')
 
@@ -497,7 +550,7 @@ class CreateHetznerKeyPair(APIView):
 
 class DeleteHetznerKeyPair(APIView):
     def post(self, request):
-        hetzner_manager = HetznerManager()
+        hetzner_manager = get_manager('hetzner')
         key_id = request.data.get('key_id')
 
         try:
@@ -512,27 +565,8 @@ class DeleteHetznerKeyPair(APIView):
 
 class ListGCPInstances(APIView):
     def get(self, request):
-        gcp_manager = GCPManager()
-        try:
-            instances = gcp_manager.list_instances()
-            # Convert instances to a JSON serializable format
-            serialized_instances = [self.serialize_instance(instance) for instance in instances]
-            return success_response(serialized_instances)
-        except Exception as e:
-            return error_response(str(e))
-
-    def serialize_instance(self, instance):
-        # Extract relevant fields from the instance object
-        return {
-            "id": instance.id,
-            "name": instance.name,
-            "status": instance.status,
-            "creation_timestamp": instance.creation_timestamp,
-            "zone": instance.zone,
-            "machine_type": instance.machine_type,
-            "network_ip": instance.network_interfaces[0].network_i_p if instance.network_interfaces else None,
-            "external_ip": instance.network_interfaces[0].access_configs[0].nat_i_p if instance.network_interfaces and instance.network_interfaces[0].access_configs else None,
-        }
+        # GCPManager.list_instances already serializes the instances
+        return inventory_response(request, ['gcp'])
 
 
 class CreateGCPInstance(APIView):
@@ -555,7 +589,7 @@ class CreateGCPInstance(APIView):
         image_project = os_image.get('image_project')
 
         try:
-            manager = GCPManager()
+            manager = get_manager('gcp')
             instance = manager.create_instance(
                 server_name, server_type, f"projects/{image_project}/global/images/family/{image_family}",
                 ssh_key_path)
@@ -579,7 +613,7 @@ class CreateGCPInstance(APIView):
 
 class StartGCPInstance(APIView):
     def post(self, request):
-        gcp_manager = GCPManager()
+        gcp_manager = get_manager('gcp')
         instance_name = request.data.get('instance_name')
 
         try:
@@ -591,7 +625,7 @@ class StartGCPInstance(APIView):
 
 class StopGCPInstance(APIView):
     def post(self, request):
-        gcp_manager = GCPManager()
+        gcp_manager = get_manager('gcp')
         instance_name = request.data.get('instance_name')
 
         try:
@@ -603,7 +637,7 @@ class StopGCPInstance(APIView):
 
 class TerminateGCPInstance(APIView):
     def post(self, request):
-        gcp_manager = GCPManager()
+        gcp_manager = get_manager('gcp')
         instance_name = request.data.get('instance_name')
 
         try:
@@ -615,7 +649,7 @@ class TerminateGCPInstance(APIView):
 
 class ListGCPBuckets(APIView):
     def get(self, request):
-        gcp_manager = GCPManager()
+        gcp_manager = get_manager('gcp')
         try:
             buckets = gcp_manager.list_buckets()
             buckets_info = [{
@@ -634,7 +668,7 @@ class ListGCPBuckets(APIView):
 
 class CreateGCPBucket(APIView):
     def post(self, request):
-        gcp_manager = GCPManager()
+        gcp_manager = get_manager('gcp')
         bucket_name = request.data.get('bucket_name')
         location = request.data.get('location', 'US')
 
@@ -659,7 +693,7 @@ class CreateGCPBucket(APIView):
 
 class DeleteGCPBucket(APIView):
     def post(self, request):
-        gcp_manager = GCPManager()
+        gcp_manager = get_manager('gcp')
         bucket_name = request.data.get('bucket_name')
         try:
             response = gcp_manager.manage_bucket('delete_bucket', bucket_name)
@@ -669,21 +703,22 @@ class DeleteGCPBucket(APIView):
 
 
 class UploadFileToGCP(APIView):
-    parser_classes = (MultiPartParser, FormParser)
+    parser_classes = (StreamingMultiPartParser, FormParser)
+
+    @staticmethod
+    def uploader(fields, file_name, content_type):
+        bucket_name = fields.get('bucket_name')
+        object_name = fields.get('object_name', file_name)
+        return lambda file_obj: get_manager('gcp').upload_stream(
+            file_obj, bucket_name, object_name, file_obj.size, content_type)
 
     def post(self, request):
-        gcp_manager = GCPManager()
+        # The file is sent to GCS while it is received, the form fields must come before it
+        stream_uploads(request, self.uploader, ('bucket_name', 'object_name'))
         file_obj = request.FILES['file']
-        bucket_name = request.data.get('bucket_name')
-        object_name = request.data.get('object_name', file_obj.name)
 
-        file_path = os.path.join(settings.MEDIA_ROOT, file_obj.name)
-        with open(file_path, 'wb+') as f:
-            for chunk in file_obj.chunks():
-                f.write(chunk)
         try:
-            response = gcp_manager.manage_file('upload_from_filename', file_path, bucket_name, object_name)
-            # os.remove(file_path)
+            response = upload_file(file_obj, self.uploader(request.data, file_obj.name, file_obj.content_type))
             return success_response(response, "File uploaded successfully")
         except Exception as e:
             return error_response(str(e))
@@ -691,22 +726,19 @@ class UploadFileToGCP(APIView):
 
 class DownloadFileFromGCP(APIView):
     def post(self, request):
-        gcp_manager = GCPManager()
+        gcp_manager = get_manager('gcp')
         bucket_name = request.data.get('bucket_name')
         object_name = request.data.get('object_name')
-        file_name = request.data.get('file_name')
-
-        file_path = os.path.join(settings.MEDIA_ROOT, file_name)
+        file_name = request.data.get('file_name') or object_name
         try:
-            response = gcp_manager.manage_file('download_to_filename', file_path, bucket_name, object_name)
-            return success_response(response)
+            return stream_object_response(request, gcp_manager, (bucket_name, object_name), file_name)
         except Exception as e:
             return error_response(str(e))
 
 
 class ListGCPObjects(APIView):
     def get(self, request):
-        gcp_manager = GCPManager()
+        gcp_manager = get_manager('gcp')
         bucket_name = request.query_params.get('bucket_name')
 
         if not bucket_name:
@@ -734,7 +766,7 @@ class ListGCPObjects(APIView):
 
 class DeleteGCPObject(APIView):
     def post(self, request):
-        gcp_manager = GCPManager()
+        gcp_manager = get_manager('gcp')
         bucket_name = request.data.get('bucket_name')
         object_name = request.data.get('object_name')
 
@@ -752,7 +784,7 @@ class DeleteGCPObject(APIView):
 
 class GenerateGCPPresignedUrl(APIView):
     def post(self, request):
-        gcp_manager = GCPManager()
+        gcp_manager = get_manager('gcp')
         bucket_name = request.data.get('bucket_name')
         object_name = request.data.get('object_name')
         expiration = request.data.get('expiration', 3600)
@@ -771,38 +803,59 @@ class GenerateGCPPresignedUrl(APIView):
 
 class RetrieveCosts(APIView):
     def get(self, request):
-        start_date = request.query_params.get('start_date')
-        end_date = request.query_params.get('end_date')
+        # Cross-provider costs, ?providers=aws,gcp &group_by=provider,service &bucket=day|week|month|total
+        # &layout=columnar. Served from the ingested costs, ?fresh=1 asks every provider live and in parallel.
+        current_date = datetime.now()
+        params = {
+            'start_date': current_date.replace(day=1).strftime("%Y-%m-%d"),
+            'end_date': current_date.strftime("%Y-%m-%d"),
+            **request.query_params.dict()
+        }
+        try:
+            providers, start_date, end_date, group_by, bucket = parse_cost_query(params)
+        except InvalidCostQuery as e:
+            return error_response(str(e), status.HTTP_400_BAD_REQUEST)
 
-        aws_manager = AWSManager()
-        gcp_manager = GCPManager()
+        try:
+            rows, meta = cost_report(providers, start_date, end_date, group_by, bucket, fresh=params.get('fresh') == '1')
+        except Exception as e:
+            return error_response(str(e))
+        if params.get('layout') == 'columnar':
+            return success_response(to_columnar(rows, group_by, bucket), meta=meta)
+        return success_response(rows, meta=meta)
 
-        costs = []
 
+class CostAnalytics(APIView):
+    def get(self, request):
+        # Rollups, moving average, anomalies, month-end forecast and instance totals over the ingested costs,
+        # ?start_date &end_date (the last 12 months by default) &providers &currency &window=7 (moving average)
+        # &baseline=28 &threshold=3 (a day is an anomaly beyond `threshold` deviations from the `baseline` days before)
+        current_date = datetime.now()
+        params = {
+            'start_date': current_date.replace(year=current_date.year - 1, day=1).strftime("%Y-%m-%d"),
+            'end_date': current_date.strftime("%Y-%m-%d"),
+            **request.query_params.dict()
+        }
         try:
-            aws_costs = aws_manager.get_cost_and_usage(start_date, end_date)
-            for cost in aws_costs:
-                costs.append({
-                    'provider': 'AWS',
-                    'amount': cost['Total']['UnblendedCost']['Amount'],
-                    'currency': cost['Total']['UnblendedCost']['Unit'],
-                    'date': cost['TimePeriod']['End'],
-                    'resource_type': 'Compute'
-                })
-
-            gcp_costs = gcp_manager.get_cost_and_usage(start_date, end_date)
-            for cost in gcp_costs:
-                costs.append({
-                    'provider': 'GCP',
-                    'amount': cost['Total']['Amount'],
-                    'currency': cost['Total']['Unit'],
-                    'date': cost['Date'],
-                    'resource_type': 'Compute'
-                })
+            providers, start_date, end_date, _, _ = parse_cost_query(params)
+            window = int(params.get('window', 7))
+            baseline = int(params.get('baseline', 28))
+            threshold = float(params.get('threshold', 3))
+            if window < 2 or baseline < 2 or threshold <= 0:
+                raise ValueError
+        except InvalidCostQuery as e:
+            return error_response(str(e), status.HTTP_400_BAD_REQUEST)
+        except ValueError:
+            return error_response("window and baseline must be integers of at least 2, threshold a positive number",
+                                  status.HTTP_400_BAD_REQUEST)
 
-            return success_response(costs)
+        try:
+            analytics = analyze_costs(providers, start_date, end_date, currency=params.get('currency'),
+                                      window=window, baseline=baseline, threshold=threshold)
         except Exception as e:
             return error_response(str(e))
+        return success_response(analytics, meta={
+            "ingested": costs_ingested(providers, start_date), "covered_from": cost_coverage(providers)})
 
 
 class DeployDockerImage(APIView):
@@ -827,85 +880,150 @@ class DeployDockerImage(APIView):
         print(f'server_name: {server_name}')
         # ssh_key_id = request.data.get('ssh_key_id', settings.SSH_PUBLIC_KEY)
         ssh_key_id = request.data.get('ssh_key_id')
-        ssh_private_key = settings.SSH_PRIVATE_KEY
-        ports = request.data.get('ports', inspect_image(image))
+        # The image is inspected by the worker when no ports are given
+        ports = request.data.get('ports')
         if not all([provider, server_name, server_type, os_image, image]):
             return error_response("Missing required parameters", status.HTTP_400_BAD_REQUEST)
+        if provider not in MANAGER_CLASSES:
+            return error_response("Invalid provider", status.HTTP_400_BAD_REQUEST)
 
         try:
-            if provider == 'hetzner':
-                if not ssh_key_id:
-                    ssh_key_id = settings.HETZNER_DEFAULT_KEY_NAME
-                manager = HetznerManager()
-                response = manager.create_docker_image_server(server_name, server_type, image, os_image, ssh_key_id)
-            elif provider == 'gcp':
-                if not ssh_key_id:
-                    ssh_key_id = settings.SSH_PUBLIC_KEY
-                image_family = os_image.get('image_family')
-                image_project = os_image.get('image_project')
-                manager = GCPManager()
-                source_image = f"projects/{image_project}/global/images/family/{image_family}"
-                response = manager.create_docker_image_server(
-                    server_name, server_type, image, source_image)
-            elif provider == 'aws':
-                if not ssh_key_id:
-                    ssh_key_id = settings.AWS_DEFAULT_KEY_NAME
-                image_id = os_image.get('image_id')
-                manager = AWSManager()
-                response = manager.create_docker_image_server(
-                    instance_name=server_name,
-                    image_id=image_id,
-                    instance_type=server_type,
-                    key_name=ssh_key_id,
+            with transaction.atomic():
+                job = DeploymentJob.objects.create(
+                    provider=provider,
+                    server_name=server_name,
                     image=image,
-                    ssh_private_key=settings.AWS_SSH_PRIVATE_KEY
+                    parameters={
+                        'server_type': server_type,
+                        'os_image': os_image,
+                        'ssh_key_id': ssh_key_id,
+                        'ports': ports
+                    }
                 )
-            elif provider == 'azure':
-                if not ssh_key_id:
-                    ssh_key_id = settings.SSH_PUBLIC_KEY
-                image_reference = {
-                    'publisher': os_image.get('publisher', 'Canonical'),
-                    'offer': os_image.get('offer', '0001-com-ubuntu-server-jammy'),
-                    'sku': os_image.get('sku', '22_04-lts'),
-                    'version': os_image.get('version', 'latest')
-                }
-                manager = AzureManager()
-                vnet_name = 'my-vnet'
-                subnet_name = 'my-subnet'
-                nsg_name = 'my-nsg'
-                nic_name = f'{server_name}-nic'
-                public_ip_name = f'{server_name}-ip'
+                submit_deployment(job)
+            return success_response(DeploymentJobSerializer(job).data, "Deployment queued", status.HTTP_202_ACCEPTED)
+        except Exception as e:
+            return error_response(str(e))
 
-                # Create network resources
-                manager.create_virtual_network(vnet_name, subnet_name)
-                manager.create_network_security_group(nsg_name, ports+[22, 80])
-                manager.associate_nsg_with_subnet(vnet_name, subnet_name, nsg_name)
-                manager.create_network_interface(nic_name, vnet_name, subnet_name, public_ip_name)
 
-                # Create VM with the specified image
-                manager.create_instance(server_name, server_type, image_reference, None, ssh_key_id, nic_name=nic_name)
-
-                # Get public IP address of the VM
-                public_ip_info = manager.network_client.public_ip_addresses.get(
-                    manager.resource_group, public_ip_name)
-                public_ip_address = public_ip_info.ip_address
-                sleep(2)
-                # Install Docker and run the container
-                manager.install_docker(public_ip_address, ssh_private_key)
-                response = manager.run_docker_container(
-                    public_ip_address, image, ports, ssh_private_key)
-            else:
-                return error_response("Invalid provider", status.HTTP_400_BAD_REQUEST)
+class DeployDockerImageBatch(APIView):
+    def post(self, request):
+        image = request.data.get('image')
+        targets = request.data.get('targets')
+        ports = request.data.get('ports')
+        if not image or not targets:
+            return error_response("Missing required parameters", status.HTTP_400_BAD_REQUEST)
+        if not isinstance(targets, list) or not all(isinstance(target, dict) for target in targets):
+            return error_response("targets must be a list of objects", status.HTTP_400_BAD_REQUEST)
+
+        # Counts are checked and summed before any host is built
+        counts = []
+        for target in targets:
+            provider = target.get('provider')
+            if provider not in MANAGER_CLASSES:
+                return error_response(f"Invalid provider: {provider}", status.HTTP_400_BAD_REQUEST)
+            try:
+                count = int(target.get('count', 1))
+            except (TypeError, ValueError):
+                count = 0
+            if count < 1:
+                return error_response("count must be a positive integer", status.HTTP_400_BAD_REQUEST)
+            counts.append(count)
+        if sum(counts) > settings.DEPLOYMENT_BATCH_MAX_HOSTS:
+            return error_response(
+                f"A batch is limited to {settings.DEPLOYMENT_BATCH_MAX_HOSTS} hosts", status.HTTP_400_BAD_REQUEST)
+
+        hosts = []
+        for target, count in zip(targets, counts):
+            provider = target['provider']
+            server_type = target.get('server_type') or DeployDockerImage.DEFAULT_PROVIDER_SERVER_TYPE[provider]
+            os_image = target.get('os_image', get_default_os_image(provider))
+            base_name = target.get('server_name')
+            for index in range(count):
+                if base_name:
+                    server_name = base_name if count == 1 else f'{base_name}-{index + 1}'
+                else:
+                    server_name = get_image_name(image, provider=provider)
+                hosts.append({
+                    'provider': provider,
+                    'server_name': server_name,
+                    'parameters': {
+                        'server_type': server_type,
+                        'os_image': os_image,
+                        'ssh_key_id': target.get('ssh_key_id'),
+                        'ports': ports
+                    }
+                })
 
-            return success_response(response, "Docker image deployed successfully", status.HTTP_200_OK)
+        try:
+            batch_id = uuid.uuid4()
+            with transaction.atomic():
+                jobs = [
+                    DeploymentJob.objects.create(batch_id=batch_id, image=image, **host)
+                    for host in hosts
+                ]
+                submit_deployment_batch(jobs, image)
+            data = {
+                "batch_id": str(batch_id),
+                "jobs": DeploymentJobSerializer(jobs, many=True).data
+            }
+            return success_response(data, "Batch deployment queued", status.HTTP_202_ACCEPTED)
         except Exception as e:
             return error_response(str(e))
 
 
+class DeploymentBatchDetail(APIView):
+    def get(self, request, batch_id):
+        jobs = DeploymentJob.objects.filter(batch_id=batch_id).order_by('id')
+        if not jobs:
+            return error_response("Deployment batch not found", status.HTTP_404_NOT_FOUND)
+        states = {}
+        for job in jobs:
+            states[job.state] = states.get(job.state, 0) + 1
+        data = {
+            "batch_id": str(batch_id),
+            "total": len(jobs),
+            "states": states,
+            "done": states.get('queued', 0) + states.get('running', 0) == 0,
+            "jobs": DeploymentJobSerializer(jobs, many=True).data
+        }
+        return success_response(data)
+
+
+class DeploymentJobList(APIView):
+    def get(self, request):
+        jobs = DeploymentJob.objects.order_by('-created_at')
+        state = request.query_params.get('state')
+        if state:
+            jobs = jobs.filter(state=state)
+        try:
+            limit = int(request.query_params.get('limit', settings.DEPLOYMENT_JOB_LIST_LIMIT))
+        except ValueError:
+            return error_response("limit must be an integer", status.HTTP_400_BAD_REQUEST)
+        limit = max(1, min(limit, settings.DEPLOYMENT_JOB_LIST_MAX_LIMIT))
+        return success_response(DeploymentJobSerializer(jobs[:limit], many=True).data)
+
+
+class DeploymentJobDetail(APIView):
+    def get(self, request, job_id):
+        try:
+            job = DeploymentJob.objects.get(pk=job_id)
+        except DeploymentJob.DoesNotExist:
+            return error_response("Deployment job not found", status.HTTP_404_NOT_FOUND)
+        return success_response(DeploymentJobSerializer(job).data)
+
+
+class DeploymentReadinessStats(APIView):
+    def get(self, request):
+        return success_response(readiness_stats(request.query_params.get('provider')))
+
+
 class DeployDockerImageToCluster(APIView):
     def post(self, request):
         provider = request.data.get('provider', 'azure')
         docker_image = request.data.get('image')
+        if not docker_image:
+            return Response({"error": "Missing required parameters"}, status=status.HTTP_400_BAD_REQUEST)
         docker_image_name = docker_image.split('/')[-1].replace('/', '-').replace(':', '-').replace('_', '-')
         cluster_name = request.data.get('cluster_name', f'cluster-{docker_image_name}-{get_random_string(4)}')
         service_name = request.data.get('service_name')
@@ -913,22 +1031,23 @@ class DeployDockerImageToCluster(APIView):
             service_name = f'service'
         deployment_yaml = request.data.get('deployment_yaml')
         service_yaml = request.data.get('service_yaml')
-        ports = inspect_image(image=docker_image)
         if not all([provider, cluster_name, docker_image, service_name]):
             return Response({"error": "Missing required parameters"}, status=status.HTTP_400_BAD_REQUEST)
 
         try:
             if provider == 'hetzner':
-                manager = HetznerManager()
+                manager = get_manager('hetzner')
                 response = manager.deploy_to_cluster(cluster_name, deployment_yaml, service_yaml)
             elif provider == 'gcp':
-                manager = GCPManager()
+                manager = get_manager('gcp')
                 response = manager.deploy_to_cluster(cluster_name, deployment_yaml, service_yaml)
             elif provider == 'aws':
-                manager = AWSManager()
+                manager = get_manager('aws')
                 response = manager.deploy_to_cluster(cluster_name, deployment_yaml, service_yaml)
             elif provider == 'azure':
-                manager = AzureManager()
+                manager = get_manager('azure')
+                # Only the AKS deployment needs the exposed ports
+                ports = request.data.get('ports') or inspect_image(image=docker_image)
                 response = manager.deploy_and_create_cluster(
                     cluster_name=cluster_name,
                     image_name=docker_image,
@@ -945,12 +1064,7 @@ class DeployDockerImageToCluster(APIView):
 
 class ListAzureInstances(APIView):
     def get(self, request):
-        azure_manager = AzureManager()
-        try:
-            instances = azure_manager.list_instances()
-            return success_response(instances)
-        except Exception as e:
-            return error_response(str(e))
+        return inventory_response(request, ['azure'])
 
 
 class CreateAzureInstance(APIView):
@@ -977,7 +1091,7 @@ class CreateAzureInstance(APIView):
             return error_response("Either admin_password or ssh_key_path must be provided", status.HTTP_400_BAD_REQUEST)
 
         try:
-            azure_manager = AzureManager()
+            azure_manager = get_manager('azure')
 
             # Create network resources
             azure_manager.create_virtual_network(vnet_name, subnet_name)
@@ -996,7 +1110,7 @@ class CreateAzureInstance(APIView):
 
 class StartAzureInstance(APIView):
     def post(self, request):
-        azure_manager = AzureManager()
+        azure_manager = get_manager('azure')
         vm_name = request.data.get('instance_name')
 
         try:
@@ -1013,7 +1127,7 @@ class StartAzureInstance(APIView):
 
 class StopAzureInstance(APIView):
     def post(self, request):
-        azure_manager = AzureManager()
+        azure_manager = get_manager('azure')
         vm_name = request.data.get('instance_name')
 
         try:
@@ -1030,7 +1144,7 @@ class StopAzureInstance(APIView):
 
 class TerminateAzureInstance(APIView):
     def post(self, request):
-        azure_manager = AzureManager()
+        azure_manager = get_manager('azure')
         vm_name = request.data.get('instance_name')
 
         try:
@@ -1047,7 +1161,7 @@ class TerminateAzureInstance(APIView):
 
 class ListAzureBuckets(APIView):
     def get(self, request):
-        azure_manager = AzureManager()
+        azure_manager = get_manager('azure')
         try:
             buckets = azure_manager.list_buckets()
             return success_response(buckets)
@@ -1057,7 +1171,7 @@ class ListAzureBuckets(APIView):
 
 class CreateAzureBucket(APIView):
     def post(self, request):
-        azure_manager = AzureManager()
+        azure_manager = get_manager('azure')
         account_name = request.data.get('account_name')
         location = request.data.get('location', 'eastus')
 
@@ -1070,7 +1184,7 @@ class CreateAzureBucket(APIView):
 
 class DeleteAzureBucket(APIView):
     def post(self, request):
-        azure_manager = AzureManager()
+        azure_manager = get_manager('azure')
         account_name = request.data.get('account_name')
 
         try:
@@ -1086,27 +1200,28 @@ class DeleteAzureBucket(APIView):
 
 
 class UploadFileToAzure(APIView):
-    parser_classes = (MultiPartParser, FormParser)
+    parser_classes = (StreamingMultiPartParser, FormParser)
+
+    @staticmethod
+    def uploader(fields, file_name, content_type):
+        account_name = fields.get('account_name')
+        container_name = fields.get('container_name', f"file-{file_name.replace('.', '-').replace(' ', '-').lower()}")
+        blob_name = fields.get('blob_name', file_name)
+        if not container_name:
+            return None
+        return lambda file_obj: get_manager('azure').upload_stream(file_obj, account_name, container_name, blob_name)
 
     def post(self, request):
-        azure_manager = AzureManager()
-        account_name = request.data.get('account_name')
+        # The file is sent to Azure while it is received, the form fields must come before it
+        stream_uploads(request, self.uploader, ('account_name', 'container_name', 'blob_name'))
         file_obj = request.FILES['file']
-        container_name = request.data.get('container_name', f"file-{file_obj.name.replace('.', '-').replace(' ', '-').lower()}")
-        print(f'container_name:  {container_name}')
-        blob_name = request.data.get('blob_name', file_obj.name)
+        upload = self.uploader(request.data, file_obj.name, file_obj.content_type)
 
-        if not container_name:
+        if upload is None:
             return error_response("Missing required parameter: container_name", status.HTTP_400_BAD_REQUEST)
 
-        file_path = os.path.join(settings.MEDIA_ROOT, file_obj.name)
-        with open(file_path, 'wb+') as f:
-            for chunk in file_obj.chunks():
-                f.write(chunk)
-
         try:
-            response = azure_manager.manage_file('upload_blob', account_name, container_name, file_path, blob_name)
-            # os.remove(file_path)  # Optionally remove the file after upload
+            response = upload_file(file_obj, upload)
             return success_response(response, "File uploaded successfully", status.HTTP_200_OK)
         except Exception as e:
             return error_response(str(e))
@@ -1114,23 +1229,21 @@ class UploadFileToAzure(APIView):
 
 class DownloadFileFromAzure(APIView):
     def post(self, request):
-        azure_manager = AzureManager()
+        azure_manager = get_manager('azure')
         account_name = request.data.get('account_name')
         file_name = request.data.get('file_name')
         blob_name = request.data.get('blob_name', file_name)
         container_name = request.data.get('container_name', f"file-{file_name.replace('.', '-').replace(' ', '-').lower()}")
 
-        file_path = os.path.join(settings.MEDIA_ROOT, file_name)
         try:
-            response = azure_manager.manage_file('download_blob', account_name, container_name, file_path, blob_name)
-            return success_response(response)
+            return stream_object_response(request, azure_manager, (account_name, container_name, blob_name), file_name)
         except Exception as e:
             return error_response(str(e))
 
 
 class ListAzureObjects(APIView):
     def get(self, request):
-        azure_manager = AzureManager()
+        azure_manager = get_manager('azure')
         account_name = request.query_params.get('account_name')
         container_name = request.query_params.get('container_name')
 
@@ -1143,7 +1256,7 @@ class ListAzureObjects(APIView):
 
 class DeleteAzureObject(APIView):
     def post(self, request):
-        azure_manager = AzureManager()
+        azure_manager = get_manager('azure')
         account_name = request.data.get('account_name')
         container_name = request.data.get('container_name')
         blob_name = request.data.get('blob_name')
@@ -1157,7 +1270,7 @@ class DeleteAzureObject(APIView):
 
 class GenerateAzurePresignedUrl(APIView):
     def post(self, request):
-        azure_manager = AzureManager()
+        azure_manager = get_manager('azure')
         account_name = request.data.get('account_name')
         container_name = request.data.get('container_name')
         blob_name = request.data.get('blob_name')
@@ -1175,7 +1288,7 @@ class GenerateAzurePresignedUrl(APIView):
 
 class RetrieveAzureCosts(APIView):
     def get(self, request):
-        azure_manager = AzureManager()
+        azure_manager = get_manager('azure')
         current_date = datetime.now()
         first_date_of_month = current_date.replace(day=1)
         formatted_end_date = current_date.strftime("%Y-%m-%d")
@@ -1187,6 +1300,11 @@ class RetrieveAzureCosts(APIView):
             return error_response("Missing required parameters: start_date and end_date", status.HTTP_400_BAD_REQUEST)
 
         try:
+            # The stored costs only answer when they go back to start_date
+            stored_from = parse_date(start_date)
+            if request.query_params.get('fresh') != '1' and stored_from and costs_ingested(['azure'], stored_from):
+                response = stored_azure_costs(start_date, end_date, 'ResourceGroup')
+                return success_response(response, "Cost data retrieved successfully", meta={"source": "warehouse"})
             response = azure_manager.get_cost_and_usage(start_date, end_date)
             return success_response(response, "Cost data retrieved successfully", status.HTTP_200_OK)
         except Exception as e:
@@ -1195,7 +1313,7 @@ class RetrieveAzureCosts(APIView):
 
 class RetrieveAzureCostsByService(APIView):
     def get(self, request):
-        azure_manager = AzureManager()
+        azure_manager = get_manager('azure')
         current_date = datetime.now()
         first_date_of_month = current_date.replace(day=1)
         formatted_end_date = current_date.strftime("%Y-%m-%d")
@@ -1207,6 +1325,11 @@ class RetrieveAzureCostsByService(APIView):
             return error_response("Missing required parameters: start_date and end_date", status.HTTP_400_BAD_REQUEST)
 
         try:
+            # The stored costs only answer when they go back to start_date
+            stored_from = parse_date(start_date)
+            if request.query_params.get('fresh') != '1' and stored_from and costs_ingested(['azure'], stored_from):
+                response = stored_azure_costs(start_date, end_date, 'ServiceName')
+                return success_response(response, "Cost data by service retrieved successfully", meta={"source": "warehouse"})
             response = azure_manager.get_cost_by_service(start_date, end_date)
             return success_response(response, "Cost data by service retrieved successfully", status.HTTP_200_OK)
         except Exception as e:
@@ -1215,7 +1338,7 @@ class RetrieveAzureCostsByService(APIView):
 
 class ListClusters(APIView):
     def get(self, request):
-        azure_manager = AzureManager()
+        azure_manager = get_manager('azure')
         try:
             clusters = azure_manager.list_clusters()
             return Response(clusters, status=status.HTTP_200_OK)
@@ -1232,7 +1355,7 @@ class CordonNodeView(APIView):
             return Response({"error": "Missing required parameters"}, status=status.HTTP_400_BAD_REQUEST)
 
         try:
-            manager = AzureManager()
+            manager = get_manager('azure')
             manager.cordon_node(cluster_name, node_name)
             return Response({"message": "Node cordoned successfully"}, status=status.HTTP_200_OK)
         except Exception as e:
@@ -1248,7 +1371,7 @@ class UncordonNodeView(APIView):
             return Response({"error": "Missing required parameters"}, status=status.HTTP_400_BAD_REQUEST)
 
         try:
-            manager = AzureManager()
+            manager = get_manager('azure')
             manager.uncordon_node(cluster_name, node_name)
             return Response({"message": "Node uncordoned successfully"}, status=status.HTTP_200_OK)
         except Exception as e:
@@ -1264,7 +1387,7 @@ class DrainNodeView(APIView):
             return Response({"error": "Missing required parameters"}, status=status.HTTP_400_BAD_REQUEST)
 
         try:
-            manager = AzureManager()
+            manager = get_manager('azure')
             manager.drain_node(cluster_name, node_name)
             return Response({"message": "Node drained successfully"}, status=status.HTTP_200_OK)
         except Exception as e:
@@ -1273,7 +1396,7 @@ class DrainNodeView(APIView):
 
 class AzureGetCluster(APIView):
     def get(self, request, cluster_name):
-        azure_manager = AzureManager()
+        azure_manager = get_manager('azure')
         try:
             cluster = azure_manager.get_cluster(cluster_name)
             return Response(cluster, status=status.HTTP_200_OK)
@@ -1283,7 +1406,7 @@ class AzureGetCluster(APIView):
 
 class DeleteCluster(APIView):
     def delete(self, request, cluster_name):
-        azure_manager = AzureManager()
+        azure_manager = get_manager('azure')
         try:
             azure_manager.delete_cluster(cluster_name)
             return Response({"message": "Cluster deleted successfully"}, status=status.HTTP_200_OK)
@@ -1305,7 +1428,7 @@ class InstanceView(APIView):
 
         try:
             if provider == 'aws':
-                manager = AWSManager()
+                manager = get_manager('aws')
                 if not key_pair_name:
                     key_pair_name = settings.AWS_DEFAULT_KEY_NAME
                     print(f"key_pair_name: {key_pair_name}")
@@ -1313,7 +1436,7 @@ class InstanceView(APIView):
             elif provider == 'azure':
                 if not key_pair_name:
                     key_pair_name = settings.SSH_PUBLIC_KEY
-                manager = AzureManager()
+                manager = get_manager('azure')
                 image_reference = {
                     'publisher': 'Canonical',
                     'offer': '0001-com-ubuntu-server-jammy',
@@ -1335,7 +1458,7 @@ class InstanceView(APIView):
             elif provider == 'gcp':
                 if not key_pair_name:
                     key_pair_name = settings.SSH_PUBLIC_KEY
-                manager = GCPManager()
+                manager = get_manager('gcp')
                 image_family = 'debian-11'
                 image_project = 'debian-cloud'
                 source_image = f"projects/{image_project}/global/images/family/{image_family}"
@@ -1345,7 +1468,7 @@ class InstanceView(APIView):
                 if not key_pair_name:
                     key_pair_name = settings.HETZNER_DEFAULT_KEY_NAME
                 print(f"key_pair_name: {key_pair_name}")
-                manager = HetznerManager()
+                manager = get_manager('hetzner')
                 response = manager.create_instance(instance_name, instance_type, 'ubuntu-20.04', key_pair_name)
             else:
                 return error_response("Invalid provider", status.HTTP_400_BAD_REQUEST)
@@ -1356,34 +1479,10 @@ class InstanceView(APIView):
 
     def get(self, request):
         provider = request.query_params.get('provider')
-
-        instances = []
-
-        try:
-            if provider in ['aws', None]:
-                manager = AWSManager()
-                aws_instances = manager.list_instances()
-                # serialized_aws_instances = [manager.serialize_instance(instance) for instance in aws_instances]
-                instances.extend(aws_instances)
-
-            if provider in ['azure', None]:
-                manager = AzureManager()
-                azure_instances = manager.list_instances()
-                instances.extend(azure_instances)
-
-            if provider in ['gcp', None]:
-                manager = GCPManager()
-                gcp_instances = manager.list_instances()
-                instances.extend(gcp_instances)
-
-            if provider in ['hetzner', None]:
-                manager = HetznerManager()
-                hetzner_instances = manager.list_instances()
-                instances.extend(hetzner_instances)
-
-            return success_response(instances)
-        except Exception as e:
-            return error_response(str(e))
+        if provider and provider not in MANAGER_CLASSES:
+            return error_response("Invalid provider", status.HTTP_400_BAD_REQUEST)
+        providers = [provider] if provider else list(MANAGER_CLASSES)
+        return inventory_response(request, providers)
 
 
 class StartInstance(APIView):
@@ -1392,16 +1491,16 @@ class StartInstance(APIView):
         provider = instance.get('provider')
         try:
             if provider == 'aws':
-                manager = AWSManager()
+                manager = get_manager('aws')
                 response = manager.manage_instance('start_instances', instance['id'])
             elif provider == 'azure':
-                manager = AzureManager()
+                manager = get_manager('azure')
                 response = manager.manage_instance('start', vm_name=instance['name'])
             elif provider == 'gcp':
-                manager = GCPManager()
+                manager = get_manager('gcp')
                 response = manager.manage_instance('start', instance['name'])
             elif provider == 'hetzner':
-                manager = HetznerManager()
+                manager = get_manager('hetzner')
                 response = manager.manage_instance('poweron', instance['id'])
             else:
                 return error_response("Invalid provider", status.HTTP_400_BAD_REQUEST)
@@ -1418,16 +1517,16 @@ class StopInstance(APIView):
         print(instance)
         try:
             if provider == 'aws':
-                manager = AWSManager()
+                manager = get_manager('aws')
                 response = manager.manage_instance('stop_instances', instance['id'])
             elif provider == 'azure':
-                manager = AzureManager()
+                manager = get_manager('azure')
                 response = manager.manage_instance('power_off', vm_name=instance['name'])
             elif provider == 'gcp':
-                manager = GCPManager()
+                manager = get_manager('gcp')
                 response = manager.manage_instance('stop', instance['name'])
             elif provider == 'hetzner':
-                manager = HetznerManager()
+                manager = get_manager('hetzner')
                 response = manager.manage_instance('shutdown', instance['id'])
             else:
                 return error_response("Invalid provider", status.HTTP_400_BAD_REQUEST)
@@ -1443,18 +1542,18 @@ class RestartInstance(APIView):
         provider = instance.get('provider')
         try:
             if provider == 'aws':
-                manager = AWSManager()
+                manager = get_manager('aws')
                 response = manager.manage_instance('reboot_instances', instance['id'])
             elif provider == 'azure':
-                manager = AzureManager()
+                manager = get_manager('azure')
                 response = manager.manage_instance('restart', instance['name'])
                 # response = manager.manage_instance('start', instance['name'])
             elif provider == 'gcp':
-                manager = GCPManager()
+                manager = get_manager('gcp')
                 response = manager.manage_instance('stop', instance['name'])
                 response = manager.manage_instance('start', instance['name'])
             elif provider == 'hetzner':
-                manager = HetznerManager()
+                manager = get_manager('hetzner')
                 response = manager.manage_instance('reboot', instance['id'])
             else:
                 return error_response("Invalid provider", status.HTTP_400_BAD_REQUEST)
@@ -1470,16 +1569,16 @@ class TerminateInstance(APIView):
         provider = instance.get('provider')
         try:
             if provider == 'aws':
-                manager = AWSManager()
+                manager = get_manager('aws')
                 response = manager.manage_instance('terminate_instances', instance['id'])
             elif provider == 'azure':
-                manager = AzureManager()
+                manager = get_manager('azure')
                 response = manager.delete_instance(vm_name=instance['name'])
             elif provider == 'gcp':
-                manager = GCPManager()
+                manager = get_manager('gcp')
                 response = manager.terminate_instance(instance['name'])
             elif provider == 'hetzner':
-                manager = HetznerManager()
+                manager = get_manager('hetzner')
                 response = manager.delete_instance(instance['id'])
             else:
                 return error_response("Invalid provider", status.HTTP_400_BAD_REQUEST)
@@ -1492,65 +1591,78 @@ class TerminateInstance(APIView):
 class ListAllObjects(APIView):
     def get(self, request):
         providers = request.query_params.get('providers', 'aws,azure,gcp,hetzner').split(',')
+        prefix = request.query_params.get('prefix') or None
+        cursor = request.query_params.get('cursor') or None
+        fresh = request.query_params.get('fresh') == '1'
+        try:
+            page_size = int(request.query_params.get('page_size', settings.OBJECT_LIST_PAGE_SIZE))
+        except ValueError:
+            return error_response("page_size must be an integer", status.HTTP_400_BAD_REQUEST)
+        page_size = max(1, min(page_size, settings.OBJECT_LIST_MAX_PAGE_SIZE))
+
+        try:
+            # Served from the object inventory while every requested provider has a sync younger than
+            # OBJECT_INDEX_MAX_AGE, ?fresh=1 lists the clouds live
+            synced_at = None if fresh else index_synced_at(providers)
+            age = (timezone.now() - synced_at).total_seconds() if synced_at else None
+            if age is not None and age <= settings.OBJECT_INDEX_MAX_AGE:
+                objects, next_cursor = indexed_objects_page(providers, page_size, prefix, cursor)
+                meta = {"source": "index", "synced_at": synced_at, "age": int(age)}
+            else:
+                objects, next_cursor = list_objects_page(providers, page_size, prefix, cursor)
+                meta = {"source": "live", "synced_at": synced_at, "age": 0}
+            return success_response(objects, meta={"page_size": page_size, "next_cursor": next_cursor, **meta})
+        except InvalidCursor as e:
+            return error_response(str(e), status.HTTP_400_BAD_REQUEST)
+        except Exception as e:
+            return error_response(str(e))
 
-        objects = []
-
-        try:
-            for provider in providers:
-                if provider == 'aws':
-                    manager = AWSManager()
-                    buckets = manager.list_buckets()
-                    for bucket in buckets:
-                        bucket_name = bucket['Name']
-                        aws_objects = manager.list_objects(bucket_name)
-                        for obj in aws_objects:
-                            objects.append({
-                                "id": obj['ETag'].strip('"'),
-                                "provider": "aws",
-                                "bucket": bucket_name,
-                                "name": obj['Key'],
-                                "size": obj['Size'],
-                                "last_modified": obj['LastModified'],
-                                "created_at": obj['LastModified']
-                            })
-
-                if provider == 'azure':
-                    manager = AzureManager()
-                    azure_buckets = manager.list_buckets()
-                    for bucket in azure_buckets:
-                        bucket_name = bucket['name']
-                        azure_objects = manager.list_objects(bucket_name)
-                        for obj in azure_objects:
-                            objects.append({
-                                "id": obj['name'],  # Assuming name as unique identifier
-                                "provider": "azure",
-                                "bucket": bucket_name,
-                                "name": obj['name'],
-                                "size": obj['size'],
-                                "last_modified": obj['last_modified'],
-                                "created_at": obj['last_modified']
-                            })
-
-                if provider == 'gcp':
-                    manager = GCPManager()
-                    gcp_buckets = manager.list_buckets()
-                    for bucket in gcp_buckets:
-                        bucket_name = bucket.name
-                        gcp_objects = manager.list_objects(bucket_name)
-                        for obj in gcp_objects:
-                            objects.append({
-                                "id": obj.etag,  # Assuming id as unique identifier
-                                "provider": "gcp",
-                                "bucket": bucket_name,
-                                "name": obj.name,
-                                "size": obj.size,
-                                "last_modified": obj.updated,
-                                "created_at": obj.time_created
-                            })
 
-            return success_response(objects)
+class SearchObjects(APIView):
+    def get(self, request):
+        params = request.query_params
+        try:
+            page = max(int(params.get('page', 1)), 1)
+            page_size = max(1, min(int(params.get('page_size', settings.OBJECT_LIST_PAGE_SIZE)), settings.OBJECT_LIST_MAX_PAGE_SIZE))
+            min_size = int(params['min_size']) if params.get('min_size') else None
+            max_size = int(params['max_size']) if params.get('max_size') else None
+            providers = params['providers'].split(',') if params.get('providers') else None
+            objects, total = search_objects(
+                query=params.get('q'),
+                providers=providers,
+                bucket_name=params.get('bucket_name'),
+                min_size=min_size,
+                max_size=max_size,
+                modified_after=params.get('modified_after'),
+                modified_before=params.get('modified_before'),
+                ordering=params.get('ordering', 'name'),
+                page=page,
+                page_size=page_size
+            )
+        except (ValueError, ValidationError) as e:
+            return error_response(str(e), status.HTTP_400_BAD_REQUEST)
         except Exception as e:
             return error_response(str(e))
+        return success_response(objects, meta={"page": page, "page_size": page_size, "total": total})
+
+
+class StorageList(APIView):
+    def get(self, request):
+        # Buckets of the object inventory with their ingested costs, ?providers=aws,gcp &start_date &end_date
+        # bound the costs summed (all of them by default)
+        params = request.query_params
+        try:
+            start_date = parse_date(params['start_date']) if params.get('start_date') else None
+            end_date = parse_date(params['end_date']) if params.get('end_date') else None
+        except ValueError:
+            start_date = end_date = None
+        if (params.get('start_date') and not start_date) or (params.get('end_date') and not end_date):
+            return error_response("start_date and end_date must be YYYY-MM-DD dates", status.HTTP_400_BAD_REQUEST)
+
+        storages = Storage.objects.with_total_cost(start_date, end_date).order_by('provider__name', 'storage_id')
+        if params.get('providers'):
+            storages = storages.filter(provider__name__in=params['providers'].split(','))
+        return success_response(StorageSerializer(storages, many=True).data)
 
 
 class GeneratePresignedUrl(APIView):
@@ -1568,13 +1680,13 @@ class GeneratePresignedUrl(APIView):
 
         try:
             if provider == 'aws':
-                manager = AWSManager()
+                manager = get_manager('aws')
                 url = manager.generate_presigned_url(bucket_name, object_name, expiration)
             elif provider == 'azure':
-                manager = AzureManager()
+                manager = get_manager('azure')
                 url = manager.generate_presigned_url(bucket_name, container_name, object_name, expiration)
             elif provider == 'gcp':
-                manager = GCPManager()
+                manager = get_manager('gcp')
                 url = manager.generate_presigned_url(bucket_name, object_name, expiration)
             else:
                 return error_response("Invalid provider", status.HTTP_400_BAD_REQUEST)
@@ -1584,51 +1696,75 @@ class GeneratePresignedUrl(APIView):
             return error_response(str(e))
 
 
+class DownloadObject(APIView):
+    def get(self, request):
+        provider = request.query_params.get('provider')
+        bucket_name = request.query_params.get('bucket_name')
+        object_name = request.query_params.get('object_name')
+
+        if not provider or not bucket_name or not object_name:
+            return error_response("Missing required parameters", status.HTTP_400_BAD_REQUEST)
+
+        try:
+            if provider in ('aws', 'gcp'):
+                location = (bucket_name, object_name)
+            elif provider == 'azure':
+                container_name = request.query_params.get('container_name', f"file-{object_name.replace('.', '-').replace(' ', '-').replace('_', '-').lower()}")
+                location = (bucket_name, container_name, object_name)
+            else:
+                return error_response("Invalid provider", status.HTTP_400_BAD_REQUEST)
+            return stream_object_response(request, get_manager(provider), location, object_name)
+        except Exception as e:
+            return error_response(str(e))
+
+
 class UploadFile(APIView):
-    parser_classes = (MultiPartParser, FormParser)
+    parser_classes = (StreamingMultiPartParser, FormParser)
 
     DEFAULT_BUCKETS = {
         'aws': settings.AWS_DEFAULT_BUCKET,
         'azure': settings.AZURE_DEFAULT_BUCKET,
         'gcp': settings.GCP_DEFAULT_BUCKET
     }
+    DESTINATION_FIELDS = ('provider', 'bucket_name', 'object_name', 'container_name')
+
+    @classmethod
+    def uploader(cls, fields, file_name, content_type):
+        provider = fields.get('provider')
+        bucket_name = fields.get('bucket_name') or cls.DEFAULT_BUCKETS.get(provider)
+        object_name = fields.get('object_name', "").lower()
+        if not bucket_name:
+            return None
+        if provider == 'aws':
+            object_name = object_name or file_name
+            return lambda file_obj: get_manager('aws').upload_stream(file_obj, bucket_name, object_name)
+        if provider == 'azure':
+            container_name = fields.get('container_name', f"file-{file_name.replace('.', '-').replace(' ', '-').replace('_', '-').lower()}")
+            blob_name = object_name or file_name.lower().replace('_', '')
+            return lambda file_obj: get_manager('azure').upload_stream(file_obj, bucket_name, container_name, blob_name)
+        if provider == 'gcp':
+            object_name = object_name or file_name.lower()
+            return lambda file_obj: get_manager('gcp').upload_stream(
+                file_obj, bucket_name, object_name, file_obj.size, content_type)
+        return None
 
     def post(self, request):
+        # The request file is streamed to the provider part by part while it is received, nothing is written to
+        # MEDIA_ROOT or /tmp. The form fields must come before the file.
+        stream_uploads(request, self.uploader, self.DESTINATION_FIELDS)
         provider = request.data.get('provider')
-        bucket_name = request.data.get('bucket_name')
-        if not bucket_name:
-            bucket_name = self.DEFAULT_BUCKETS[provider]
-        object_name = request.data.get('object_name', "").lower()
         file_obj = request.FILES.get('file')
 
-        if not provider or not bucket_name or not file_obj:
+        if not provider or not file_obj:
             return error_response("Missing required parameters: provider, bucket_name, or file", status.HTTP_400_BAD_REQUEST)
-
-        file_path = os.path.join(settings.MEDIA_ROOT, file_obj.name)
-        with open(file_path, 'wb+') as f:
-            for chunk in file_obj.chunks():
-                f.write(chunk)
-
-        try:
-            if provider == 'aws':
-                manager = AWSManager()
-                object_name = object_name or file_obj.name
-                response = manager.manage_file('upload_file', file_path, bucket_name, object_name)
-            elif provider == 'azure':
-                manager = AzureManager()
-                container_name = request.data.get('container_name', f"file-{file_obj.name.replace('.', '-').replace(' ', '-').replace('_', '-').lower()}")
-                blob_name = object_name or file_obj.name.lower().replace('_', '')
-                print(f'container_name => {container_name}')
-                print(f'blob_name => {blob_name}')
-                response = manager.manage_file('upload_blob', bucket_name, container_name, file_path, blob_name)
-            elif provider == 'gcp':
-                manager = GCPManager()
-                object_name = object_name or file_obj.name.lower()
-                response = manager.manage_file('upload_from_filename', file_path, bucket_name, object_name)
-            else:
+        upload = self.uploader(request.data, file_obj.name, file_obj.content_type)
+        if upload is None:
+            if provider not in self.DEFAULT_BUCKETS:
                 return error_response("Invalid provider", status.HTTP_400_BAD_REQUEST)
+            return error_response("Missing required parameters: provider, bucket_name, or file", status.HTTP_400_BAD_REQUEST)
 
-            os.remove(file_path)  # Optionally remove the file after upload
+        try:
+            response = upload_file(file_obj, upload)
             return success_response(response, "File uploaded successfully")
         except Exception as e:
             return error_response(str(e))
@@ -1649,13 +1785,13 @@ class DeleteObject(APIView):
 
         try:
             if provider == 'aws':
-                manager = AWSManager()
+                manager = get_manager('aws')
                 response = manager.manage_file('delete_object', None, bucket_name, object_name)
             elif provider == 'azure':
-                manager = AzureManager()
+                manager = get_manager('azure')
                 response = manager.delete_object(bucket_name, container_name, object_name)
             elif provider == 'gcp':
-                manager = GCPManager()
+                manager = get_manager('gcp')
                 response = manager.delete_object(bucket_name, object_name)
             else:
                 return error_response("Invalid provider", status.HTTP_400_BAD_REQUEST)
@@ -1663,3 +1799,8 @@ class DeleteObject(APIView):
             return success_response(response, "File deleted successfully")
         except Exception as e:
             return error_response(str(e))
+
+
+class ManagerRegistryMetrics(APIView):
+    def get(self, request):
+        return success_response(manager_registry.metrics())
@@ -49,6 +49,13 @@ def store_secret(request):
 
         vault_service.store_secret(updated_secret_data, path)
 
+        # Apply rotated values to the running worker: the cloud managers notice the credential change
+        # and rebuild their SDK clients on their next use
+        if path == settings.VAULT_SECRET_PATH:
+            for key, value in new_secret_data.items():
+                if hasattr(settings, key):
+                    setattr(settings, key, value)
+
         return Response({'message': 'Secret stored successfully.'}, status=status.HTTP_201_CREATED)
     except Exception as e:
         return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
@@ -2,8 +2,11 @@ from rest_framework.response import Response
 from rest_framework import status
 
 
-def success_response(data, message="Success", status_code=status.HTTP_200_OK):
-    return Response({"message": message, "data": data}, status=status_code)
+def success_response(data, message="Success", status_code=status.HTTP_200_OK, meta=None, headers=None):
+    body = {"message": message, "data": data}
+    if meta is not None:
+        body["meta"] = meta
+    return Response(body, status=status_code, headers=headers)
 
 
 def error_response(error_message, status_code=status.HTTP_200_OK):
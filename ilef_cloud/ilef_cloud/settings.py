@@ -234,6 +234,7 @@ AWS_DEFAULT_BUCKET = vault_secrets.get('AWS_DEFAULT_BUCKET')
 GCP_PROJECT_ID = vault_secrets.get('GCP_PROJECT_ID')
 GCP_ZONE = vault_secrets.get('GCP_ZONE')
 GCP_BILLING_ACCOUNT_ID = vault_secrets.get('GCP_BILLING_ACCOUNT_ID')
+GCP_BILLING_EXPORT_TABLE = vault_secrets.get('GCP_BILLING_EXPORT_TABLE')  # project.dataset.table of the billing export
 GCP_DEFAULT_BUCKET = vault_secrets.get('GCP_DEFAULT_BUCKET')
 GCP_SERVICE_ACCOUNT_INFO = vault_secrets.get('GCP_SERVICE_ACCOUNT_INFO')
 
@@ -246,3 +247,53 @@ NEXUS_REGISTRY_DEFAULT_PORT = vault_secrets.get('NEXUS_REGISTRY_DEFAULT_PORT')
 NEXUS_REGISTRY_DOCKER_PORT = vault_secrets.get('NEXUS_REGISTRY_DOCKER_PORT')
 NEXUS_REGISTRY_USERNAME = vault_secrets.get('NEXUS_REGISTRY_USERNAME')
 NEXUS_REGISTRY_PASSWORD = vault_secrets.get('NEXUS_REGISTRY_PASSWORD')
+
+# Cloud API tuning
+CLOUD_FAN_OUT_TIMEOUT = 30  # seconds a single provider may take when several providers are queried at once
+CLOUD_API_CONCURRENCY = 10  # concurrent calls a single listing may issue against one provider API
+SSH_CONNECT_TIMEOUT = 10  # seconds to open and authenticate an SSH connection
+SSH_POOL_IDLE_TIMEOUT = 120  # seconds an unused pooled SSH connection is kept open
+DEPLOYMENT_WORKERS = 4  # docker deployments provisioned concurrently by the background job pool
+DEPLOYMENT_BATCH_MAX_HOSTS = 50  # hosts a single batch deploy may request
+IMAGE_INSPECTION_TTL = 3600  # seconds an inspected image is trusted before its digest is checked again
+DOCKER_REGISTRY_TIMEOUT = 10  # seconds for a single Registry v2 API call
+UPLOAD_PART_SIZE = 8 * 1024 * 1024  # bytes per multipart part / block / resumable chunk when streaming uploads
+UPLOAD_CONCURRENCY = 4  # parts of one upload sent in parallel, memory use is about part size x (concurrency + 1)
+UPLOAD_STREAMS = 16  # uploads fed from their request at the same time, further ones wait for a free slot
+UPLOAD_STREAM_BUFFER = 8 * 1024 * 1024  # bytes received but not yet read by the upload before the request waits
+DOWNLOAD_CHUNK_SIZE = 8 * 1024 * 1024  # bytes fetched by each ranged GET when streaming a download
+DOWNLOAD_CONCURRENCY = 4  # ranged GETs of one download in flight, memory use is about chunk size x (concurrency + 1)
+OBJECT_LIST_PAGE_SIZE = 100  # objects per ListAllObjects page when the request gives no page_size
+OBJECT_LIST_MAX_PAGE_SIZE = 1000
+OBJECT_SYNC_BATCH_SIZE = 1000  # objects compared and upserted per query by the object inventory sync
+OBJECT_INDEX_MAX_AGE = 3600  # seconds the object index is served after the oldest provider sync before listings go live
+INVENTORY_MAX_AGE = 300  # seconds the instance inventory is served before list endpoints go live again
+OPERATION_POLL_INITIAL_INTERVAL = 1  # seconds before the first poll of a cloud operation
+OPERATION_POLL_MAX_INTERVAL = 15  # backoff ceiling between two polls of the same operation
+OPERATION_POLL_BACKOFF = 1.5  # growth factor of the poll interval
+OPERATION_TIMEOUT = 1800  # seconds before a tracked operation is given up
+OPERATION_POLL_WORKERS = 4  # batches of operation polls (one adapter call each) running at once
+CLUSTER_POLL_MAX_INTERVAL = 30  # cluster and node group creation take minutes, no need to poll them faster
+GCP_NETWORK_READY_TIMEOUT = 60  # seconds to wait for a new GCP instance to get its network interfaces
+HETZNER_API_TIMEOUT = 30  # seconds per Hetzner API request
+HETZNER_API_MAX_RETRIES = 4  # retries of rate limited requests and of idempotent requests hitting server errors
+HETZNER_API_BACKOFF = 0.5  # first retry delay in seconds, doubled on each further retry
+HETZNER_API_MAX_BACKOFF = 60  # longest wait before a retry, including waits for the rate limit to reset
+HETZNER_API_PAGE_SIZE = 50  # items per page on Hetzner list endpoints (the API maximum)
+TCP_PROBE_TIMEOUT = 1  # seconds a round of TCP probes waits for the handshakes of the probed hosts
+TCP_PROBE_INTERVAL = 0.25  # first delay between two TCP probes of a host, grows with the operation backoff
+TCP_PROBE_MAX_INTERVAL = 5
+TCP_PROBE_JITTER = 0.2  # +/- fraction applied to every probe delay so hosts of a batch are not probed in lockstep
+SSH_READY_TIMEOUT = 300  # seconds a new server gets to accept SSH logins
+SSH_LOGIN_ATTEMPTS = 3  # logins tried once the port is open, sshd may accept before the key is installed
+SSH_LOGIN_RETRY_INTERVAL = 2  # seconds before the second login, doubled afterwards
+COST_INGEST_LOOKBACK_DAYS = 90  # days of cost history loaded by the first ingestion of a provider
+COST_FINAL_AFTER_DAYS = 3  # providers revise recent days, older days are marked final and not fetched again
+COST_INGEST_BATCH_SIZE = 1000  # cost lines per INSERT
+AZURE_TOKEN_REFRESH_MARGIN = 300  # seconds before expiry at which the cached Azure management token is renewed
+AZURE_COST_API_TIMEOUT = 60  # seconds per Cost Management query page
+AZURE_COST_API_MAX_RETRIES = 5  # retries of throttled (429) and failed (5xx) cost queries
+AZURE_COST_API_BACKOFF = 2  # first retry delay in seconds when Azure does not say how long to wait
+AZURE_COST_API_MAX_BACKOFF = 120
+DEPLOYMENT_JOB_LIST_LIMIT = 50  # jobs listed when the request gives no limit
+DEPLOYMENT_JOB_LIST_MAX_LIMIT = 500